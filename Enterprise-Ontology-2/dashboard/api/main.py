@@ -2,20 +2,42 @@
 Nexus Dashboard API - Local Development Version
 """
 
+import sys
+import time
 from datetime import datetime
 from pathlib import Path
+from typing import List, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+# Make the ontology engine importable (engine/src uses flat imports)
+ENGINE_SRC = Path(__file__).resolve().parents[2] / "engine" / "src"
+if str(ENGINE_SRC) not in sys.path:
+    sys.path.insert(0, str(ENGINE_SRC))
+
+from performance_monitor import PerformanceMonitor, render_monitors
+from rewriter_context import get_default_context
+from serialization import dumps
+
+from services.live_stream import LiveBroadcaster
+from services.metrics_service import MAX_PAGE_SIZE, MetricsService
+from static_files import CachedStaticFiles
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson when installed (stdlib otherwise)."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
 
-from services.metrics_service import MetricsService
 
 app = FastAPI(
     title="Nexus Dashboard API",
     description="Local development API with mock data",
     version="1.0.0",
+    default_response_class=FastJSONResponse,
 )
 
 # CORS - allow all origins for local dev
@@ -27,19 +49,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize metrics service
+class SelectiveGZipMiddleware:
+    """GZipMiddleware that passes the excluded paths through untouched."""
+
+    def __init__(self, app, exclude_paths=(), **options):
+        self.app = app
+        self.gzip = GZipMiddleware(app, **options)
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
+
+
+# Compress JSON responses (and static files without a precompressed variant)
+# above ~1 KB; small responses aren't worth the CPU or the gzip overhead.
+# /api/stream is excluded: older Starlette releases buffer and compress
+# text/event-stream, which would hold back server-sent events.
+GZIP_MINIMUM_SIZE = 1024
+GZIP_EXCLUDE_PATHS = ("/api/stream",)
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE,
+                   exclude_paths=GZIP_EXCLUDE_PATHS)
+
+# Initialize metrics service (NEXUS_DATA_SOURCE selects mock, jsonl:<path> or sqlite:<path>)
 metrics_service = MetricsService()
 
+# Live telemetry deltas for /api/stream (set NEXUS_TELEMETRY_PATH to the rewriter's log)
+live_broadcaster = LiveBroadcaster()
+
+# Request latency monitor (set NEXUS_METRICS_DIR to aggregate across workers)
+api_monitor = PerformanceMonitor(name="api")
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Record latency of API routes under 'api.<route>'."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = getattr(route, "path", "")
+    if path.startswith("/api/"):
+        operation = "api." + path[len("/api/"):].strip("/").replace("/", ".")
+        api_monitor.record(operation, (time.perf_counter() - start) * 1000)
+    return response
+
 # Static files (for production build)
 STATIC_DIR = Path(__file__).parent / "static"
 INDEX_HTML = STATIC_DIR / "index.html"
+frontend = CachedStaticFiles(directory=str(STATIC_DIR), html=True) if STATIC_DIR.exists() else None
 
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Serve React app or API info."""
     if INDEX_HTML.exists():
-        return FileResponse(str(INDEX_HTML))
+        return await frontend.get_response("index.html", request.scope)
     return {
         "name": "Nexus Dashboard API",
         "version": "1.0.0",
@@ -49,71 +115,124 @@ async def root():
     }
 
 
+# Handlers that read the data source, rollups or metric snapshots are plain
+# `def`: FastAPI runs them in its thread pool, so SQLite and file I/O never
+# block the event loop (or the /api/stream clients)
 @app.get("/api/status")
-async def get_status():
+def get_status():
     """API status endpoint."""
     return {
         "status": "running",
         "mode": "local",
-        "dataSource": "mock_data",
+        "dataSource": metrics_service.source.name,
         "lastSync": datetime.now().isoformat(),
-        "cache_stats": {
-            "rewriter_records": 100,
-            "adoption_records": 200,
-            "feedback_records": 60,
-        }
+        "cache_stats": metrics_service.record_counts(),
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+def get_prometheus_metrics():
+    """Prometheus scrape endpoint (API request and query rewriter latency)."""
+    return PlainTextResponse(
+        render_monitors([api_monitor, get_default_context().monitor]),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+def _split_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """fields=summary,topEntities -> ['summary', 'topEntities']"""
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+
 @app.get("/api/rewriter")
-async def get_rewriter_metrics():
+def get_rewriter_metrics(
+    start: Optional[datetime] = Query(None, description="Only queries at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only queries before this time"),
+    entity: Optional[str] = Query(None, description="Only queries that matched this entity"),
+    fields: Optional[str] = Query(None, description="Comma-separated sections to return"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size for query lists"),
+    rewrittenCursor: Optional[str] = Query(None, description="rewrittenQueries nextCursor"),
+    zeroResultCursor: Optional[str] = Query(None, description="zeroResultQueries nextCursor"),
+):
     """Get query rewriter metrics."""
-    metrics = metrics_service.calculate_rewriter_metrics()
+    try:
+        metrics = metrics_service.calculate_rewriter_metrics(
+            start=start, end=end, entity=entity, fields=_split_fields(fields),
+            limit=limit, rewritten_cursor=rewrittenCursor, zero_result_cursor=zeroResultCursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     metrics["metadata"] = {
         "generatedAt": datetime.now().isoformat(),
         "lastSync": datetime.now().isoformat(),
-        "dataSource": "mock_data",
-        "recordCount": 100,
+        "dataSource": metrics_service.source.name,
+        "recordCount": metrics_service.record_counts()["rewriter_records"],
     }
     return metrics
 
 
+@app.get("/api/stream")
+async def stream_live_metrics():
+    """Server-sent events: query counts, latency histogram deltas and zero-result queries."""
+    return StreamingResponse(
+        live_broadcaster.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/adoption")
-async def get_adoption_metrics():
+def get_adoption_metrics():
     """Get adoption metrics."""
     metrics = metrics_service.calculate_adoption_metrics()
     metrics["metadata"] = {
         "generatedAt": datetime.now().isoformat(),
         "lastSync": datetime.now().isoformat(),
-        "dataSource": "mock_data",
-        "recordCount": 200,
+        "dataSource": metrics_service.source.name,
+        "recordCount": metrics_service.record_counts()["adoption_records"],
     }
     return metrics
 
 
 @app.get("/api/feedback")
-async def get_feedback_metrics():
+def get_feedback_metrics(
+    start: Optional[datetime] = Query(None, description="Only feedback at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only feedback before this time"),
+    feedbackType: Optional[str] = Query(None, description="thumbsUp or thumbsDown (feedback items)"),
+    category: Optional[str] = Query(None, description="Only this category (feedback items)"),
+    fields: Optional[str] = Query(None, description="Comma-separated sections to return"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size for feedback items"),
+    cursor: Optional[str] = Query(None, description="nextCursor from the previous page"),
+):
     """Get feedback metrics."""
-    metrics = metrics_service.calculate_feedback_metrics()
+    try:
+        metrics = metrics_service.calculate_feedback_metrics(
+            start=start, end=end, feedback_type=feedbackType, category=category,
+            fields=_split_fields(fields), limit=limit, cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     metrics["metadata"] = {
         "generatedAt": datetime.now().isoformat(),
         "lastSync": datetime.now().isoformat(),
-        "dataSource": "mock_data",
-        "recordCount": 60,
+        "dataSource": metrics_service.source.name,
+        "recordCount": metrics_service.record_counts()["feedback_records"],
     }
     return metrics
 
 
 # Serve static files if they exist
-if STATIC_DIR.exists():
-    app.mount("/", StaticFiles(directory=str(STATIC_DIR), html=True), name="frontend")
+if frontend is not None:
+    app.mount("/", frontend, name="frontend")
 
 
 @app.get("/{full_path:path}", include_in_schema=False)
-async def spa_fallback(full_path: str):
+async def spa_fallback(full_path: str, request: Request):
     """SPA fallback for React Router."""
     if INDEX_HTML.exists():
-        return FileResponse(str(INDEX_HTML))
+        return await frontend.get_response("index.html", request.scope)
     return {"error": "Not Found"}
 
 
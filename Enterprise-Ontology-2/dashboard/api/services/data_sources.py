@@ -0,0 +1,473 @@
+"""
+Data sources for MetricsService.
+
+A DataSource returns documents in the production (Cosmos) shapes used by
+scripts/transform_to_dashboard.py:
+
+- rewriter docs: id, conversation, conversation_id, timestamp, _ts,
+  resultCount, query_rewrite_telemetry {matched_entities, expansion_count,
+  expanded_query, rewrite_time_ms}, evaluation_scores
+- adoption docs: id, user_id, user_name, timestamp, _ts, llm_telemetry
+- feedback docs: id, conversationId, userName, timestamp, _ts,
+  feedbackType, comment, category
+
+Implementations:
+- MockDataSource: the generated lists in data.py.
+- TelemetryJsonlSource: TelemetryLogger JSONL logs (base file and
+  per-process shards), read incrementally with TelemetryTailer offsets so
+  a request only parses lines appended since the last one. Telemetry has
+  no retrieval results, so these docs carry no resultCount.
+- SqliteDataSource: an embedded SQLite document store with indexes on
+  _ts, user_id, resultCount and matched entity. Window and entity filters
+  are index range scans instead of Python filters.
+
+create_data_source() picks one from a spec such as "mock",
+"jsonl:engine/outputs/telemetry_logs.jsonl" or "sqlite:data/dashboard.db"
+(NEXUS_DATA_SOURCE).
+
+Usage:
+    source = create_data_source("sqlite:data/dashboard.db")
+    source.load_from(MockDataSource())       # or ingest real documents
+    docs = source.rewriter_docs(start=week_ago, entity="DFW10")
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+ENGINE_SRC = Path(__file__).resolve().parents[3] / "engine" / "src"
+if str(ENGINE_SRC) not in sys.path:
+    sys.path.insert(0, str(ENGINE_SRC))
+
+Doc = Dict[str, Any]
+
+
+def _ts_range(start: Optional[datetime], end: Optional[datetime]):
+    return (start.timestamp() if start else float("-inf"),
+            end.timestamp() if end else float("inf"))
+
+
+def _filter_docs(docs: List[Doc], start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 since_ts: Optional[int] = None, entity: Optional[str] = None,
+                 zero_results: bool = False) -> List[Doc]:
+    """Python-side filtering shared by the in-memory sources."""
+    start_ts, end_ts = _ts_range(start, end)
+    if since_ts:
+        start_ts = max(start_ts, since_ts)
+    result = []
+    for d in docs:
+        ts = d.get("_ts", 0)
+        if not start_ts <= ts < end_ts:
+            continue
+        if entity and entity not in d.get("query_rewrite_telemetry", {}).get("matched_entities", []):
+            continue
+        if zero_results and d.get("resultCount") != 0:
+            continue
+        result.append(d)
+    return result
+
+
+def _filter_feedback(docs: List[Doc], since_ts=None, end_ts=None, feedback_type=None,
+                     category=None) -> List[Doc]:
+    """Python-side feedback filtering shared by the in-memory sources."""
+    if not (since_ts or end_ts or feedback_type or category):
+        return docs
+    start_ts = since_ts or float("-inf")
+    end_ts = end_ts or float("inf")
+    return [d for d in docs
+            if start_ts <= d.get("_ts", 0) < end_ts
+            and (not feedback_type or d.get("feedbackType", "unknown") == feedback_type)
+            and (not category or d.get("category", "Uncategorized") == category)]
+
+
+class DataSource(ABC):
+    """Read interface used by MetricsService."""
+
+    name = "abstract"
+
+    @abstractmethod
+    def rewriter_docs(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      entity: Optional[str] = None, zero_results: bool = False) -> List[Doc]:
+        """Rewriter docs with start <= _ts < end, newest first.
+
+        entity keeps docs that matched it; zero_results keeps resultCount == 0.
+        """
+
+    @abstractmethod
+    def adoption_docs(self, since_ts: Optional[int] = None) -> List[Doc]:
+        """Production query docs with _ts >= since_ts, newest first."""
+
+    @abstractmethod
+    def feedback_docs(self, since_ts: Optional[float] = None, end_ts: Optional[float] = None,
+                      feedback_type: Optional[str] = None,
+                      category: Optional[str] = None) -> List[Doc]:
+        """Feedback docs with since_ts <= _ts < end_ts, newest first.
+
+        feedback_type / category keep docs whose feedbackType / category
+        (default "unknown" / "Uncategorized") equals the value.
+        """
+
+    @abstractmethod
+    def record_counts(self) -> Dict[str, int]:
+        """Number of rewriter, adoption and feedback records."""
+
+
+class MockDataSource(DataSource):
+    """Generated mock data (data.py)."""
+
+    name = "mock_data"
+
+    def __init__(self):
+        from data import MOCK_REWRITER_DATA, MOCK_ADOPTION_DATA, MOCK_FEEDBACK_DATA
+        self._rewriter = MOCK_REWRITER_DATA
+        self._adoption = MOCK_ADOPTION_DATA
+        self._feedback = MOCK_FEEDBACK_DATA
+
+    def rewriter_docs(self, start=None, end=None, entity=None, zero_results=False):
+        if not (start or end or entity or zero_results):
+            return self._rewriter
+        return _filter_docs(self._rewriter, start, end, entity=entity, zero_results=zero_results)
+
+    def adoption_docs(self, since_ts=None):
+        return _filter_docs(self._adoption, since_ts=since_ts) if since_ts else self._adoption
+
+    def feedback_docs(self, since_ts=None, end_ts=None, feedback_type=None, category=None):
+        return _filter_feedback(self._feedback, since_ts, end_ts, feedback_type, category)
+
+    def record_counts(self):
+        return {
+            "rewriter_records": len(self._rewriter),
+            "adoption_records": len(self._adoption),
+            "feedback_records": len(self._feedback),
+        }
+
+
+def telemetry_to_docs(record: Doc):
+    """(rewriter doc, adoption doc) for one TelemetryLogger record."""
+    try:
+        ts = int(datetime.fromisoformat(record["timestamp"]).timestamp())
+    except (KeyError, ValueError):
+        ts = 0
+    matched = record.get("matched_entities") or []
+    terms = [t["term"] for t in record.get("expanded_terms") or []]
+    query = record.get("original_query", "")
+    rewriter = {
+        "id": record.get("query_id"),
+        "conversation": query,
+        "conversation_id": record.get("query_id"),
+        "timestamp": record.get("timestamp", ""),
+        "_ts": ts,
+        "query_rewrite_telemetry": {
+            "matched_entities": matched,
+            "expansion_count": record.get("expansion_count", 0),
+            "expanded_query": " OR ".join([query] + terms) if terms else query,
+            "rewrite_time_ms": record.get("query_rewrite_time_ms") or 0,
+        },
+    }
+    adoption = {
+        "id": record.get("query_id"),
+        "user_id": record.get("user_id_hash"),
+        "timestamp": record.get("timestamp", ""),
+        "_ts": ts,
+    }
+    return rewriter, adoption
+
+
+class TelemetryJsonlSource(DataSource):
+    """TelemetryLogger JSONL logs, followed incrementally as they grow."""
+
+    name = "telemetry_jsonl"
+
+    def __init__(self, storage_path: str):
+        from telemetry_tail import TelemetryTailer
+
+        self.storage_path = storage_path
+        self._tailer = TelemetryTailer(storage_path, from_start=True)
+        # Oldest first (appends are cheap); accessors return newest first.
+        # Each list has a parallel list of _ts values to bisect (bisect's
+        # key= argument needs Python 3.10)
+        self._rewriter: List[Doc] = []
+        self._rewriter_ts: List[int] = []
+        self._adoption: List[Doc] = []
+        self._adoption_ts: List[int] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _add(docs: List[Doc], keys: List[int], doc: Doc):
+        ts = doc["_ts"]
+        if not keys or keys[-1] <= ts:
+            docs.append(doc)
+            keys.append(ts)
+        else:
+            # Shards are polled one after another, so batches interleave in time
+            i = bisect_right(keys, ts)
+            docs.insert(i, doc)
+            keys.insert(i, ts)
+
+    def _load(self):
+        """Parse only what was appended to the base file and shards since the last call."""
+        with self._lock:
+            while True:
+                records = self._tailer.poll()
+                if not records:
+                    return
+                for record in records:
+                    if "query_rewrite_time_ms" not in record:
+                        continue
+                    doc, user_doc = telemetry_to_docs(record)
+                    self._add(self._rewriter, self._rewriter_ts, doc)
+                    self._add(self._adoption, self._adoption_ts, user_doc)
+
+    @staticmethod
+    def _newest_first(docs: List[Doc], keys: List[int], since_ts: Optional[int] = None) -> List[Doc]:
+        start = bisect_left(keys, since_ts) if since_ts else 0
+        return docs[start:][::-1]
+
+    def rewriter_docs(self, start=None, end=None, entity=None, zero_results=False):
+        self._load()
+        with self._lock:
+            docs = self._newest_first(self._rewriter, self._rewriter_ts,
+                                      int(start.timestamp()) if start else None)
+        return _filter_docs(docs, start, end, entity=entity, zero_results=zero_results)
+
+    def adoption_docs(self, since_ts=None):
+        self._load()
+        with self._lock:
+            return self._newest_first(self._adoption, self._adoption_ts, since_ts)
+
+    def feedback_docs(self, since_ts=None, end_ts=None, feedback_type=None, category=None):
+        # The rewriter doesn't collect feedback
+        return []
+
+    def record_counts(self):
+        self._load()
+        return {
+            "rewriter_records": len(self._rewriter),
+            "adoption_records": len(self._adoption),
+            "feedback_records": 0,
+        }
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rewriter_docs (
+    id TEXT PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    result_count INTEGER,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rewriter_ts ON rewriter_docs (ts);
+CREATE INDEX IF NOT EXISTS idx_rewriter_result_count ON rewriter_docs (result_count, ts);
+
+CREATE TABLE IF NOT EXISTS rewriter_entities (
+    doc_id TEXT NOT NULL REFERENCES rewriter_docs (id) ON DELETE CASCADE,
+    entity TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    PRIMARY KEY (doc_id, entity)
+);
+CREATE INDEX IF NOT EXISTS idx_rewriter_entities_entity ON rewriter_entities (entity, ts);
+
+CREATE TABLE IF NOT EXISTS adoption_docs (
+    id TEXT PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    user_id TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_adoption_ts ON adoption_docs (ts);
+CREATE INDEX IF NOT EXISTS idx_adoption_user ON adoption_docs (user_id, ts);
+
+CREATE TABLE IF NOT EXISTS feedback_docs (
+    id TEXT PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    doc TEXT NOT NULL,
+    feedback_type TEXT,
+    category TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_ts ON feedback_docs (ts);
+"""
+
+# Created after _migrate(): databases from before these columns existed
+# get them added first
+_SQLITE_FEEDBACK_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_feedback_type ON feedback_docs (feedback_type, ts);
+CREATE INDEX IF NOT EXISTS idx_feedback_category ON feedback_docs (category, ts);
+"""
+
+
+class SqliteDataSource(DataSource):
+    """Embedded SQLite document store with indexed time, user, result and entity columns."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SQLITE_SCHEMA)
+            self._migrate(conn)
+            conn.executescript(_SQLITE_FEEDBACK_INDEXES)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """Add and backfill feedback_type/category on databases created without them."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(feedback_docs)")}
+        if "feedback_type" in columns:
+            return
+        conn.execute("ALTER TABLE feedback_docs ADD COLUMN feedback_type TEXT")
+        conn.execute("ALTER TABLE feedback_docs ADD COLUMN category TEXT")
+        rows = []
+        for doc_id, doc in conn.execute("SELECT id, doc FROM feedback_docs").fetchall():
+            d = json.loads(doc)
+            rows.append((d.get("feedbackType", "unknown"), d.get("category", "Uncategorized"), doc_id))
+        conn.executemany("UPDATE feedback_docs SET feedback_type = ?, category = ? WHERE id = ?", rows)
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (the API's sync handlers run in FastAPI's thread pool)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def add_rewriter_docs(self, docs: Iterable[Doc]) -> int:
+        """Insert or replace rewriter docs; returns the number written."""
+        rows, entity_rows = [], []
+        for d in docs:
+            doc_id = str(d.get("id") or d.get("conversation_id"))
+            ts = int(d.get("_ts", 0))
+            rows.append((doc_id, ts, d.get("resultCount"), json.dumps(d)))
+            for entity in set(d.get("query_rewrite_telemetry", {}).get("matched_entities", [])):
+                entity_rows.append((doc_id, entity, ts))
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM rewriter_entities WHERE doc_id = ?", [(r[0],) for r in rows])
+            conn.executemany("INSERT OR REPLACE INTO rewriter_docs (id, ts, result_count, doc) "
+                             "VALUES (?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO rewriter_entities (doc_id, entity, ts) VALUES (?, ?, ?)",
+                             entity_rows)
+        return len(rows)
+
+    def add_adoption_docs(self, docs: Iterable[Doc]) -> int:
+        rows = [(str(d.get("id") or d.get("conversation_id")), int(d.get("_ts", 0)),
+                 d.get("user_id") or d.get("user_name"), json.dumps(d)) for d in docs]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO adoption_docs (id, ts, user_id, doc) "
+                             "VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def add_feedback_docs(self, docs: Iterable[Doc]) -> int:
+        rows = [(str(d.get("id")), int(d.get("_ts", 0)), json.dumps(d),
+                 d.get("feedbackType", "unknown"), d.get("category", "Uncategorized")) for d in docs]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO feedback_docs "
+                             "(id, ts, doc, feedback_type, category) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def load_from(self, source: DataSource) -> Dict[str, int]:
+        """Copy every document from another source."""
+        return {
+            "rewriter_records": self.add_rewriter_docs(source.rewriter_docs()),
+            "adoption_records": self.add_adoption_docs(source.adoption_docs()),
+            "feedback_records": self.add_feedback_docs(source.feedback_docs()),
+        }
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def rewriter_docs(self, start=None, end=None, entity=None, zero_results=False):
+        conditions, params = [], []
+        if start:
+            conditions.append("r.ts >= ?")
+            params.append(start.timestamp())
+        if end:
+            conditions.append("r.ts < ?")
+            params.append(end.timestamp())
+        if zero_results:
+            conditions.append("r.result_count = 0")
+        if entity:
+            sql = "SELECT r.doc FROM rewriter_entities e JOIN rewriter_docs r ON r.id = e.doc_id"
+            conditions.insert(0, "e.entity = ?")
+            params.insert(0, entity)
+            # Range-scan the (entity, ts) index rather than the docs table
+            conditions = [c.replace("r.ts", "e.ts") for c in conditions]
+            order = "e.ts DESC"
+        else:
+            sql = "SELECT r.doc FROM rewriter_docs r"
+            order = "r.ts DESC"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order}"
+        return [json.loads(row[0]) for row in self._connect().execute(sql, params)]
+
+    def _docs_since(self, table: str, since_ts: Optional[int]) -> List[Doc]:
+        if since_ts:
+            rows = self._connect().execute(f"SELECT doc FROM {table} WHERE ts >= ? ORDER BY ts DESC", (since_ts,))
+        else:
+            rows = self._connect().execute(f"SELECT doc FROM {table} ORDER BY ts DESC")
+        return [json.loads(row[0]) for row in rows]
+
+    def adoption_docs(self, since_ts=None):
+        return self._docs_since("adoption_docs", since_ts)
+
+    def feedback_docs(self, since_ts=None, end_ts=None, feedback_type=None, category=None):
+        # Equality on type/category plus the ts range: one (column, ts) index range scan
+        conditions, params = [], []
+        if feedback_type:
+            conditions.append("feedback_type = ?")
+            params.append(feedback_type)
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        if since_ts:
+            conditions.append("ts >= ?")
+            params.append(since_ts)
+        if end_ts:
+            conditions.append("ts < ?")
+            params.append(end_ts)
+        sql = "SELECT doc FROM feedback_docs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY ts DESC"
+        return [json.loads(row[0]) for row in self._connect().execute(sql, params)]
+
+    def record_counts(self):
+        conn = self._connect()
+        return {
+            f"{table}_records": conn.execute(f"SELECT COUNT(*) FROM {table}_docs").fetchone()[0]
+            for table in ("rewriter", "adoption", "feedback")
+        }
+
+    def explain(self, sql: str, params=()) -> List[str]:
+        """SQLite query plan details (to check index use)."""
+        return [row[-1] for row in self._connect().execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def create_data_source(spec: Optional[str] = None) -> DataSource:
+    """
+    DataSource from a spec: "mock", "jsonl:<telemetry path>" or "sqlite:<db path>".
+
+    Defaults to NEXUS_DATA_SOURCE, then "mock".
+    """
+    spec = spec or os.getenv("NEXUS_DATA_SOURCE") or "mock"
+    kind, _, location = spec.partition(":")
+    if kind == "mock":
+        return MockDataSource()
+    if kind == "jsonl" and location:
+        return TelemetryJsonlSource(location)
+    if kind == "sqlite" and location:
+        return SqliteDataSource(location)
+    raise ValueError(f"Unknown data source {spec!r}; expected mock, jsonl:<path> or sqlite:<path>")
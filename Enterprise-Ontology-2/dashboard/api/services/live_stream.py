@@ -0,0 +1,136 @@
+"""
+Live metrics broadcaster for the /api/stream server-sent events endpoint.
+
+One background task tails the telemetry stream (base file and
+per-process shards, see engine/src/telemetry_tail.py) and folds new
+records into deltas. Each delta goes to every connected client. The task
+runs only while at least one client is connected.
+
+Backpressure: each client has a bounded queue. When a slow client's queue
+is full, the new delta is merged into the newest queued one instead of
+being appended. Deltas are additive, so the client receives fewer, larger
+updates ('coalesced' counts the merges) and memory per client stays
+bounded.
+
+Usage:
+    broadcaster = LiveBroadcaster("engine/outputs/telemetry_logs.jsonl")
+    async for event in broadcaster.events():
+        ...  # SSE-formatted bytes
+"""
+
+import asyncio
+import os
+import sys
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+ENGINE_SRC = Path(__file__).resolve().parents[3] / "engine" / "src"
+if str(ENGINE_SRC) not in sys.path:
+    sys.path.insert(0, str(ENGINE_SRC))
+
+from serialization import dumps
+from telemetry_tail import LiveAggregator, TelemetryTailer, merge_deltas
+
+DEFAULT_TELEMETRY_PATH = str(ENGINE_SRC.parent / "outputs" / "telemetry_logs.jsonl")
+
+# Seconds between telemetry polls
+POLL_INTERVAL_S = 1.0
+
+# Seconds without data before a keep-alive comment is sent
+KEEPALIVE_S = 15.0
+
+# Queued deltas per client before new ones are coalesced
+CLIENT_QUEUE_SIZE = 8
+
+
+class _Client:
+    """Bounded, coalescing queue of deltas for one connection."""
+
+    def __init__(self, max_queued: int):
+        self.max_queued = max_queued
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.coalesced = 0
+
+    def offer(self, delta: dict):
+        if len(self.queue) >= self.max_queued:
+            newest = self.queue[-1]
+            merge_deltas(newest, delta)
+            newest["coalesced"] = newest.get("coalesced", 0) + 1
+            self.coalesced += 1
+        else:
+            self.queue.append(dict(delta, entities=dict(delta["entities"]),
+                                   zero_result_queries=list(delta["zero_result_queries"]),
+                                   latency=dict(delta["latency"])))
+        self.ready.set()
+
+    def take(self) -> Optional[dict]:
+        if not self.queue:
+            self.ready.clear()
+            return None
+        return self.queue.popleft()
+
+
+class LiveBroadcaster:
+    """Tails telemetry once and fans out deltas to SSE clients."""
+
+    def __init__(self, telemetry_path: Optional[str] = None, poll_interval: float = POLL_INTERVAL_S,
+                 client_queue_size: int = CLIENT_QUEUE_SIZE):
+        self.telemetry_path = telemetry_path or os.getenv("NEXUS_TELEMETRY_PATH") or DEFAULT_TELEMETRY_PATH
+        self.poll_interval = poll_interval
+        self.client_queue_size = client_queue_size
+        self._clients = set()
+        self._task = None
+        self._sequence = 0
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def _subscribe(self) -> _Client:
+        client = _Client(self.client_queue_size)
+        self._clients.add(client)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return client
+
+    def _unsubscribe(self, client: _Client):
+        self._clients.discard(client)
+        if not self._clients and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        """Poll the telemetry files and publish non-empty deltas."""
+        tailer = TelemetryTailer(self.telemetry_path)
+        aggregator = LiveAggregator()
+        while True:
+            # File reads and JSON parsing stay off the event loop
+            records = await asyncio.to_thread(tailer.poll)
+            if records:
+                delta = aggregator.delta(records)
+                if delta["records"]:
+                    self._sequence += 1
+                    delta["sequence"] = self._sequence
+                    for client in list(self._clients):
+                        client.offer(delta)
+            await asyncio.sleep(self.poll_interval)
+
+    async def events(self, keepalive: float = KEEPALIVE_S) -> AsyncIterator[bytes]:
+        """SSE byte chunks for one client until it disconnects."""
+        client = self._subscribe()
+        try:
+            yield b"retry: 5000\nevent: ready\ndata: " + dumps({"pollIntervalS": self.poll_interval}) + b"\n\n"
+            while True:
+                delta = client.take()
+                if delta is None:
+                    try:
+                        await asyncio.wait_for(client.ready.wait(), timeout=keepalive)
+                    except asyncio.TimeoutError:
+                        yield b": keep-alive\n\n"
+                    continue
+                yield (b"id: " + str(delta["sequence"]).encode() + b"\nevent: metrics\ndata: "
+                       + dumps(delta) + b"\n\n")
+        finally:
+            self._unsubscribe(client)
@@ -1,257 +1,298 @@
 """
 Simplified metrics service for local development.
+
+Documents come from a DataSource (see data_sources.py): the mock data by
+default, or TelemetryLogger JSONL logs or a SQLite store selected with
+NEXUS_DATA_SOURCE. Rewriter window and entity filters are pushed down to
+the source.
+
+Adoption and feedback metrics are read from daily rollups (see
+rollup_store.py). Set NEXUS_ROLLUP_PATH to the rollups.json written by
+scripts/transform_to_dashboard.py; otherwise rollups are built from the
+data source and kept up to date incrementally. Feedback items are always
+read from the data source, so filters and paging cover every document.
+
+Lists are ordered newest first by (_ts, id) and paged with cursors keyed
+on the last item's (_ts, id), so new documents don't shift later pages.
+Each list has its own cursor.
 """
 
-from datetime import datetime, timedelta
-from collections import defaultdict
-from typing import Dict, List, Any
+import base64
+import binascii
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from .data_sources import DataSource, create_data_source
+from .rollup_store import RollupStore, feedback_item
+from sketches import SpaceSaving  # engine/src, put on sys.path by rollup_store
+
+# Bounded entity counters; exact while the lexicon has fewer entities
+TOP_ENTITIES_CAPACITY = 1000
+
+# Sections selectable with fields=
+REWRITER_FIELDS = ("summary", "effectiveness", "latencyStats", "qualityScores",
+                   "topEntities", "rewrittenQueries", "zeroResultQueries")
+FEEDBACK_FIELDS = ("summary", "trend", "categoryBreakdown", "feedbackItems")
+
+MAX_PAGE_SIZE = 200
+
+
+DocKey = Tuple[float, str]
+
+
+def _doc_key(doc: Dict) -> DocKey:
+    """List order and cursor position of a doc: (_ts, id)."""
+    return doc.get('_ts', 0), str(doc.get('id', doc.get('conversation_id', '')))
+
 
-from data import MOCK_REWRITER_DATA, MOCK_ADOPTION_DATA, MOCK_FEEDBACK_DATA
+def encode_cursor(key: DocKey) -> str:
+    """Opaque page cursor after the doc with this (_ts, id)."""
+    ts, doc_id = key
+    return base64.urlsafe_b64encode(json.dumps({"t": ts, "i": doc_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[DocKey]:
+    """(_ts, id) of a cursor (None for the first page); ValueError if malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        ts, doc_id = data["t"], data["i"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if isinstance(ts, bool) or not isinstance(ts, (int, float)) or not isinstance(doc_id, str):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return ts, doc_id
+
+
+def _select_fields(fields: Optional[Iterable[str]], allowed: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Requested sections (all when fields is empty); ValueError on unknown names."""
+    if not fields:
+        return allowed
+    fields = tuple(fields)
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown}; expected any of {list(allowed)}")
+    return fields
+
+
+def _project(metrics: Dict[str, Any], wanted: Tuple[str, ...]) -> Dict[str, Any]:
+    return {k: v for k, v in metrics.items() if k in wanted}
+
+
+def _has_results(doc: Dict) -> bool:
+    """Whether the doc records a result count (telemetry-only docs don't)."""
+    return doc.get('resultCount') is not None
+
+
+def _paginate(docs: List[Dict], after: Optional[DocKey], limit: Optional[int],
+              default_limit: int = MAX_PAGE_SIZE) -> Tuple[List, Dict[str, Any]]:
+    """One page of docs after the cursor key and its pagination info (total, nextCursor)."""
+    limit = min(limit or default_limit, MAX_PAGE_SIZE)
+    docs = sorted(docs, key=_doc_key, reverse=True)  # Sources are already ~newest first
+    start = 0
+    if after is not None:
+        start = next((i for i, d in enumerate(docs) if _doc_key(d) < after), len(docs))
+    page = docs[start:start + limit]
+    more = start + len(page) < len(docs)
+    return page, {
+        "total": len(docs),
+        "limit": limit,
+        "nextCursor": encode_cursor(_doc_key(page[-1])) if page and more else None
+    }
 
 
 class MetricsService:
-    """Calculate metrics from mock data."""
+    """Calculate metrics from a data source and daily rollups."""
+    
+    def __init__(self, source: Optional[DataSource] = None, rollup_path: Optional[str] = None):
+        self.source = source or create_data_source()
+        rollup_path = rollup_path or os.getenv("NEXUS_ROLLUP_PATH")
+        # Rollups written by the transform script are only reloaded, not fed
+        self._sync_rollups = not rollup_path
+        self.rollups = RollupStore(rollup_path)
+        # API handlers run in a thread pool; rollup updates and reads are serialized
+        self._rollup_lock = threading.Lock()
+        if self._sync_rollups:
+            self._update_rollups()
     
-    def calculate_rewriter_metrics(self) -> Dict[str, Any]:
-        """Calculate query rewriter metrics."""
-        raw_data = MOCK_REWRITER_DATA
+    def _update_rollups(self):
+        """Ingest adoption/feedback docs newer than the rollup watermarks."""
+        if not self._sync_rollups:
+            self.rollups.refresh()
+            return
+        self.rollups.ingest_adoption(self.source.adoption_docs(since_ts=self.rollups.watermark("adoption")))
+        self.rollups.ingest_feedback(self.source.feedback_docs(since_ts=self.rollups.watermark("feedback")))
+    
+    def record_counts(self) -> Dict[str, int]:
+        """Records per stream in the data source."""
+        return self.source.record_counts()
+    
+    def calculate_rewriter_metrics(self,
+                                   start: Optional[datetime] = None,
+                                   end: Optional[datetime] = None,
+                                   entity: Optional[str] = None,
+                                   fields: Optional[Iterable[str]] = None,
+                                   limit: Optional[int] = None,
+                                   rewritten_cursor: Optional[str] = None,
+                                   zero_result_cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Calculate query rewriter metrics.
+        
+        Args:
+            start, end: Only queries in [start, end) (by _ts)
+            entity: Only queries that matched this entity
+            fields: Sections to compute (default: all, see REWRITER_FIELDS)
+            limit: Page size for rewrittenQueries / zeroResultQueries
+            rewritten_cursor: rewrittenQueries nextCursor from the previous page
+            zero_result_cursor: zeroResultQueries nextCursor from the previous page
+        """
+        wanted = _select_fields(fields, REWRITER_FIELDS)
+        rewritten_after = decode_cursor(rewritten_cursor)
+        zero_result_after = decode_cursor(zero_result_cursor)
+        zero_results_only = wanted == ("zeroResultQueries",)
+        raw_data = self.source.rewriter_docs(start=start, end=end, entity=entity,
+                                             zero_results=zero_results_only)
         total = len(raw_data)
         
-        if total == 0:
-            return self._empty_rewriter_metrics()
+        if total == 0 and not zero_results_only:
+            return _project(self._empty_rewriter_metrics(), wanted)
         
         rewritten = [d for d in raw_data if d.get('query_rewrite_telemetry', {}).get('expansion_count', 0) > 0]
         passthrough = [d for d in raw_data if d.get('query_rewrite_telemetry', {}).get('expansion_count', 0) == 0]
+        metrics = {}
+        pagination = {}
         
-        rewrite_rate = round(len(rewritten) / total * 100, 1) if total > 0 else 0
-        
-        rewritten_zeros = sum(1 for d in rewritten if d.get('resultCount', 0) == 0)
-        passthrough_zeros = sum(1 for d in passthrough if d.get('resultCount', 0) == 0)
-        
-        rewritten_zero_rate = round(rewritten_zeros / len(rewritten) * 100, 1) if rewritten else 0
-        passthrough_zero_rate = round(passthrough_zeros / len(passthrough) * 100, 1) if passthrough else 0
-        
-        rewritten_avg = round(sum(d.get('resultCount', 0) for d in rewritten) / len(rewritten), 1) if rewritten else 0
-        passthrough_avg = round(sum(d.get('resultCount', 0) for d in passthrough) / len(passthrough), 1) if passthrough else 0
-        
-        latencies = []
-        for d in rewritten:
-            lat = d.get('query_rewrite_telemetry', {}).get('rewrite_time_ms', 0)
-            if lat > 0:
-                latencies.append(lat)
-        
-        expansion_counts = [d.get('query_rewrite_telemetry', {}).get('expansion_count', 0) for d in rewritten]
-        avg_expansion = round(sum(expansion_counts) / len(expansion_counts), 1) if expansion_counts else 0
-        
-        entity_counts = defaultdict(int)
-        for d in rewritten:
-            for entity in d.get('query_rewrite_telemetry', {}).get('matched_entities', []):
-                entity_counts[entity] += 1
-        
-        top_entities = [
-            {"entity": k, "count": v} 
-            for k, v in sorted(entity_counts.items(), key=lambda x: -x[1])[:10]
-        ]
-        
-        rewritten_queries = []
-        for d in rewritten[:50]:
-            telemetry = d.get('query_rewrite_telemetry', {})
-            scores = d.get('evaluation_scores', {})
-            rewritten_queries.append({
-                "id": str(d.get('conversation_id', d.get('id', '')))[:8],
-                "query": d.get('conversation', ''),
-                "matchedEntities": telemetry.get('matched_entities', []),
-                "expansionCount": telemetry.get('expansion_count', 0),
-                "expandedQuery": telemetry.get('expanded_query', ''),
-                "rewriteTimeMs": round(telemetry.get('rewrite_time_ms', 0), 2),
-                "resultCount": d.get('resultCount', 0),
-                "scores": {
-                    "relevance": scores.get('relevance', 0),
-                    "groundedness": scores.get('groundedness', 0),
-                    "completeness": scores.get('completeness', 0)
-                }
-            })
-        
-        zero_result_queries = []
-        for d in raw_data:
-            if d.get('resultCount', 0) == 0:
-                zero_result_queries.append({
-                    "id": str(d.get('conversation_id', d.get('id', '')))[:8],
-                    "query": d.get('conversation', ''),
-                    "matchedEntities": d.get('query_rewrite_telemetry', {}).get('matched_entities', []),
-                    "wasRewritten": d.get('query_rewrite_telemetry', {}).get('expansion_count', 0) > 0,
-                    "timestamp": d.get('timestamp', '')
-                })
-        
-        return {
-            "summary": {
+        if "summary" in wanted:
+            expansion_counts = [d.get('query_rewrite_telemetry', {}).get('expansion_count', 0) for d in rewritten]
+            avg_expansion = round(sum(expansion_counts) / len(expansion_counts), 1) if expansion_counts else 0
+            metrics["summary"] = {
                 "totalQueries": total,
                 "rewrittenCount": len(rewritten),
                 "passthroughCount": len(passthrough),
-                "rewriteRate": rewrite_rate,
+                "rewriteRate": round(len(rewritten) / total * 100, 1),
                 "avgExpansionCount": avg_expansion
-            },
-            "effectiveness": {
-                "rewrittenZeroRate": rewritten_zero_rate,
-                "passthroughZeroRate": passthrough_zero_rate,
-                "rewrittenAvgResults": rewritten_avg,
-                "passthroughAvgResults": passthrough_avg
-            },
-            "latencyStats": {
+            }
+        
+        if "effectiveness" in wanted:
+            # Only docs that record a result count say anything about effectiveness
+            rewritten_known = [d for d in rewritten if _has_results(d)]
+            passthrough_known = [d for d in passthrough if _has_results(d)]
+            rewritten_zeros = sum(1 for d in rewritten_known if d['resultCount'] == 0)
+            passthrough_zeros = sum(1 for d in passthrough_known if d['resultCount'] == 0)
+            metrics["effectiveness"] = {
+                "rewrittenZeroRate": round(rewritten_zeros / len(rewritten_known) * 100, 1) if rewritten_known else 0,
+                "passthroughZeroRate": round(passthrough_zeros / len(passthrough_known) * 100, 1) if passthrough_known else 0,
+                "rewrittenAvgResults": round(sum(d['resultCount'] for d in rewritten_known) / len(rewritten_known), 1) if rewritten_known else 0,
+                "passthroughAvgResults": round(sum(d['resultCount'] for d in passthrough_known) / len(passthrough_known), 1) if passthrough_known else 0
+            }
+        
+        if "latencyStats" in wanted:
+            latencies = []
+            for d in rewritten:
+                lat = d.get('query_rewrite_telemetry', {}).get('rewrite_time_ms', 0)
+                if lat > 0:
+                    latencies.append(lat)
+            metrics["latencyStats"] = {
                 "min": round(min(latencies), 2) if latencies else 0,
                 "max": round(max(latencies), 2) if latencies else 0,
                 "avg": round(sum(latencies) / len(latencies), 2) if latencies else 0,
                 "p95": self._percentile(latencies, 95),
                 "target": 40
-            },
-            "qualityScores": {
+            }
+        
+        if "qualityScores" in wanted:
+            metrics["qualityScores"] = {
                 "rewritten": self._avg_scores(rewritten),
                 "passthrough": self._avg_scores(passthrough)
-            },
-            "topEntities": top_entities,
-            "rewrittenQueries": rewritten_queries,
-            "zeroResultQueries": zero_result_queries[:30]
-        }
-    
-    def calculate_adoption_metrics(self) -> Dict[str, Any]:
-        """Calculate adoption metrics."""
-        raw_data = MOCK_ADOPTION_DATA
-        now = datetime.now()
-        
-        user_queries = []
-        for doc in raw_data:
-            user_id = doc.get('user_id') or doc.get('user_name') or 'anonymous'
-            ts = doc.get('_ts', 0)
-            query_time = datetime.fromtimestamp(ts) if ts else None
-            
-            if query_time:
-                user_queries.append({
-                    'user_id': user_id,
-                    'timestamp': query_time,
-                    'response_time': (doc.get('llm_telemetry') or {}).get('response_time_ms', 0)
+            }
+        
+        if "topEntities" in wanted:
+            entity_counts = SpaceSaving(capacity=TOP_ENTITIES_CAPACITY)
+            for d in rewritten:
+                entity_counts.update(d.get('query_rewrite_telemetry', {}).get('matched_entities', []))
+            metrics["topEntities"] = [{"entity": k, "count": v} for k, v in entity_counts.top(10)]
+        
+        if "rewrittenQueries" in wanted:
+            page, pagination["rewrittenQueries"] = _paginate(rewritten, rewritten_after, limit, default_limit=50)
+            rewritten_queries = []
+            for d in page:
+                telemetry = d.get('query_rewrite_telemetry', {})
+                scores = d.get('evaluation_scores', {})
+                rewritten_queries.append({
+                    "id": str(d.get('conversation_id', d.get('id', '')))[:8],
+                    "query": d.get('conversation', ''),
+                    "matchedEntities": telemetry.get('matched_entities', []),
+                    "expansionCount": telemetry.get('expansion_count', 0),
+                    "expandedQuery": telemetry.get('expanded_query', ''),
+                    "rewriteTimeMs": round(telemetry.get('rewrite_time_ms', 0), 2),
+                    "resultCount": d.get('resultCount'),
+                    "scores": {
+                        "relevance": scores.get('relevance', 0),
+                        "groundedness": scores.get('groundedness', 0),
+                        "completeness": scores.get('completeness', 0)
+                    }
                 })
+            metrics["rewrittenQueries"] = rewritten_queries
         
-        if not user_queries:
-            return self._empty_adoption_metrics()
-        
-        week_ago = now - timedelta(days=7)
-        month_ago = now - timedelta(days=30)
-        
-        wau_users = set(q['user_id'] for q in user_queries if q['timestamp'] >= week_ago)
-        mau_users = set(q['user_id'] for q in user_queries if q['timestamp'] >= month_ago)
-        
-        wau = len(wau_users)
-        mau = len(mau_users)
-        stickiness = round((wau / mau * 100), 1) if mau > 0 else 0
-        
-        daily_counts = defaultdict(int)
-        for q in user_queries:
-            if q['timestamp'] >= month_ago:
-                day_key = q['timestamp'].strftime('%Y-%m-%d')
-                daily_counts[day_key] += 1
-        
-        sorted_days = sorted(daily_counts.items())
-        query_trend = [{"date": d, "count": c} for d, c in sorted_days]
-        
-        user_query_counts = defaultdict(int)
-        for q in user_queries:
-            user_query_counts[q['user_id']] += 1
-        
-        total_users = len(set(q['user_id'] for q in user_queries))
-        queries_per_user = round(len(user_queries) / total_users, 1) if total_users > 0 else 0
-        
-        response_times = [q['response_time'] for q in user_queries if q['response_time'] and q['response_time'] > 0]
-        avg_response_time = round(sum(response_times) / len(response_times), 0) if response_times else 0
-        
-        hour_counts = defaultdict(int)
-        for q in user_queries:
-            hour_counts[q['timestamp'].hour] += 1
-        peak_hour = max(hour_counts, key=hour_counts.get) if hour_counts else 0
-        
-        top_users = []
-        for user_id, count in sorted(user_query_counts.items(), key=lambda x: -x[1])[:10]:
-            display_name = str(user_id)[:8] + "..." if len(str(user_id)) > 8 else str(user_id)
-            top_users.append({"user": display_name, "queries": count})
-        
-        return {
-            "wau": wau,
-            "mau": mau,
-            "stickiness": stickiness,
-            "totalQueries": len(user_queries),
-            "totalUsers": total_users,
-            "queriesPerUser": queries_per_user,
-            "avgResponseTimeMs": avg_response_time,
-            "peakHour": peak_hour,
-            "queryTrend": query_trend,
-            "topUsers": top_users
-        }
+        if "zeroResultQueries" in wanted:
+            zero_results = [d for d in raw_data if _has_results(d) and d['resultCount'] == 0]
+            page, pagination["zeroResultQueries"] = _paginate(zero_results, zero_result_after, limit,
+                                                                  default_limit=30)
+            metrics["zeroResultQueries"] = [{
+                "id": str(d.get('conversation_id', d.get('id', '')))[:8],
+                "query": d.get('conversation', ''),
+                "matchedEntities": d.get('query_rewrite_telemetry', {}).get('matched_entities', []),
+                "wasRewritten": d.get('query_rewrite_telemetry', {}).get('expansion_count', 0) > 0,
+                "timestamp": d.get('timestamp', '')
+            } for d in page]
+        
+        if pagination:
+            metrics["pagination"] = pagination
+        return metrics
     
-    def calculate_feedback_metrics(self) -> Dict[str, Any]:
-        """Calculate feedback metrics."""
-        feedback_data = MOCK_FEEDBACK_DATA
-        
-        if not feedback_data:
-            return self._empty_feedback_metrics()
-        
-        total = len(feedback_data)
-        thumbs_up = [f for f in feedback_data if f.get('feedbackType') == 'thumbsUp']
-        thumbs_down = [f for f in feedback_data if f.get('feedbackType') == 'thumbsDown']
-        
-        now = datetime.now()
-        month_ago = now - timedelta(days=30)
-        
-        daily_feedback = defaultdict(lambda: {"positive": 0, "negative": 0})
-        for f in feedback_data:
-            ts = f.get('_ts', 0)
-            if ts:
-                feedback_time = datetime.fromtimestamp(ts)
-                if feedback_time >= month_ago:
-                    day_key = feedback_time.strftime('%Y-%m-%d')
-                    if f.get('feedbackType') == 'thumbsUp':
-                        daily_feedback[day_key]['positive'] += 1
-                    else:
-                        daily_feedback[day_key]['negative'] += 1
-        
-        feedback_trend = [
-            {"date": d, "positive": v['positive'], "negative": v['negative']} 
-            for d, v in sorted(daily_feedback.items())
-        ]
-        
-        category_counts = defaultdict(int)
-        for f in feedback_data:
-            cat = f.get('category', 'Uncategorized')
-            category_counts[cat] += 1
-        
-        category_breakdown = [
-            {"category": k, "count": v} 
-            for k, v in sorted(category_counts.items(), key=lambda x: -x[1])
-        ]
-        
-        feedback_items = []
-        for f in feedback_data[:100]:
-            feedback_items.append({
-                "id": str(f.get('id', ''))[:12],
-                "timestamp": f.get('timestamp', ''),
-                "userName": f.get('userName', 'Anonymous'),
-                "feedbackType": f.get('feedbackType', 'unknown'),
-                "comment": f.get('comment', ''),
-                "category": f.get('category', 'Uncategorized'),
-                "conversationId": str(f.get('conversationId', ''))[:12]
-            })
-        
-        feedback_items.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        return {
-            "summary": {
-                "total": total,
-                "thumbsUp": len(thumbs_up),
-                "thumbsDown": len(thumbs_down),
-                "positiveRate": round(len(thumbs_up) / total * 100, 1) if total > 0 else 0
-            },
-            "trend": feedback_trend,
-            "categoryBreakdown": category_breakdown,
-            "feedbackItems": feedback_items
-        }
+    def calculate_adoption_metrics(self) -> Dict[str, Any]:
+        """Calculate adoption metrics from the daily rollups."""
+        with self._rollup_lock:
+            self._update_rollups()
+            return self.rollups.adoption_metrics()
+    
+    def calculate_feedback_metrics(self,
+                                   start: Optional[datetime] = None,
+                                   end: Optional[datetime] = None,
+                                   feedback_type: Optional[str] = None,
+                                   category: Optional[str] = None,
+                                   fields: Optional[Iterable[str]] = None,
+                                   limit: Optional[int] = None,
+                                   cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Calculate feedback metrics.
+        
+        start/end select whole days of rollups for the summary, trend and
+        category breakdown. feedbackItems are read from the data source
+        with start <= _ts < end and feedback_type/category pushed down
+        (index range scans with SQLite), then paged with limit/cursor.
+        """
+        wanted = _select_fields(fields, FEEDBACK_FIELDS)
+        after = decode_cursor(cursor)
+        with self._rollup_lock:
+            self._update_rollups()
+            metrics = _project(self.rollups.feedback_metrics(start=start, end=end), wanted)
+        
+        if "feedbackItems" in wanted:
+            # Epoch bounds: aware and naive (local) datetimes compare correctly against _ts
+            docs = self.source.feedback_docs(
+                since_ts=start.timestamp() if start else None,
+                end_ts=end.timestamp() if end else None,
+                feedback_type=feedback_type, category=category)
+            page, page_info = _paginate(docs, after, limit, default_limit=100)
+            metrics["feedbackItems"] = [feedback_item(d) for d in page]
+            metrics["pagination"] = {"feedbackItems": page_info}
+        return metrics
     
     def _empty_rewriter_metrics(self) -> Dict[str, Any]:
         return {
@@ -273,21 +314,6 @@ class MetricsService:
             "zeroResultQueries": []
         }
     
-    def _empty_adoption_metrics(self) -> Dict[str, Any]:
-        return {
-            "wau": 0, "mau": 0, "stickiness": 0, "totalQueries": 0,
-            "totalUsers": 0, "queriesPerUser": 0, "avgResponseTimeMs": 0,
-            "peakHour": 0, "queryTrend": [], "topUsers": []
-        }
-    
-    def _empty_feedback_metrics(self) -> Dict[str, Any]:
-        return {
-            "summary": {"total": 0, "thumbsUp": 0, "thumbsDown": 0, "positiveRate": 0},
-            "trend": [],
-            "categoryBreakdown": [],
-            "feedbackItems": []
-        }
-    
     def _avg_scores(self, docs: List[Dict]) -> Dict[str, float]:
         if not docs:
             return {"relevance": 0, "groundedness": 0, "completeness": 0}
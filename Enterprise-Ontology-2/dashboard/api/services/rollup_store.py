@@ -0,0 +1,466 @@
+"""
+Daily rollup store for adoption and feedback metrics.
+
+Keeps one small record per (local) day instead of the raw documents:
+query count, 24-slot hourly histogram, a HyperLogLog sketch of the day's
+users, response time sum/count and feedback tallies by type and category.
+All-time totals and the most recent feedback items are maintained
+alongside, so the dashboard metrics are derived from at most 31 day
+records. WAU/MAU are unions of the daily user sketches (about 1.6%
+standard error, near exact for small user counts; see engine/src/sketches.py).
+Pass exact_users=True to also keep exact user sets and validate the sketches.
+Top users come from a bounded Space-Saving summary (exact while there are
+fewer users than its capacity).
+
+Ingestion is incremental: each stream (adoption, feedback) keeps a _ts
+watermark plus the IDs seen at that exact second, so the transform script
+only fetches newer documents and re-fetched boundary documents are not
+counted twice. Documents are assumed append-only (an updated document
+gets a new _ts); call reset() and re-ingest to rebuild from scratch.
+
+The store is a single JSON file, replaced atomically on save().
+
+Usage:
+    rollups = RollupStore("scripts/src/rollups.json")
+    since = rollups.watermark("adoption")
+    rollups.ingest_adoption(fetch_all_queries_for_adoption(container, since_ts=since))
+    rollups.save()
+    metrics = rollups.adoption_metrics()
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+# Sketches live with the ontology engine (engine/src uses flat imports)
+ENGINE_SRC = Path(__file__).resolve().parents[3] / "engine" / "src"
+if str(ENGINE_SRC) not in sys.path:
+    sys.path.insert(0, str(ENGINE_SRC))
+
+from sketches import HyperLogLog, SpaceSaving
+
+FORMAT_VERSION = 3
+
+# Counters kept for top users; counts are exact below this many users
+TOP_USERS_CAPACITY = 1000
+
+# Feedback items kept for the dashboard table
+MAX_FEEDBACK_ITEMS = 100
+
+STREAMS = ("adoption", "feedback")
+
+
+def _empty_day(day: str) -> Dict[str, Any]:
+    return {
+        "date": day,
+        "queries": 0,
+        "hourly": [0] * 24,
+        "userSketch": None,
+        "responseTimeSum": 0.0,
+        "responseTimeCount": 0,
+        "feedback": {"total": 0, "thumbsUp": 0, "thumbsDown": 0, "categories": {}}
+    }
+
+
+def _empty_state() -> Dict[str, Any]:
+    return {
+        "version": FORMAT_VERSION,
+        "watermarks": {stream: {"ts": 0, "ids": []} for stream in STREAMS},
+        "totals": {
+            "queries": 0,
+            "hourly": [0] * 24,
+            "topUsers": None,
+            "userSketch": None,
+            "responseTimeSum": 0.0,
+            "responseTimeCount": 0,
+            "feedback": {"total": 0, "thumbsUp": 0, "thumbsDown": 0, "categories": {}}
+        },
+        "recentFeedback": [],
+        "days": {}
+    }
+
+
+def _doc_key(doc: Dict[str, Any]) -> str:
+    """Stable identity of a document, used to de-duplicate at the watermark."""
+    key = doc.get("id") or doc.get("conversation_id")
+    if key:
+        return str(key)
+    user_id = doc.get("user_id") or doc.get("user_name") or doc.get("userName") or ""
+    return f"{user_id}|{doc.get('_ts', 0)}|{doc.get('timestamp', '')}"
+
+
+def feedback_item(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Dashboard feedback item for a feedback document."""
+    return {
+        "id": str(doc.get("id", ""))[:12],
+        "timestamp": doc.get("timestamp", ""),
+        "userName": doc.get("userName", "Anonymous"),
+        "feedbackType": doc.get("feedbackType", "unknown"),
+        "comment": doc.get("comment", ""),
+        "category": doc.get("category", "Uncategorized"),
+        "conversationId": str(doc.get("conversationId", ""))[:12]
+    }
+
+
+def _add_feedback(tally: Dict[str, Any], feedback_type: str, category: str):
+    tally["total"] += 1
+    if feedback_type == "thumbsUp":
+        tally["thumbsUp"] += 1
+    elif feedback_type == "thumbsDown":
+        tally["thumbsDown"] += 1
+    tally["categories"][category] = tally["categories"].get(category, 0) + 1
+
+
+def _migrate_v1(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Version 1 kept per-day user dicts; convert them to sketches."""
+    for record in list(state["days"].values()) + [state["totals"]]:
+        users = record.pop("users") if record is not state["totals"] else record["users"]
+        record["userSketch"] = None
+        if users:
+            sketch = HyperLogLog()
+            sketch.update(users)
+            record["userSketch"] = sketch.to_dict()
+    state["version"] = 2
+    return state
+
+
+def _migrate_v2(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Version 2 kept an all-time user -> count dict; convert it to Space-Saving."""
+    top_users = SpaceSaving(TOP_USERS_CAPACITY)
+    for user_id, count in state["totals"].pop("users").items():
+        top_users.add(user_id, count)
+    state["totals"]["topUsers"] = top_users.to_dict() if len(top_users) else None
+    state["version"] = 3
+    return state
+
+
+class RollupStore:
+    """Incrementally maintained per-day rollups (in memory, optionally file-backed)."""
+
+    def __init__(self, path: Optional[str] = None, exact_users: bool = False):
+        """
+        Args:
+            path: JSON file to load from / save to (None: in memory only)
+            exact_users: Keep exact user sets next to the sketches (validation)
+        """
+        self.path = path
+        self.exact_users = exact_users
+        self._mtime = None
+        self._sketches = {}
+        self._top_users = None
+        self.state = _empty_state()
+        if path and os.path.exists(path):
+            self.load()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def load(self):
+        """Load the store from its file."""
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        if state.get("version") == 1:
+            state = _migrate_v1(state)
+        if state.get("version") == 2:
+            state = _migrate_v2(state)
+        if state.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported rollup format {state.get('version')!r} in {self.path}")
+        self.state = state
+        self._sketches = {}
+        self._top_users = None
+        self._mtime = os.path.getmtime(self.path)
+
+    def refresh(self) -> bool:
+        """Reload if the file was rewritten since the last load; True when reloaded."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        if os.path.getmtime(self.path) == self._mtime:
+            return False
+        self.load()
+        return True
+
+    def save(self):
+        """Write the store atomically (temp file + rename)."""
+        if not self.path:
+            raise ValueError("RollupStore has no path")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._flush_sketches()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".rollups-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.state, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._mtime = os.path.getmtime(self.path)
+
+    def reset(self):
+        """Drop all rollups and watermarks (the next ingest rebuilds everything)."""
+        self.state = _empty_state()
+        self._sketches = {}
+        self._top_users = None
+
+    # ------------------------------------------------------------------
+    # User sketches
+    # ------------------------------------------------------------------
+
+    def _sketch(self, key: str, record: Dict[str, Any], create: bool = False) -> Optional[HyperLogLog]:
+        """Decoded user sketch of a day record (or totals), cached until saved."""
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            if record["userSketch"] is not None:
+                sketch = HyperLogLog.from_dict(record["userSketch"])
+            elif create:
+                sketch = HyperLogLog(exact=self.exact_users)
+            else:
+                return None
+            self._sketches[key] = sketch
+        return sketch
+
+    def _users_summary(self) -> SpaceSaving:
+        """Decoded all-time top-users summary, cached until saved."""
+        if self._top_users is None:
+            data = self.state["totals"]["topUsers"]
+            self._top_users = SpaceSaving.from_dict(data) if data else SpaceSaving(TOP_USERS_CAPACITY)
+        return self._top_users
+
+    def _flush_sketches(self):
+        """Encode modified sketches back into their records."""
+        days = self.state["days"]
+        for key, sketch in self._sketches.items():
+            record = self.state["totals"] if key == "totals" else days[key]
+            record["userSketch"] = sketch.to_dict()
+        if self._top_users is not None:
+            self.state["totals"]["topUsers"] = self._top_users.to_dict()
+
+    # ------------------------------------------------------------------
+    # Ingestion
+    # ------------------------------------------------------------------
+
+    def watermark(self, stream: str) -> Optional[int]:
+        """_ts to fetch from (inclusive) for a stream; None before the first ingest."""
+        ts = self.state["watermarks"][stream]["ts"]
+        return ts or None
+
+    def new_documents(self, stream: str, docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Documents not yet ingested for a stream, oldest first."""
+        mark = self.state["watermarks"][stream]
+        seen_at_mark = set(mark["ids"])
+        fresh = []
+        for doc in docs:
+            ts = doc.get("_ts", 0) or 0
+            if ts < mark["ts"] or (ts == mark["ts"] and _doc_key(doc) in seen_at_mark):
+                continue
+            fresh.append(doc)
+        fresh.sort(key=lambda d: d.get("_ts", 0) or 0)
+        return fresh
+
+    def _advance(self, stream: str, docs: List[Dict[str, Any]]):
+        mark = self.state["watermarks"][stream]
+        for doc in docs:
+            ts = doc.get("_ts", 0) or 0
+            if ts > mark["ts"]:
+                mark["ts"] = ts
+                mark["ids"] = []
+            if ts == mark["ts"]:
+                mark["ids"].append(_doc_key(doc))
+
+    def _day(self, day: str) -> Dict[str, Any]:
+        days = self.state["days"]
+        if day not in days:
+            days[day] = _empty_day(day)
+        return days[day]
+
+    def ingest_adoption(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add production query documents (user_id/user_name, _ts, llm_telemetry).
+
+        Returns the number of documents added; already-ingested ones are skipped.
+        """
+        docs = self.new_documents("adoption", docs)
+        totals = self.state["totals"]
+        added = 0
+
+        total_sketch = self._sketch("totals", totals, create=True)
+        top_users = self._users_summary()
+
+        for doc in docs:
+            ts = doc.get("_ts", 0)
+            if not ts:
+                continue
+            user_id = str(doc.get("user_id") or doc.get("user_name") or "anonymous")
+            query_time = datetime.fromtimestamp(ts)
+            response_time = (doc.get("llm_telemetry") or {}).get("response_time_ms", 0)
+            day_key = query_time.strftime("%Y-%m-%d")
+            day = self._day(day_key)
+
+            for record in (day, totals):
+                record["queries"] += 1
+                record["hourly"][query_time.hour] += 1
+                if response_time and response_time > 0:
+                    record["responseTimeSum"] += response_time
+                    record["responseTimeCount"] += 1
+            top_users.add(user_id)
+            self._sketch(day_key, day, create=True).add(user_id)
+            total_sketch.add(user_id)
+            added += 1
+
+        self._advance("adoption", docs)
+        return added
+
+    def ingest_feedback(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add feedback documents (feedbackType, category, _ts, ...).
+
+        Categorize before ingesting: the category is fixed once counted.
+        Returns the number of documents added.
+        """
+        docs = self.new_documents("feedback", docs)
+        totals = self.state["totals"]["feedback"]
+        items = self.state["recentFeedback"]
+
+        for doc in docs:
+            feedback_type = doc.get("feedbackType", "unknown")
+            category = doc.get("category", "Uncategorized")
+            _add_feedback(totals, feedback_type, category)
+            # Feedback without _ts counts towards totals but has no day
+            ts = doc.get("_ts", 0)
+            if ts:
+                day = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+                _add_feedback(self._day(day)["feedback"], feedback_type, category)
+            items.append(feedback_item(doc))
+
+        items.sort(key=lambda x: x["timestamp"], reverse=True)
+        del items[MAX_FEEDBACK_ITEMS:]
+        self._advance("feedback", docs)
+        return len(docs)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def days_since(self, start: datetime) -> List[Dict[str, Any]]:
+        """Day records from start's (local) day onwards, oldest first."""
+        first_day = start.strftime("%Y-%m-%d")
+        days = self.state["days"]
+        return [days[d] for d in sorted(days) if d >= first_day]
+
+    def active_users(self, start: datetime) -> int:
+        """Distinct users from start's day onwards (union of the daily sketches)."""
+        sketches = [self._sketch(day["date"], day) for day in self.days_since(start)]
+        return HyperLogLog.union(s for s in sketches if s is not None).count()
+
+    def adoption_metrics(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        WAU/MAU, query trend and usage stats in the dashboard format.
+
+        Windows are day-aligned: WAU/MAU and the trend cover whole local
+        days from the day 7/30 days ago, read from at most 31 rollups.
+        """
+        now = now or datetime.now()
+        totals = self.state["totals"]
+        if not totals["queries"]:
+            return {
+                "wau": 0, "mau": 0, "stickiness": 0, "totalQueries": 0,
+                "totalUsers": 0, "queriesPerUser": 0, "avgResponseTimeMs": 0,
+                "peakHour": 0, "queryTrend": [], "topUsers": []
+            }
+
+        wau = self.active_users(now - timedelta(days=7))
+        mau = self.active_users(now - timedelta(days=30))
+        stickiness = round((wau / mau * 100), 1) if mau > 0 else 0
+
+        query_trend = [{"date": day["date"], "count": day["queries"]}
+                       for day in self.days_since(now - timedelta(days=30)) if day["queries"]]
+
+        total_users = self._sketch("totals", totals).count()
+        queries_per_user = round(totals["queries"] / total_users, 1) if total_users > 0 else 0
+        avg_response_time = (round(totals["responseTimeSum"] / totals["responseTimeCount"], 0)
+                             if totals["responseTimeCount"] else 0)
+
+        hourly = totals["hourly"]
+        peak_hour = max(range(24), key=lambda h: hourly[h])
+
+        top_users = []
+        for user_id, count in self._users_summary().top(10):
+            display_name = user_id[:8] + "..." if len(user_id) > 8 else user_id
+            top_users.append({"user": display_name, "queries": count})
+
+        return {
+            "wau": wau,
+            "mau": mau,
+            "stickiness": stickiness,
+            "totalQueries": totals["queries"],
+            "totalUsers": total_users,
+            "queriesPerUser": queries_per_user,
+            "avgResponseTimeMs": avg_response_time,
+            "peakHour": peak_hour,
+            "queryTrend": query_trend,
+            "topUsers": top_users
+        }
+
+    def feedback_metrics(self, now: Optional[datetime] = None, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Feedback summary, trend, categories and recent items.
+
+        By default the summary and categories are all-time and the trend
+        covers 30 days. With start and/or end, all three are summed from the
+        day rollups from start's day through end's day.
+        """
+        now = now or datetime.now()
+        if start or end:
+            days = self.days_since(start) if start else [self.state["days"][d] for d in sorted(self.state["days"])]
+            if end:
+                last_day = end.strftime("%Y-%m-%d")
+                days = [day for day in days if day["date"] <= last_day]
+            totals = {"total": 0, "thumbsUp": 0, "thumbsDown": 0, "categories": {}}
+            for day in days:
+                tally = day["feedback"]
+                totals["total"] += tally["total"]
+                totals["thumbsUp"] += tally["thumbsUp"]
+                totals["thumbsDown"] += tally["thumbsDown"]
+                for category, count in tally["categories"].items():
+                    totals["categories"][category] = totals["categories"].get(category, 0) + count
+        else:
+            days = self.days_since(now - timedelta(days=30))
+            totals = self.state["totals"]["feedback"]
+        total = totals["total"]
+        if not total:
+            return {
+                "summary": {"total": 0, "thumbsUp": 0, "thumbsDown": 0, "positiveRate": 0},
+                "trend": [],
+                "categoryBreakdown": [],
+                "feedbackItems": []
+            }
+
+        feedback_trend = [
+            {"date": day["date"],
+             "positive": day["feedback"]["thumbsUp"],
+             "negative": day["feedback"]["total"] - day["feedback"]["thumbsUp"]}
+            for day in days if day["feedback"]["total"]
+        ]
+
+        category_breakdown = [
+            {"category": k, "count": v}
+            for k, v in sorted(totals["categories"].items(), key=lambda x: -x[1])
+        ]
+
+        return {
+            "summary": {
+                "total": total,
+                "thumbsUp": totals["thumbsUp"],
+                "thumbsDown": totals["thumbsDown"],
+                "positiveRate": round(totals["thumbsUp"] / total * 100, 1)
+            },
+            "trend": feedback_trend,
+            "categoryBreakdown": category_breakdown,
+            "feedbackItems": list(self.state["recentFeedback"])
+        }
@@ -0,0 +1,89 @@
+"""
+Static file serving for the built React app.
+
+- Content-hashed assets (assets/index-DsZqIbO3.js) never change under the
+  same name, so they are served with a one-year immutable Cache-Control.
+  Everything else (index.html, version.txt, ...) is revalidated on each
+  load (no-cache + ETag, so an unchanged file costs a 304).
+- Precompressed variants written at build time by
+  scripts/precompress_assets.py (file.js.br / file.js.gz) are served when
+  the client accepts them, so nothing is compressed per request.
+"""
+
+import mimetypes
+import os
+import re
+import stat
+
+import anyio.to_thread
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+# Vite appends an 8-character content hash: index-DsZqIbO3.js, index-Da0W--Vk.js
+HASHED_ASSET_RE = re.compile(r"(^|/)assets/.+-[A-Za-z0-9_-]{8}\.[a-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Preferred first
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def cache_control_for(path: str) -> str:
+    """Cache-Control value for a path relative to the static directory."""
+    if HASHED_ASSET_RE.search(path.replace(os.sep, "/")):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+
+def _accepted_encodings(scope: Scope) -> set:
+    accept = Headers(scope=scope).get("accept-encoding", "")
+    encodings = set()
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with cache headers and precompressed (.br/.gz) variants."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await self._precompressed_response(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            served = "index.html" if path in (".", "") else path
+            response.headers.setdefault("cache-control", cache_control_for(served))
+            response.headers.setdefault("vary", "Accept-Encoding")
+        return response
+
+    async def _precompressed_response(self, path: str, scope: Scope):
+        """Response for path.br / path.gz if present and accepted, else None."""
+        if scope["method"] not in ("GET", "HEAD") or path in (".", ""):
+            return None
+        accepted = _accepted_encodings(scope)
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            except (OSError, ValueError):
+                return None
+            if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            media_type = mimetypes.guess_type(path)[0] or "text/plain"
+            response = FileResponse(
+                full_path,
+                stat_result=stat_result,
+                media_type=media_type,
+                headers={"content-encoding": encoding, "vary": "Accept-Encoding"},
+            )
+            if self.is_not_modified(response.headers, Headers(scope=scope)):
+                return NotModifiedResponse(response.headers)
+            return response
+        return None
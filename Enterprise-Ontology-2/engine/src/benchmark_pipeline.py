@@ -0,0 +1,602 @@
+"""
+Pipeline Benchmark
+
+Replays recorded queries through each stage of the query rewrite pipeline
+(normalize, match, disambiguate, expand, telemetry) against synthetic
+lexicons of increasing size, and reports throughput and p50/p95/p99 per stage.
+
+Results are written to JSON and can be compared against a stored baseline;
+the run fails (exit code 1) when any stage regresses past the threshold.
+
+With --import-time it also measures cold start: importing the rewriter
+in a fresh interpreter, and the first rewrite after that import.
+
+Usage:
+    python src/benchmark_pipeline.py --sizes 28,1000,10000
+    python src/benchmark_pipeline.py --import-time --sizes 28
+    python src/benchmark_pipeline.py --memory 100000 --sizes 28
+    python src/benchmark_pipeline.py --serialization --sizes 28
+    python src/benchmark_pipeline.py --telemetry-sinks 20000 --sizes 28
+    python src/benchmark_pipeline.py --save-baseline benchmarks/baseline.json
+    python src/benchmark_pipeline.py --baseline benchmarks/baseline.json --threshold 0.15
+"""
+
+import argparse
+import copy
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from disambiguation_rules import Disambiguator, compile_disambiguation_rules
+from query_rewriter_v2_enhanced import (
+    expand_entities,
+    load_lexicon,
+    match_entities,
+    normalize_query,
+    rewrite_query,
+)
+from rewriter_engine import CompiledLexicon, RewriterEngine
+from serialization import BACKEND, TelemetryRecordEncoder, dumps
+from telemetry_logger import TelemetryLogger
+from telemetry_sqlite import to_epoch_us
+
+__version__ = "0.1.0"
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..', '..'))
+
+DEFAULT_QUERY_FILES = [
+    os.path.join(REPO_ROOT, 'query_analysis.csv'),
+    os.path.join(REPO_ROOT, 'baseline_evaluation_results.csv'),
+]
+DEFAULT_SIZES = [28, 100, 1000, 10000]
+
+# Metrics compared against the baseline: (name, True if higher is worse)
+GATED_METRICS = [
+    ('p95_ms', True),
+    ('throughput_qps', False),
+]
+# Stages with too few samples for tail percentiles are gated on these instead
+STAGE_GATED_METRICS = {
+    'compile': [('p50_ms', True)],
+}
+# Compiling the lexicon is one call per size, so it is repeated at least this often
+COMPILE_REPEATS = 20
+
+
+def load_benchmark_queries(paths: List[str] = None) -> List[str]:
+    """
+    Load replay queries from the analysis CSVs
+
+    Reads the 'conversation' column (query_analysis.csv) or the
+    'query' column (baseline_evaluation_results.csv).
+    """
+    queries = []
+    for path in paths or DEFAULT_QUERY_FILES:
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    text = row.get('conversation') or row.get('query')
+                    if text and text.strip():
+                        queries.append(text)
+        except FileNotFoundError:
+            print(f"WARNING: Query file not found at {path}")
+    return queries
+
+
+def build_synthetic_lexicon(base_lexicon: dict, size: int) -> dict:
+    """
+    Pad (or trim) the runtime artifact to `size` entities
+
+    Synthetic entities carry two synonyms and two related terms each, so
+    matching cost grows the way it would with a real, larger vocabulary.
+    Each also gets a disambiguation rule (its synonyms and related terms as
+    indicators), so the disambiguate stage grows with the lexicon too.
+    """
+    lexicon = copy.deepcopy(base_lexicon)
+    entities = lexicon['entities']
+
+    if size <= len(entities):
+        lexicon['entities'] = dict(list(entities.items())[:size])
+    else:
+        padding = size - len(entities)
+        for i in range(padding):
+            entities[f"SYN{i:05d}"] = {
+                'type': 'synthetic',
+                'category': 'benchmark',
+                'synonyms': [f"synthetic term {i}", f"st{i}"],
+                'related_terms': [f"synthetic related {i}", f"sr{i}"],
+                'definition': ''
+            }
+        synthetic = compile_disambiguation_rules([
+            {'term': f"st{i}", 'contexts': [
+                {'context': f"SYN{i:05d}", 'type': 'synthetic', 'priority': 1,
+                 'indicators': [f"synthetic term {i}", f"synthetic related {i}", f"sr{i}"]}
+            ]}
+            for i in range(padding)
+        ])
+        rules = lexicon.setdefault('disambiguation', {'terms': {}, 'indicator_index': {}})
+        rules['terms'].update(synthetic['terms'])
+        for phrase, postings in synthetic['indicator_index'].items():
+            rules['indicator_index'].setdefault(phrase, []).extend(postings)
+
+    lexicon['entity_count'] = len(lexicon['entities'])
+    return lexicon
+
+
+def time_stage(func: Callable, inputs: list, repeats: int = 1) -> Dict:
+    """
+    Time func(*args) for every args tuple in inputs
+
+    Returns:
+        {'calls', 'throughput_qps', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}
+    """
+    perf_counter_ns = time.perf_counter_ns
+    samples = np.empty(len(inputs) * repeats, dtype=np.int64)
+
+    i = 0
+    for _ in range(repeats):
+        for args in inputs:
+            start = perf_counter_ns()
+            func(*args)
+            samples[i] = perf_counter_ns() - start
+            i += 1
+
+    samples_ms = samples / 1e6
+    total_seconds = samples.sum() / 1e9
+    return {
+        'calls': int(len(samples)),
+        'throughput_qps': float(len(samples) / total_seconds) if total_seconds > 0 else 0.0,
+        'mean_ms': float(np.mean(samples_ms)),
+        'p50_ms': float(np.percentile(samples_ms, 50)),
+        'p95_ms': float(np.percentile(samples_ms, 95)),
+        'p99_ms': float(np.percentile(samples_ms, 99)),
+        'max_ms': float(np.max(samples_ms)),
+    }
+
+
+def benchmark_lexicon(queries: List[str], lexicon: dict, telemetry_path: str,
+                      repeats: int = 1) -> Dict[str, Dict]:
+    """Run every pipeline stage over the queries for one lexicon"""
+    disambiguator = Disambiguator.from_artifact(lexicon)
+    telemetry = TelemetryLogger(telemetry_path)
+
+    normalized = [normalize_query(q) for q in queries]
+    matched = [match_entities(n, lexicon) for n in normalized]
+    rewritten = [rewrite_query(q, lexicon) for q in queries]
+
+    # Warm up the compiled engine and lazy imports before timing
+    for q, n in zip(queries[:50], normalized[:50]):
+        rewrite_query(q, lexicon)
+        match_entities(n, lexicon)
+
+    stages = {
+        'compile': time_stage(CompiledLexicon, [(lexicon,)], max(repeats, COMPILE_REPEATS)),
+        'normalize': time_stage(normalize_query, [(q,) for q in queries], repeats),
+        'match': time_stage(match_entities, [(n, lexicon) for n in normalized], repeats),
+        'disambiguate': time_stage(disambiguator.get_disambiguation_context,
+                                   [(q,) for q in queries], repeats),
+        'expand': time_stage(expand_entities, [(m, lexicon) for m in matched], repeats),
+        'telemetry': time_stage(
+            telemetry.log_query,
+            [(f"bench_{i}", 'benchmark_user', q, r, {'time_ms': 0.0})
+             for i, (q, r) in enumerate(zip(queries, rewritten))],
+            repeats
+        ),
+        'end_to_end': time_stage(rewrite_query, [(q, lexicon) for q in queries], repeats),
+    }
+    return stages
+
+
+def run_benchmark(queries: List[str], sizes: List[int] = None,
+                  lexicon_path: str = 'data/ontology_runtime.json',
+                  repeats: int = 1) -> Dict:
+    """
+    Sweep lexicon sizes and benchmark every stage
+
+    Returns:
+        {'meta': {...}, 'results': {size: {stage: stats}}}
+    """
+    base_lexicon = load_lexicon(lexicon_path)
+    if not base_lexicon:
+        raise RuntimeError(f"Could not load lexicon from {lexicon_path}")
+
+    sizes = sizes or DEFAULT_SIZES
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            lexicon = build_synthetic_lexicon(base_lexicon, size)
+            telemetry_path = os.path.join(tmp_dir, f'telemetry_{size}.jsonl')
+            print(f"Benchmarking {lexicon['entity_count']} entities "
+                  f"x {len(queries)} queries...")
+            results[str(size)] = benchmark_lexicon(queries, lexicon, telemetry_path, repeats)
+
+    return {
+        'meta': {
+            'benchmark_version': __version__,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'query_count': len(queries),
+            'repeats': repeats,
+            'sizes': sizes,
+        },
+        'results': results,
+    }
+
+
+# Run in a fresh interpreter: time the import, then the first rewrite
+_COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module} as rewriter
+imported = time.perf_counter()
+lexicon = rewriter.load_lexicon()
+loaded = time.perf_counter()
+rewriter.rewrite_query('Is SF available at DFW10?', lexicon)
+done = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - start) * 1000,
+                  'first_rewrite_ms': (done - loaded) * 1000}}))
+"""
+
+
+def benchmark_import_time(module: str = 'query_rewriter_v2_enhanced', runs: int = 5) -> Dict:
+    """
+    Measure cold start of the rewriter in fresh interpreters
+
+    Returns:
+        {'module', 'runs', 'import_ms', 'first_rewrite_ms'} (medians)
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = SCRIPT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    samples = {'import_ms': [], 'first_rewrite_ms': []}
+
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _COLD_START_SCRIPT.format(module=module)],
+            cwd=os.path.dirname(SCRIPT_DIR), env=env,
+            capture_output=True, text=True, check=True
+        ).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        for key in samples:
+            samples[key].append(timings[key])
+
+    return {
+        'module': module,
+        'runs': runs,
+        **{key: float(np.median(values)) for key, values in samples.items()}
+    }
+
+
+def benchmark_result_memory(queries: List[str], lexicon: dict, count: int = 50000) -> Dict:
+    """
+    Memory and time of retained rewrite output: dicts vs RewriteResult records
+
+    Rewrites `count` queries (cycling through the replay set) and keeps
+    every result alive, as a batch job would. Disambiguation is off so
+    only the rewrite output itself is measured.
+
+    Returns:
+        {'count', 'dict': {...}, 'record': {...}} with bytes_per_result,
+        mb_per_million and us_per_rewrite for each form
+    """
+    engine = RewriterEngine(lexicon)
+    batch = [queries[i % len(queries)] for i in range(count)]
+    forms = {
+        'dict': lambda q: engine.rewrite(q, use_disambiguation=False),
+        'record': lambda q: engine.rewrite_record(q, use_disambiguation=False),
+    }
+    report = {'count': count}
+
+    for name, rewrite in forms.items():
+        for q in batch[:100]:
+            rewrite(q)
+
+        # Timed without tracemalloc, which slows every allocation
+        start = time.perf_counter()
+        results = [rewrite(q) for q in batch]
+        elapsed = time.perf_counter() - start
+        del results
+
+        tracemalloc.start()
+        baseline_bytes = tracemalloc.get_traced_memory()[0]
+        results = [rewrite(q) for q in batch]
+        retained = tracemalloc.get_traced_memory()[0] - baseline_bytes
+        tracemalloc.stop()
+        del results
+
+        report[name] = {
+            'bytes_per_result': retained / count,
+            'mb_per_million': retained / count * 1e6 / 2**20,
+            'us_per_rewrite': elapsed / count * 1e6
+        }
+    return report
+
+
+def benchmark_serialization(queries: List[str], lexicon: dict, count: int = 50000) -> Dict:
+    """
+    Telemetry line encoding throughput on one core
+
+    Compares json.dumps of a fresh record dict (the previous TelemetryLogger
+    path) against TelemetryRecordEncoder fed with RewriteResult records.
+
+    Returns:
+        {'backend', 'count', 'json_dumps': {...}, 'record_encoder': {...}}
+        with mb_per_sec and records_per_sec for each encoder
+    """
+    engine = RewriterEngine(lexicon)
+    records = [engine.rewrite_record(queries[i % len(queries)], use_disambiguation=False)
+               for i in range(count)]
+    timestamp = datetime.now(timezone.utc).isoformat()
+    stages = {'normalize': 0.0021, 'match': 0.0113, 'expand': 0.0019}
+    metadata = {'has_disambiguation': False, 'lexicon_version': lexicon.get('version')}
+
+    def encode_json_dumps(i, r):
+        return (json.dumps({
+            'query_id': f"query_{i}", 'user_id_hash': 'ebab270a7734bf8f', 'timestamp': timestamp,
+            'original_query': r.original_query, 'matched_entities': list(r.matched_entities),
+            'expanded_terms': [t.to_dict() for t in r.expanded_terms],
+            'expansion_count': r.expansion_count, 'query_rewrite_time_ms': 0.0421,
+            'stage_timings_ms': stages, 'retrieval_time_ms': None, 'generation_time_ms': None,
+            'first_answer_success': None, 'user_feedback': None, 'metadata': metadata
+        }) + '\n').encode('utf-8')
+
+    encoder = TelemetryRecordEncoder()
+
+    def encode_record(i, r):
+        return encoder.encode(f"query_{i}", 'ebab270a7734bf8f', timestamp, r.original_query,
+                              r.matched_entities, r.expanded_terms, r.expansion_count, 0.0421,
+                              stages, metadata)
+
+    report = {'backend': BACKEND, 'count': count}
+    for name, encode in (('json_dumps', encode_json_dumps), ('record_encoder', encode_record)):
+        start = time.perf_counter()
+        total_bytes = sum(len(encode(i, r)) for i, r in enumerate(records))
+        elapsed = time.perf_counter() - start
+        report[name] = {
+            'mb_per_sec': total_bytes / elapsed / 2**20,
+            'records_per_sec': count / elapsed,
+            'bytes_per_record': total_bytes / count
+        }
+    report['api_payload_bytes'] = len(dumps([r.to_dict() for r in records[:1000]]))
+    return report
+
+
+def benchmark_telemetry_sinks(queries: List[str], lexicon: dict, count: int = 20000,
+                              repeats: int = 5) -> Dict:
+    """
+    Telemetry insert throughput and query latency: JSONL vs SQLite
+
+    Logs `count` RewriteResult records through TelemetryLogger with each
+    sink, then times the same questions against both: get_statistics(),
+    the 100 newest records, zero-match queries in the newest 10% of the
+    window and queries that matched the most common entity in that window.
+    JSONL answers the window questions by scanning; SQLite uses its indexes.
+
+    Returns:
+        {'count', 'jsonl': {...}, 'sqlite': {...}} with records_per_sec,
+        bytes_on_disk and the median latency (ms) of each query
+    """
+    engine = RewriterEngine(lexicon)
+    records = [engine.rewrite_record(queries[i % len(queries)], use_disambiguation=False)
+               for i in range(count)]
+    entity_counts = Counter(e for r in records for e in r.matched_entities)
+    entity = entity_counts.most_common(1)[0][0] if entity_counts else None
+
+    report = {'count': count, 'entity': entity}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for sink in ('jsonl', 'sqlite'):
+            logger = TelemetryLogger(os.path.join(tmp_dir, sink, 'telemetry_logs.jsonl'), sink=sink)
+            start = time.perf_counter()
+            for i, r in enumerate(records):
+                logger.log_query(f"query_{i}", f"user_{i % 1000}", r.original_query, r,
+                                 {'time_ms': 0.0421})
+            logger.flush()
+            elapsed = time.perf_counter() - start
+
+            timestamps = [log['timestamp'] for log in logger.iter_logs()]
+            since = timestamps[int(len(timestamps) * 0.9)]
+            since_us = to_epoch_us(since)
+
+            if sink == 'sqlite':
+                db = logger.sqlite_sink
+                questions = {
+                    'statistics': logger.get_statistics,
+                    'newest_100': lambda: logger.read_logs(limit=100),
+                    'zero_match_window': lambda: db.zero_match_queries(start=since, limit=None),
+                    'entity_window': lambda: db.entity_queries(entity, start=since, limit=None)
+                }
+                size = sum(os.path.getsize(db.path + suffix) for suffix in ('', '-wal')
+                           if os.path.exists(db.path + suffix))
+            else:
+                questions = {
+                    'statistics': logger.get_statistics,
+                    'newest_100': lambda: logger.read_logs(limit=100),
+                    'zero_match_window': lambda: [
+                        log for log in logger.iter_logs()
+                        if not log['matched_entities'] and to_epoch_us(log['timestamp']) >= since_us],
+                    'entity_window': lambda: [
+                        log for log in logger.iter_logs()
+                        if entity in log['matched_entities'] and to_epoch_us(log['timestamp']) >= since_us]
+                }
+                size = os.path.getsize(logger.storage_path)
+
+            latencies = {}
+            for name, question in questions.items():
+                samples = []
+                for _ in range(repeats):
+                    t0 = time.perf_counter()
+                    question()
+                    samples.append((time.perf_counter() - t0) * 1000)
+                latencies[name] = float(np.median(samples))
+            report[sink] = {
+                'records_per_sec': count / elapsed,
+                'bytes_on_disk': size,
+                'query_ms': latencies
+            }
+            logger.close()
+    return report
+
+
+def compare_to_baseline(current: Dict, baseline: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    Compare a benchmark run against a stored baseline
+
+    Args:
+        current: Output of run_benchmark()
+        baseline: Previously saved output of run_benchmark()
+        threshold: Allowed relative change (0.10 = 10% worse)
+
+    Returns:
+        List of regressions: {'size', 'stage', 'metric', 'baseline', 'current', 'change'}
+    """
+    regressions = []
+    for size, stages in current['results'].items():
+        baseline_stages = baseline.get('results', {}).get(size, {})
+        for stage, stats in stages.items():
+            baseline_stats = baseline_stages.get(stage)
+            if not baseline_stats:
+                continue
+
+            for metric, higher_is_worse in STAGE_GATED_METRICS.get(stage, GATED_METRICS):
+                old, new = baseline_stats.get(metric), stats.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                worse = change if higher_is_worse else -change
+                if worse > threshold:
+                    regressions.append({
+                        'size': size,
+                        'stage': stage,
+                        'metric': metric,
+                        'baseline': old,
+                        'current': new,
+                        'change': change
+                    })
+    return regressions
+
+
+def print_results(report: Dict):
+    """Print a per-size, per-stage results table"""
+    print("\n" + "="*78)
+    print("PIPELINE BENCHMARK")
+    print("="*78)
+    for size, stages in report['results'].items():
+        print(f"\nLexicon size: {size}")
+        print(f"  {'stage':<14}{'qps':>12}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+        for stage, stats in stages.items():
+            print(f"  {stage:<14}{stats['throughput_qps']:>12.0f}{stats['p50_ms']:>12.4f}"
+                  f"{stats['p95_ms']:>12.4f}{stats['p99_ms']:>12.4f}")
+    print("\n" + "="*78)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the query rewrite pipeline")
+    parser.add_argument('--queries', nargs='*', default=None,
+                        help="CSV files with a 'conversation' or 'query' column")
+    parser.add_argument('--limit', type=int, default=None,
+                        help="Replay at most this many queries")
+    parser.add_argument('--lexicon', default='data/ontology_runtime.json')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated synthetic lexicon sizes")
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--output', default='outputs/benchmark_results.json')
+    parser.add_argument('--baseline', help="Baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Allowed relative regression (default: 0.10)")
+    parser.add_argument('--save-baseline', help="Also write the results to this path")
+    parser.add_argument('--import-time', action='store_true',
+                        help="Also measure rewriter import time and first-rewrite latency")
+    parser.add_argument('--serialization', type=int, nargs='?', const=50000, default=None,
+                        metavar='COUNT',
+                        help="Also measure telemetry encoding throughput (bytes/sec/core)")
+    parser.add_argument('--memory', type=int, nargs='?', const=50000, default=None,
+                        metavar='COUNT',
+                        help="Also compare retained memory of dict vs record results")
+    parser.add_argument('--telemetry-sinks', type=int, nargs='?', const=20000, default=None,
+                        metavar='COUNT',
+                        help="Also compare JSONL vs SQLite telemetry inserts and queries")
+    args = parser.parse_args(argv)
+
+    queries = load_benchmark_queries(args.queries)[:args.limit]
+    if not queries:
+        print("ERROR: No queries to replay")
+        return 1
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    report = run_benchmark(queries, sizes, args.lexicon, args.repeats)
+    print_results(report)
+
+    if args.import_time:
+        report['cold_start'] = benchmark_import_time()
+        print(f"Cold start: import {report['cold_start']['import_ms']:.1f}ms, "
+              f"first rewrite {report['cold_start']['first_rewrite_ms']:.1f}ms")
+
+    if args.memory:
+        report['result_memory'] = benchmark_result_memory(queries, load_lexicon(args.lexicon),
+                                                          args.memory)
+        for form in ('dict', 'record'):
+            stats = report['result_memory'][form]
+            print(f"Result memory ({form}): {stats['bytes_per_result']:.0f} B/result, "
+                  f"{stats['mb_per_million']:.0f} MB per 1M rewrites, "
+                  f"{stats['us_per_rewrite']:.2f}us/rewrite")
+
+    if args.serialization:
+        report['serialization'] = benchmark_serialization(queries, load_lexicon(args.lexicon),
+                                                          args.serialization)
+        for name in ('json_dumps', 'record_encoder'):
+            stats = report['serialization'][name]
+            print(f"Telemetry encoding ({name}, {report['serialization']['backend']}): "
+                  f"{stats['mb_per_sec']:.1f} MB/s/core, {stats['records_per_sec']:.0f} records/s")
+
+    if args.telemetry_sinks:
+        report['telemetry_sinks'] = benchmark_telemetry_sinks(queries, load_lexicon(args.lexicon),
+                                                              args.telemetry_sinks)
+        for sink in ('jsonl', 'sqlite'):
+            stats = report['telemetry_sinks'][sink]
+            latencies = ', '.join(f"{name} {ms:.1f}ms" for name, ms in stats['query_ms'].items())
+            print(f"Telemetry sink ({sink}): {stats['records_per_sec']:.0f} records/s, "
+                  f"{stats['bytes_on_disk'] / 2**20:.1f} MB; {latencies}")
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {path}")
+
+    if args.baseline:
+        try:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"ERROR: Baseline not found at {args.baseline}")
+            return 1
+
+        regressions = compare_to_baseline(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for r in regressions:
+                print(f"  size={r['size']} {r['stage']}.{r['metric']}: "
+                      f"{r['baseline']:.4f} -> {r['current']:.4f} ({r['change']:+.1%})")
+            return 1
+        print(f"\n✓ No regressions beyond {args.threshold:.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
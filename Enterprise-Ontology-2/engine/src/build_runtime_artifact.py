@@ -3,9 +3,24 @@ import json
 from datetime import datetime
 import os
 
+from disambiguation_rules import compile_disambiguation_rules, load_index_map
+from lexicon_validator import (
+    FAIL_ON_CHOICES,
+    SEVERITY_INFO,
+    SEVERITY_WARNING,
+    build_lookup,
+    count_by_severity,
+    format_issues,
+    should_fail,
+    validate_lexicon,
+)
+
 def build_runtime_artifact(
     lexicon_path='data/lexicon_v01_final.yaml',
-    output_path='data/ontology_runtime.json'
+    output_path='data/ontology_runtime.json',
+    index_map_path='data/entity_to_index.yaml',
+    fail_on='error',
+    severities=None
 ):
     """
     Convert lexicon YAML to optimized JSON runtime artifact
@@ -16,6 +31,13 @@ def build_runtime_artifact(
     - technical_terms
     - partners
     - geographic_terms
+    - disambiguation (compiled into an indicator index)
+    
+    The lexicon is validated first (see lexicon_validator.py); the build
+    fails if any issue is at or above `fail_on` ('error', 'warning',
+    'info' or 'never'). `severities` overrides the severity per issue code.
+    The artifact carries a conflict-free 'lookup' table (term key -> one
+    entity) used by the matcher.
     """
     print(f"Loading lexicon from {lexicon_path}...")
     
@@ -30,6 +52,17 @@ def build_runtime_artifact(
         print(f"ERROR: Invalid YAML format: {e}")
         return None
     
+    # Validate before building: collisions would otherwise be resolved by dict order
+    issues = validate_lexicon(lexicon, severities)
+    counts = count_by_severity(issues)
+    print(f"Validation: {counts['error']} errors, {counts['warning']} warnings, {counts['info']} info")
+    report = format_issues(issues, SEVERITY_INFO if fail_on == 'info' else SEVERITY_WARNING)
+    if report:
+        print(report)
+    if should_fail(issues, fail_on):
+        print(f"ERROR: Lexicon validation failed (fail_on={fail_on})")
+        return None
+    
     # Build runtime structure
     runtime = {
         'version': lexicon.get('version', '0.1'),
@@ -105,6 +138,13 @@ def build_runtime_artifact(
                 }
     
     runtime['entity_count'] = len(runtime['entities'])
+    runtime['lookup'] = build_lookup(runtime['entities'])
+    runtime['validation'] = {'fail_on': fail_on, 'issues': counts}
+    
+    # Compile disambiguation rules (indexes attached from entity_to_index.yaml)
+    runtime['disambiguation'] = compile_disambiguation_rules(
+        lexicon.get('disambiguation', []), load_index_map(index_map_path)
+    )
     
     # Create output directory if it doesn't exist
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -125,6 +165,8 @@ def build_runtime_artifact(
     print(f"Version: {runtime['version']}")
     print(f"Domain: {runtime['domain']}")
     print(f"Entities: {runtime['entity_count']}")
+    print(f"Lookup terms: {len(runtime['lookup'])}")
+    print(f"Disambiguation rules: {len(runtime['disambiguation']['terms'])}")
     print(f"File: {output_path}")
     
     # Calculate file size
@@ -136,7 +178,16 @@ def build_runtime_artifact(
 
 
 if __name__ == "__main__":
-    artifact = build_runtime_artifact()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the ontology runtime artifact")
+    parser.add_argument('--lexicon', default='data/lexicon_v01_final.yaml')
+    parser.add_argument('--output', default='data/ontology_runtime.json')
+    parser.add_argument('--fail-on', choices=FAIL_ON_CHOICES, default='error',
+                        help="Lowest validation severity that fails the build")
+    args = parser.parse_args()
+
+    artifact = build_runtime_artifact(args.lexicon, args.output, fail_on=args.fail_on)
     if artifact:
         print("✅ Build completed successfully")
     else:
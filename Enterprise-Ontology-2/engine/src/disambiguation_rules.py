@@ -1,76 +1,282 @@
 """
 Disambiguation Rules
 Handles ambiguous terms using context keywords.
+
+Rules come from the `disambiguation:` section of the lexicon YAML. The
+artifact builder compiles them into an indicator -> (term, meaning, priority)
+index. A query is disambiguated in one pass over its token n-grams, one
+dict lookup each. Words that are not themselves rule words are matched
+through explicit variants: a plural ('racks' -> 'rack'), a number-prefixed
+unit ('500kw' -> 'kw') or a compound of two rule words ('servicefabric' ->
+'service' + 'fabric'). Arbitrary substrings do not match, so 'sf' does not
+fire inside 'transfer'.
+
+Meaning keys keep the original snake_case names ('power_capacity',
+'space_capacity'); the lexicon's context name is kept as 'label'.
+
+An artifact without a compiled section falls back to compiling the
+lexicon YAML and entity_to_index.yaml, the same inputs the builder uses.
 """
 
+import json
+import os
 import re
+from functools import lru_cache
 
-class Disambiguator:
-    def __init__(self):
-        """Initialize with ambiguous terms and their indicators"""
-        self.ambiguous_terms = {
-            'fabric': {
-                'meanings': {
-                    'ServiceFabric': {
-                        'type': 'product',
-                        'indicators': ['sf', 'virtual', 'interconnect', 'cloud', 'service', 'available', 'pricing'],
-                        'indexes': ['service-fabric-index']
-                    }
-                }
-            },
-            'capacity': {
-                'meanings': {
-                    'power_capacity': {
-                        'type': 'power',
-                        'indicators': ['power', 'kw', 'mw', 'electrical', 'watt', 'kilowatt', 'megawatt', 'generator'],
-                        'indexes': ['additional-properties']
-                    },
-                    'space_capacity': {
-                        'type': 'space',
-                        'indicators': ['rack', 'cage', 'cabinet', 'square', 'feet', 'space', 'sqft'],
-                        'indexes': ['additional-properties']
-                    }
-                }
-            }
+from tracing import NULL_TRACE
+
+# Word characters, used to normalize terms and indicators
+_TOKEN_RE = re.compile(r'\w+')
+
+def _phrase(text: str) -> str:
+    """Normalize a term or indicator to space-joined lowercase tokens"""
+    return ' '.join(_TOKEN_RE.findall(str(text).lower()))
+
+
+def _meaning_key(name: str) -> str:
+    """Meaning key for a lexicon context name ('power capacity' -> 'power_capacity')"""
+    return '_'.join(str(name).split())
+
+
+def _indexes_for(name: str, index_map: dict) -> list:
+    """Search indexes for an entity/term from entity_to_index.yaml"""
+    entry = index_map.get(name) or {}
+    indexes = []
+    if entry.get('primary_index'):
+        indexes.append(entry['primary_index'])
+    indexes.extend(entry.get('secondary_indexes') or [])
+    return indexes
+
+
+def compile_disambiguation_rules(rules: list, index_map: dict = None) -> dict:
+    """
+    Compile lexicon disambiguation rules into an indicator lookup index
+
+    Args:
+        rules: The lexicon's `disambiguation:` list
+        index_map: Parsed entity_to_index.yaml (optional), used to attach
+            search indexes to each context
+
+    Returns:
+        {
+            'terms': {term: {'contexts': [{'context', 'label', 'type', 'priority',
+                                           'indicators', 'indexes', ...}]}},
+            'indicator_index': {phrase: [[term, meaning key, priority], ...]}
         }
+    """
+    index_map = index_map or {}
+    terms = {}
+    indicator_index = {}
+
+    for rule in rules or []:
+        term = _phrase(rule.get('term', ''))
+        if not term:
+            continue
+
+        contexts = []
+        for ctx in rule.get('contexts', []):
+            name = ctx.get('context')
+            if not name:
+                continue
+            meaning = _meaning_key(name)
+            priority = int(ctx.get('priority', len(contexts) + 1))
+            indicators = []
+            for indicator in ctx.get('indicators', []):
+                phrase = _phrase(indicator)
+                if phrase and phrase not in indicators:
+                    indicators.append(phrase)
+                    indicator_index.setdefault(phrase, []).append([term, meaning, priority])
+
+            compiled = {
+                'context': meaning,
+                'label': name,
+                'type': ctx.get('type', ''),
+                'priority': priority,
+                'indicators': indicators,
+                'indexes': _indexes_for(name, index_map) or _indexes_for(rule['term'], index_map)
+            }
+            # Keep any extra rule fields (e.g. 'unit')
+            for key, value in ctx.items():
+                compiled.setdefault(key, value)
+            contexts.append(compiled)
+
+        contexts.sort(key=lambda c: c['priority'])
+        terms[term] = {'contexts': contexts}
+
+    # Deterministic order within each indicator's postings
+    for postings in indicator_index.values():
+        postings.sort(key=lambda p: (p[0], p[2], p[1]))
+
+    return {
+        'terms': terms,
+        'indicator_index': indicator_index
+    }
+
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def _default_artifact_path() -> str:
+    return os.path.join(_DATA_DIR, 'ontology_runtime.json')
+
+
+def load_index_map(index_map_path: str) -> dict:
+    """Parsed entity_to_index.yaml ({} with a warning if it is missing)"""
+    import yaml
+
+    try:
+        with open(index_map_path, 'r') as f:
+            return yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        print(f"WARNING: Index map not found at {index_map_path}, contexts will have no indexes")
+        return {}
+
+
+def compile_lexicon_rules(lexicon_path: str = None, index_map_path: str = None) -> dict:
+    """
+    Compile the `disambiguation:` section of a lexicon YAML file
+
+    Same inputs as build_runtime_artifact (default: engine/data/
+    lexicon_v01_final.yaml and entity_to_index.yaml).
+    """
+    import yaml
+
+    lexicon_path = lexicon_path or os.path.join(_DATA_DIR, 'lexicon_v01_final.yaml')
+    index_map_path = index_map_path or os.path.join(_DATA_DIR, 'entity_to_index.yaml')
+    with open(lexicon_path, 'r') as f:
+        lexicon = yaml.safe_load(f) or {}
+    return compile_disambiguation_rules(lexicon.get('disambiguation', []),
+                                        load_index_map(index_map_path))
+
+
+@lru_cache(maxsize=1)
+def _fallback_rules() -> dict:
+    """Rules for artifacts without a compiled section, compiled from the lexicon YAML"""
+    try:
+        return compile_lexicon_rules()
+    except (OSError, ImportError) as e:
+        print(f"WARNING: No disambiguation rules available ({e})")
+        return compile_disambiguation_rules([])
+
+
+class Disambiguator:
+    def __init__(self, rules: dict = None, ontology_path: str = None):
+        """
+        Initialize with compiled disambiguation rules
+        
+        Args:
+            rules: Compiled rules (see compile_disambiguation_rules); if None,
+                they are read from the runtime artifact's 'disambiguation' section
+            ontology_path: Runtime artifact path (default: engine/data/ontology_runtime.json)
+        """
+        if rules is None:
+            rules = self._load_rules(ontology_path or _default_artifact_path())
+        self.rules = rules
+        self.terms = rules['terms']
+        self.indicator_index = rules['indicator_index']
+        
+        phrases = list(self.terms) + list(self.indicator_index)
+        self.max_phrase_words = max((p.count(' ') + 1 for p in phrases), default=1)
+        # Single-word phrases, for resolving plurals, units and compounds
+        self._vocabulary = frozenset(p for p in phrases if ' ' not in p)
     
-    def get_disambiguation_context(self, query: str) -> dict:
+    @classmethod
+    def from_artifact(cls, artifact: dict) -> 'Disambiguator':
+        """Build from an already loaded runtime artifact"""
+        rules = (artifact or {}).get('disambiguation')
+        return cls(rules or _fallback_rules())
+    
+    @staticmethod
+    def _load_rules(ontology_path: str) -> dict:
+        try:
+            with open(ontology_path, 'r') as f:
+                rules = json.load(f).get('disambiguation')
+        except (FileNotFoundError, json.JSONDecodeError):
+            rules = None
+        return rules or _fallback_rules()
+    
+    def get_disambiguation_context(self, query: str, trace=NULL_TRACE) -> dict:
         """
         Analyze query and return disambiguation hints
         Returns all possible meanings for multi-index search
+        
+        Time spent here is recorded as the 'disambiguate' span of `trace`.
         """
-        query_lower = query.lower()
+        with trace.span('disambiguate'):
+            return self._disambiguate(query)
+    
+    def _words(self, token: str) -> tuple:
+        """Rule words a query token stands for (the token itself if none)"""
+        vocabulary = self._vocabulary
+        if token in vocabulary:
+            return (token,)
+        # Plural ('racks') or number-prefixed unit ('500kw')
+        for stem in (token[:-1] if token.endswith('s') else '', token.lstrip('0123456789')):
+            if stem in vocabulary:
+                return (stem,)
+        # Compound of two rule words ('servicefabric')
+        for i in range(2, len(token) - 1):
+            head, tail = token[:i], token[i:]
+            if head in vocabulary and tail in vocabulary:
+                return (head, tail)
+        return (token,)
+    
+    def _disambiguate(self, query: str) -> dict:
+        """
+        Single pass over query words (and n-grams up to max_phrase_words)
+        
+        Each context scores one point per distinct indicator present; the
+        likely meaning is the highest score, ties broken by priority.
+        """
+        words = []
+        for token in _TOKEN_RE.findall(query.lower()):
+            words.extend(self._words(token))
+        terms = self.terms
+        indicator_index = self.indicator_index
         context = {}
         
-        for term, config in self.ambiguous_terms.items():
-            if term in query_lower:
-                result = {
-                    'found': True,
-                    'all_meanings': list(config['meanings'].keys()),
-                    'indexes': []
-                }
-                
-                # Score each meaning based on context indicators
-                scores = {}
-                for meaning_name, meaning_config in config['meanings'].items():
-                    score = 0
-                    for indicator in meaning_config['indicators']:
-                        if indicator in query_lower:
-                            score += 1
-                    scores[meaning_name] = score
-                    result['indexes'].extend(meaning_config['indexes'])
-                
-                result['indexes'] = list(set(result['indexes']))
+        found_terms = []
+        seen_phrases = set()
+        scores = {}
+        for i in range(len(words)):
+            phrase = words[i]
+            for n in range(self.max_phrase_words):
+                if n:
+                    if i + n >= len(words):
+                        break
+                    phrase = phrase + ' ' + words[i + n]
+                if phrase in seen_phrases:
+                    continue
+                seen_phrases.add(phrase)
                 
-                # Determine likely meaning
-                if scores:
-                    likely = max(scores, key=scores.get)
-                    result['likely_meaning'] = likely if scores[likely] > 0 else None
-                else:
-                    result['likely_meaning'] = None
-                
-                result['scores'] = scores
-                context[term] = result
+                if phrase in terms:
+                    found_terms.append(phrase)
+                for term, meaning, priority in indicator_index.get(phrase, ()):
+                    key = (term, meaning)
+                    scores[key] = scores.get(key, 0) + 1
+        
+        for term in found_terms:
+            contexts = self.terms[term]['contexts']
+            term_scores = {c['context']: scores.get((term, c['context']), 0) for c in contexts}
+            
+            indexes = []
+            for c in contexts:
+                for index in c['indexes']:
+                    if index not in indexes:
+                        indexes.append(index)
+            
+            # contexts are sorted by priority, so max() keeps the higher-priority tie
+            best = max(contexts, key=lambda c: term_scores[c['context']]) if contexts else None
+            likely = best['context'] if best and term_scores[best['context']] > 0 else None
+            
+            context[term] = {
+                'found': True,
+                'all_meanings': [c['context'] for c in contexts],
+                'indexes': indexes,
+                'likely_meaning': likely,
+                'default_meaning': contexts[0]['context'] if contexts else None,
+                'scores': term_scores
+            }
         
         return context
 
@@ -81,7 +287,11 @@ if __name__ == "__main__":
     test_queries = [
         "What's the fabric topology?",
         "Is ServiceFabric available?",
-        "What's the power capacity?"
+        "Is SF fabric available in the cloud?",
+        "What's the power capacity?",
+        "How much capacity in square feet?",
+        "servicefabric pricing",
+        "Data transfer fabric for 40 racks at 500kw"
     ]
     
     for query in test_queries:
@@ -89,5 +299,5 @@ if __name__ == "__main__":
         print(f"Query: '{query}'")
         if context:
             for term, info in context.items():
-                print(f"  '{term}' → {info.get('likely_meaning', 'unclear')}")
+                print(f"  '{term}' → {info.get('likely_meaning') or 'unclear'} {info['scores']}")
         print()
\ No newline at end of file
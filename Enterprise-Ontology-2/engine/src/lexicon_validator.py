@@ -0,0 +1,245 @@
+"""
+Lexicon Validator
+Build-time consistency checks for the lexicon YAML.
+
+Builds a global term -> entity map over every section, using the same term
+keys as the rewriter's matcher, and reports:
+
+- duplicate_canonical: a canonical name defined twice (within or across
+  sections); the later definition would silently overwrite the earlier one
+- canonical_shadowed: an entity's synonym is another entity's canonical name
+- synonym_collision: one synonym claimed by several entities
+- unmatchable_term: a term normalization alters (e.g. "N+1"), so it can
+  never match a normalized query
+- hyphen_variant: a hyphenated term whose spaced / joined spellings are
+  not terms of the same entity ("co-location" misses "co location")
+- redundant_synonym: a synonym repeating its own canonical or another synonym
+- related_term_entity: a related term that is another entity's term
+- nested_term: a term that is a whole-word part of another entity's term,
+  so both entities match the longer phrase
+
+build_lookup() resolves every term key to exactly one entity (canonical
+beats synonym, then lexicon order), so the runtime never breaks ties.
+
+Usage:
+    issues = validate_lexicon(yaml.safe_load(open('data/lexicon_v01_final.yaml')))
+    print(format_issues(issues))
+    if should_fail(issues, fail_on='error'): ...
+"""
+
+from rewriter_engine import term_key
+
+# Lexicon sections holding entities, in build order
+ENTITY_SECTIONS = ('products', 'facilities', 'technical_terms', 'partners', 'geographic_terms')
+
+SEVERITY_ERROR = 'error'
+SEVERITY_WARNING = 'warning'
+SEVERITY_INFO = 'info'
+SEVERITY_RANK = {SEVERITY_INFO: 0, SEVERITY_WARNING: 1, SEVERITY_ERROR: 2}
+
+# fail_on values: fail when any issue is at or above this severity
+FAIL_ON_CHOICES = ('error', 'warning', 'info', 'never')
+
+DEFAULT_SEVERITIES = {
+    'duplicate_canonical': SEVERITY_ERROR,
+    'canonical_shadowed': SEVERITY_ERROR,
+    'synonym_collision': SEVERITY_ERROR,
+    'unmatchable_term': SEVERITY_WARNING,
+    'hyphen_variant': SEVERITY_WARNING,
+    'redundant_synonym': SEVERITY_INFO,
+    'related_term_entity': SEVERITY_INFO,
+    'nested_term': SEVERITY_INFO,
+}
+
+
+def _entries(lexicon: dict):
+    """(section, canonical, item) for every entity entry, in build order"""
+    for section in ENTITY_SECTIONS:
+        for item in lexicon.get(section) or []:
+            canonical = item.get('canonical')
+            if canonical:
+                yield section, canonical, item
+
+
+def _issue(issues: list, severities: dict, code: str, term: str, entities, message: str):
+    issues.append({
+        'severity': severities.get(code, SEVERITY_WARNING),
+        'code': code,
+        'term': term,
+        'entities': sorted(set(entities)),
+        'message': message
+    })
+
+
+def validate_lexicon(lexicon: dict, severities: dict = None) -> list:
+    """
+    Check a parsed lexicon for collisions, shadowed terms and boundary hazards
+
+    Args:
+        lexicon: Parsed lexicon YAML
+        severities: Per-code severity overrides (merged over DEFAULT_SEVERITIES)
+
+    Returns:
+        List of {'severity', 'code', 'term', 'entities', 'message'} dicts,
+        errors first
+    """
+    severities = dict(DEFAULT_SEVERITIES, **(severities or {}))
+    issues = []
+
+    # Canonical definitions and the global term key -> owners map
+    defined = {}
+    canonical_keys = {}
+    synonym_keys = {}
+    for section, canonical, item in _entries(lexicon):
+        defined.setdefault(canonical, []).append(section)
+        key = term_key(canonical)
+        if key:
+            canonical_keys.setdefault(key, []).append(canonical)
+        else:
+            _issue(issues, severities, 'unmatchable_term', canonical, [canonical],
+                   f"canonical '{canonical}' is changed by query normalization and can never match")
+
+        seen = {key}
+        for synonym in item.get('synonyms') or []:
+            syn_key = term_key(str(synonym))
+            if not syn_key:
+                _issue(issues, severities, 'unmatchable_term', synonym, [canonical],
+                       f"synonym '{synonym}' of {canonical} is changed by query normalization "
+                       f"and can never match")
+                continue
+            if syn_key in seen:
+                _issue(issues, severities, 'redundant_synonym', synonym, [canonical],
+                       f"synonym '{synonym}' repeats another term of {canonical}")
+                continue
+            seen.add(syn_key)
+            synonym_keys.setdefault(syn_key, []).append((canonical, synonym))
+
+    for canonical, sections in defined.items():
+        if len(sections) > 1:
+            _issue(issues, severities, 'duplicate_canonical', canonical, [canonical],
+                   f"'{canonical}' is defined {len(sections)} times ({', '.join(sections)}); "
+                   f"the last definition overwrites the others")
+
+    for key, owners in synonym_keys.items():
+        synonym_owners = {canonical for canonical, _ in owners}
+        shadowing = set(canonical_keys.get(key, ())) - synonym_owners
+        if shadowing:
+            for canonical, synonym in owners:
+                if canonical not in shadowing:
+                    _issue(issues, severities, 'canonical_shadowed', synonym,
+                           [canonical, *shadowing],
+                           f"synonym '{synonym}' of {canonical} is the canonical name of "
+                           f"{', '.join(sorted(shadowing))}")
+        elif len(synonym_owners) > 1:
+            _issue(issues, severities, 'synonym_collision', owners[0][1], synonym_owners,
+                   f"synonym '{owners[0][1]}' is claimed by {', '.join(sorted(synonym_owners))}")
+
+    # Term key -> entities owning it (canonical or synonym)
+    owners_by_key = {}
+    for key, canonicals in canonical_keys.items():
+        owners_by_key.setdefault(key, set()).update(canonicals)
+    for key, owners in synonym_keys.items():
+        owners_by_key.setdefault(key, set()).update(canonical for canonical, _ in owners)
+
+    for section, canonical, item in _entries(lexicon):
+        terms = [canonical] + [str(s) for s in item.get('synonyms') or []]
+        own_keys = {term_key(t) for t in terms}
+        for term in terms:
+            key = term_key(term)
+            if not key or '-' not in key:
+                continue
+            words = [w for w in key.split(' ') if w != '-']
+            variants = {' '.join(words), ''.join(words)}
+            missing = sorted(v for v in variants - own_keys if v)
+            if missing:
+                _issue(issues, severities, 'hyphen_variant', term, [canonical],
+                       f"'{term}' only matches the hyphenated spelling; "
+                       f"not matched: {', '.join(repr(v) for v in missing)}")
+
+        for related in item.get('related_terms') or []:
+            others = owners_by_key.get(term_key(str(related)) or '', set()) - {canonical}
+            if others:
+                _issue(issues, severities, 'related_term_entity', related, [canonical, *others],
+                       f"related term '{related}' of {canonical} is a term of "
+                       f"{', '.join(sorted(others))}")
+
+    # Whole-word containment between terms of different entities
+    padded = {key: f' {key} ' for key in owners_by_key}
+    for short, short_owners in owners_by_key.items():
+        needle = padded[short]
+        for longer, long_owners in owners_by_key.items():
+            if longer != short and needle in padded[longer] and not short_owners & long_owners:
+                _issue(issues, severities, 'nested_term', short, short_owners | long_owners,
+                       f"'{short}' ({', '.join(sorted(short_owners))}) also matches inside "
+                       f"'{longer}' ({', '.join(sorted(long_owners))})")
+
+    issues.sort(key=lambda i: (-SEVERITY_RANK[i['severity']], i['code'], str(i['term']).lower()))
+    return issues
+
+
+def build_lookup(entities: dict) -> dict:
+    """
+    Conflict-free term key -> entity table for the runtime artifact
+
+    Canonical names are placed before synonyms, and earlier entities
+    before later ones, so every key resolves to exactly one entity.
+
+    Args:
+        entities: The artifact's 'entities' mapping (canonical -> data)
+
+    Returns:
+        {term key: {'entity': canonical, 'canonical': bool}}
+    """
+    lookup = {}
+    for name in entities:
+        key = term_key(name)
+        if key:
+            lookup.setdefault(key, {'entity': name, 'canonical': True})
+    for name, data in entities.items():
+        for synonym in data.get('synonyms') or []:
+            key = term_key(str(synonym))
+            if key:
+                lookup.setdefault(key, {'entity': name, 'canonical': False})
+    return lookup
+
+
+def count_by_severity(issues: list) -> dict:
+    counts = {SEVERITY_ERROR: 0, SEVERITY_WARNING: 0, SEVERITY_INFO: 0}
+    for issue in issues:
+        counts[issue['severity']] += 1
+    return counts
+
+
+def should_fail(issues: list, fail_on: str = 'error') -> bool:
+    """True if any issue is at or above the fail_on severity ('never' disables)"""
+    if fail_on == 'never':
+        return False
+    threshold = SEVERITY_RANK[fail_on]
+    return any(SEVERITY_RANK[i['severity']] >= threshold for i in issues)
+
+
+def format_issues(issues: list, min_severity: str = SEVERITY_INFO) -> str:
+    """One line per issue at or above min_severity"""
+    threshold = SEVERITY_RANK[min_severity]
+    return '\n'.join(
+        f"  [{i['severity'].upper():7}] {i['code']}: {i['message']}"
+        for i in issues if SEVERITY_RANK[i['severity']] >= threshold
+    )
+
+
+if __name__ == "__main__":
+    import yaml
+
+    with open('data/lexicon_v01_final.yaml', 'r') as f:
+        lexicon = yaml.safe_load(f)
+
+    issues = validate_lexicon(lexicon)
+    print(f"Lexicon issues: {count_by_severity(issues)}")
+    print(format_issues(issues))
+
+    # Injected conflicts are caught
+    lexicon['partners'].append({'canonical': 'Colocation', 'synonyms': ['SF', 'Scale']})
+    codes = {i['code'] for i in validate_lexicon(lexicon)}
+    assert {'duplicate_canonical', 'canonical_shadowed', 'synonym_collision'} <= codes, codes
+    assert should_fail(validate_lexicon(lexicon))
+    print("\n✓ Injected conflicts detected")
@@ -4,16 +4,161 @@ Performance Monitor
 Tracks timing metrics for query rewriting operations.
 Calculates mean, median, p95, p99 percentiles for performance analysis.
 
+Raw measurements for the percentiles are a bounded reservoir per
+operation (max_samples, uniform Algorithm R sampling), so a long-lived
+monitor stays at constant memory; count, mean, min and max stay exact.
+
+Also keeps Prometheus-style histogram buckets and counters per operation
+and renders them in the Prometheus text exposition format. In multiprocess
+mode (e.g. several uvicorn workers) each process writes a snapshot file to
+a shared directory from a background thread every flush_interval and at
+exit, and render_prometheus() aggregates the snapshots. A snapshot left by
+an exited pid is folded into a persistent aggregate file
+(monitor_<name>_aggregate.json) before it is removed, so exported counters
+and histogram totals never go backwards when a worker exits.
+
 Usage:
     monitor = PerformanceMonitor()
     monitor.record('query_rewrite', 8.5)
     stats = monitor.get_stats('query_rewrite')
     print(f"p95: {stats['p95']:.2f}ms")
+    print(monitor.render_prometheus())
+
+    # Multiprocess mode
+    monitor = PerformanceMonitor(name='api', multiprocess_dir='/tmp/nexus_metrics')
+
+    # Several monitors in one scrape (series labelled monitor="<name>")
+    print(render_monitors([api_monitor, rewriter_monitor]))
+
+Timing helpers (monotonic perf_counter_ns clock):
+    with monitor.timer('lexicon_load'):
+        ...
+
+    @monitor.timed('normalize', sample_every=100)   # time 1 in 100 calls, weighted x100
+    def normalize(query): ...
+
+    result = monitor.measure('query_rewrite', rewrite_query, query, lexicon)
 """
 
+import atexit
+import contextlib
+import functools
+import glob
+import itertools
+import json
+import os
+import random
+import threading
 import time
+import weakref
+from bisect import bisect_left
+from time import perf_counter_ns
 import numpy as np
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; folding is then unlocked
+    fcntl = None
+
+# Histogram bucket upper bounds in milliseconds (p95 target is 40ms)
+DEFAULT_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 40, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Environment variable that enables multiprocess mode
+MULTIPROCESS_DIR_ENV = 'NEXUS_METRICS_DIR'
+
+# Default multiprocess_dir: read $NEXUS_METRICS_DIR (an explicit None disables)
+_FROM_ENV = object()
+
+# Raw measurements kept per operation for percentiles
+DEFAULT_MAX_SAMPLES = 10_000
+
+# Multiprocess monitors, flushed at interpreter exit
+_live_monitors = weakref.WeakSet()
+
+
+def _flush_all_monitors():
+    for monitor in list(_live_monitors):
+        monitor.flush()
+
+
+atexit.register(_flush_all_monitors)
+
+
+def _flush_periodically(monitor_ref, interval: float, pid: int):
+    """Flusher thread body; ends when the monitor is garbage collected"""
+    while True:
+        time.sleep(interval)
+        monitor = monitor_ref()
+        if monitor is None or monitor._flusher_pid != pid:
+            return
+        if monitor._dirty:
+            monitor.flush()
+        del monitor
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Timer:
+    """
+    Reusable context manager / decorator that records into a monitor
+    
+    Obtained from PerformanceMonitor.timer(); the same instance is returned
+    for an operation, so timing a call does not allocate a new object.
+    Start times live on a per-thread stack, so one timer can be shared
+    across threads and nested calls.
+    """
+    
+    __slots__ = ('monitor', 'operation', 'sample_every', '_calls', '_local')
+    
+    # Pushed instead of a start time when a call is not sampled
+    _SKIP = -1
+    
+    def __init__(self, monitor: 'PerformanceMonitor', operation: str, sample_every: int = 1):
+        self.monitor = monitor
+        self.operation = operation
+        self.sample_every = max(1, int(sample_every))
+        # next() on itertools.count is atomic, unlike `+= 1` on an attribute
+        self._calls = itertools.count(1)
+        self._local = threading.local()
+    
+    def _stack(self) -> list:
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+    
+    def __enter__(self):
+        if self.sample_every > 1 and next(self._calls) % self.sample_every:
+            self._stack().append(self._SKIP)
+        else:
+            self._stack().append(perf_counter_ns())
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        end = perf_counter_ns()
+        start = self._stack().pop()
+        if start != self._SKIP:
+            # Each sampled call stands for sample_every calls in the totals
+            self.monitor.record(self.operation, (end - start) / 1e6, weight=self.sample_every)
+        return False
+    
+    def __call__(self, func: Callable) -> Callable:
+        """Use the timer as a function decorator"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
 
 
 class PerformanceMonitor:
@@ -23,27 +168,170 @@ class PerformanceMonitor:
     Measures: count, mean, median, p95, p99, min, max
     """
     
-    def __init__(self):
-        """Initialize with predefined operation categories"""
+    def __init__(self, name: str = 'default', buckets=DEFAULT_BUCKETS_MS,
+                 multiprocess_dir=_FROM_ENV, flush_interval: float = 1.0,
+                 max_samples: int = DEFAULT_MAX_SAMPLES):
+        """
+        Initialize with predefined operation categories
+        
+        Args:
+            name: Monitor name, used in multiprocess snapshot file names
+            buckets: Histogram bucket upper bounds (ms)
+            multiprocess_dir: Shared directory for per-process snapshots
+                (defaults to $NEXUS_METRICS_DIR; None disables multiprocess mode)
+            flush_interval: Seconds between background snapshot writes
+            max_samples: Raw measurements kept per operation for percentiles
+        """
         self.measurements = {
             'query_rewrite': [],
             'lexicon_load': [],
             'total': []
         }
+        self.name = name
+        self.timers = {}
+        self.timer_overhead_ms = None
+        self.buckets = tuple(sorted(buckets))
+        self.histograms = {}
+        self.counters = {}
+        self.max_samples = max(1, int(max_samples))
+        self.extremes = {}
+        # Measurements recorded per operation (unweighted; drives the reservoir)
+        self._recorded = {}
+        if multiprocess_dir is _FROM_ENV:
+            multiprocess_dir = os.getenv(MULTIPROCESS_DIR_ENV)
+        self.multiprocess_dir = multiprocess_dir or None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+        if self.multiprocess_dir:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+            _live_monitors.add(self)
     
-    def record(self, operation: str, time_ms: float):
+    def _ensure_flusher(self):
+        # One flusher thread per process; a forked child starts its own
+        pid = os.getpid()
+        if self._flusher_pid != pid:
+            self._flusher_pid = pid
+            threading.Thread(target=_flush_periodically,
+                             args=(weakref.ref(self), self.flush_interval, pid),
+                             name=f'monitor-flush-{self.name}', daemon=True).start()
+    
+    def record(self, operation: str, time_ms: float, weight: int = 1):
         """
         Record a timing measurement
         
         Args:
             operation: Name of operation (e.g., 'query_rewrite')
             time_ms: Time in milliseconds
+            weight: Calls this measurement stands for (sample_every for a
+                sampled timer), so histogram counts and sums stay unscaled
         """
-        if operation in self.measurements:
-            self.measurements[operation].append(time_ms)
-        else:
+        with self._lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = self._new_histogram()
+            histogram['buckets'][bisect_left(self.buckets, time_ms)] += weight
+            histogram['sum'] += time_ms * weight
+            histogram['count'] += weight
+            
             # Create new operation category if needed
-            self.measurements[operation] = [time_ms]
+            samples = self.measurements.setdefault(operation, [])
+            seen = self._recorded[operation] = self._recorded.get(operation, 0) + 1
+            if len(samples) < self.max_samples:
+                samples.append(time_ms)
+            else:
+                # Reservoir sampling: every measurement so far is kept with equal probability
+                slot = random.randrange(seen)
+                if slot < self.max_samples:
+                    samples[slot] = time_ms
+            
+            extremes = self.extremes.get(operation)
+            if extremes is None:
+                self.extremes[operation] = [time_ms, time_ms]
+            elif time_ms < extremes[0]:
+                extremes[0] = time_ms
+            elif time_ms > extremes[1]:
+                extremes[1] = time_ms
+            self._dirty = True
+        
+        if self.multiprocess_dir:
+            self._ensure_flusher()
+    
+    def increment(self, counter: str, amount: float = 1):
+        """
+        Increment a named counter (exported as nexus_events_total)
+        
+        Args:
+            counter: Counter name (e.g., 'rewrite_zero_match')
+            amount: Amount to add
+        """
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+            self._dirty = True
+        if self.multiprocess_dir:
+            self._ensure_flusher()
+    
+    def timer(self, operation: str, sample_every: int = 1) -> Timer:
+        """
+        Get the reusable timer for an operation
+        
+        Args:
+            operation: Name of operation to record into
+            sample_every: Record 1 in N calls (for very hot paths)
+        
+        Returns:
+            Timer usable as `with monitor.timer(op):` or `@monitor.timer(op)`
+        """
+        timer = self.timers.get(operation)
+        if timer is None or timer.sample_every != max(1, int(sample_every)):
+            if self.timer_overhead_ms is None:
+                self.calibrate()
+            timer = self.timers[operation] = Timer(self, operation, sample_every)
+        return timer
+    
+    def timed(self, operation: str, sample_every: int = 1) -> Timer:
+        """Decorator form of timer(): `@monitor.timed('normalize')`"""
+        return self.timer(operation, sample_every)
+    
+    def measure(self, operation: str, func: Callable, *args, **kwargs):
+        """
+        Call func(*args, **kwargs), record its latency and return its result
+        
+        Args:
+            operation: Name of operation being measured
+            func: Function to execute and measure
+        
+        Returns:
+            Result of func (the latency is in the monitor, not returned)
+        """
+        with self.timer(operation):
+            return func(*args, **kwargs)
+    
+    def calibrate(self, iterations: int = 2000) -> float:
+        """
+        Measure the timer's own overhead
+        
+        Times an empty `with timer:` block and keeps the median, which is
+        the floor every recorded measurement includes. Reported in
+        get_stats() as 'timer_overhead_ms'.
+        
+        Returns:
+            Timer overhead in milliseconds
+        """
+        # Never exported: no snapshot file, whatever $NEXUS_METRICS_DIR says
+        scratch = PerformanceMonitor(name='calibration', buckets=self.buckets, multiprocess_dir=None)
+        scratch.timer_overhead_ms = 0.0
+        timer = Timer(scratch, 'empty')
+        for _ in range(iterations):
+            with timer:
+                pass
+        self.timer_overhead_ms = float(np.median(scratch.measurements['empty']))
+        return self.timer_overhead_ms
+    
+    def _new_histogram(self) -> Dict:
+        # One slot per bucket plus the +Inf overflow slot
+        return {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
     
     def get_stats(self, operation: str = None) -> Dict:
         """
@@ -54,33 +342,53 @@ class PerformanceMonitor:
         
         Returns:
             Dictionary with performance metrics:
-            - count: Number of measurements
+            - count: Number of measured calls (sampled measurements
+              count sample_every times each)
             - mean: Average time
             - median: Middle value (p50)
             - p95: 95th percentile
             - p99: 99th percentile
             - min: Fastest time
             - max: Slowest time
+            - reservoir_size: Samples behind the percentiles (only when
+              count exceeds max_samples)
+            - sample_every: Sampling rate (if recorded by a sampled timer)
+            - timer_overhead_ms: Calibrated timer overhead (if calibrated)
         """
         if operation:
-            data = self.measurements.get(operation, [])
+            with self._lock:
+                data = list(self.measurements.get(operation, []))
+                histogram = self.histograms.get(operation)
+                count = histogram['count'] if histogram else 0
+                total = histogram['sum'] if histogram else 0.0
+                low, high = self.extremes.get(operation, (None, None))
+                recorded = self._recorded.get(operation, 0)
             if not data:
                 return {}
             
-            return {
+            stats = {
                 'operation': operation,
-                'count': len(data),
-                'mean': float(np.mean(data)),
+                'count': count,
+                'mean': total / count,
                 'median': float(np.median(data)),
                 'p95': float(np.percentile(data, 95)),
                 'p99': float(np.percentile(data, 99)),
-                'min': float(np.min(data)),
-                'max': float(np.max(data))
+                'min': float(low),
+                'max': float(high)
             }
+            if recorded > len(data):
+                stats['reservoir_size'] = len(data)
+            
+            timer = self.timers.get(operation)
+            if timer is not None and timer.sample_every > 1:
+                stats['sample_every'] = timer.sample_every
+            if self.timer_overhead_ms is not None:
+                stats['timer_overhead_ms'] = self.timer_overhead_ms
+            return stats
         else:
             # Return stats for all operations
             stats = {}
-            for op in self.measurements:
+            for op in list(self.measurements):
                 op_stats = self.get_stats(op)
                 if op_stats:
                     stats[op] = op_stats
@@ -106,6 +414,11 @@ class PerformanceMonitor:
             print(f"  p99:      {metrics['p99']:.2f}ms")
             print(f"  Min:      {metrics['min']:.2f}ms")
             print(f"  Max:      {metrics['max']:.2f}ms")
+            if 'sample_every' in metrics:
+                print(f"  Sampled:  1 in {metrics['sample_every']}")
+        
+        if self.timer_overhead_ms is not None:
+            print(f"\nTimer overhead: {self.timer_overhead_ms * 1000:.2f}us per measurement")
         
         print("\n" + "="*60)
     
@@ -116,12 +429,222 @@ class PerformanceMonitor:
         Args:
             operation: Specific operation to reset, or None for all
         """
-        if operation:
-            if operation in self.measurements:
-                self.measurements[operation] = []
-        else:
-            for op in self.measurements:
-                self.measurements[op] = []
+        with self._lock:
+            if operation:
+                if operation in self.measurements:
+                    self.measurements[operation] = []
+                self.histograms.pop(operation, None)
+                self.extremes.pop(operation, None)
+                self._recorded.pop(operation, None)
+            else:
+                for op in self.measurements:
+                    self.measurements[op] = []
+                self.histograms = {}
+                self.extremes = {}
+                self._recorded = {}
+                self.counters = {}
+            self._dirty = True
+    
+    # ------------------------------------------------------------------
+    # Prometheus export
+    # ------------------------------------------------------------------
+    
+    def snapshot(self) -> Dict:
+        """Histogram and counter state as a JSON-serializable dict (a copy)"""
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'histograms': {op: dict(hist, buckets=list(hist['buckets']))
+                               for op, hist in self.histograms.items()},
+                'counters': dict(self.counters)
+            }
+    
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.multiprocess_dir, f"monitor_{self.name}_{os.getpid()}.json")
+    
+    def _aggregate_path(self) -> str:
+        return os.path.join(self.multiprocess_dir, f"monitor_{self.name}_aggregate.json")
+    
+    @staticmethod
+    def _write_json(path: str, data: Dict):
+        # The flusher thread and collect() may write at the same time
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    
+    def flush(self):
+        """Write this process's snapshot to the multiprocess directory"""
+        if not self.multiprocess_dir:
+            return
+        self._dirty = False
+        self._write_json(self._snapshot_path(), self.snapshot())
+    
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        """Exclusive lock over this monitor's files, shared across processes"""
+        lock_path = os.path.join(self.multiprocess_dir, f"monitor_{self.name}.lock")
+        with open(lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+    
+    def _snapshot_files(self) -> List[tuple]:
+        """
+        (path, pid) of this monitor's snapshot files; pid is None for the aggregate
+        
+        Matched on the exact suffix, so monitor 'api' never picks up the
+        files of a monitor named 'api_v2'.
+        """
+        prefix = f"monitor_{self.name}_"
+        files = []
+        for path in sorted(glob.glob(os.path.join(glob.escape(self.multiprocess_dir),
+                                                  f"{glob.escape(prefix)}*.json"))):
+            suffix = os.path.basename(path)[len(prefix):-len('.json')]
+            if suffix.isdigit():
+                files.append((path, int(suffix)))
+            elif suffix == 'aggregate':
+                files.append((path, None))
+        return files
+    
+    def _fold_dead(self, dead_paths: List[str]):
+        """Add exited processes' snapshots to the aggregate file, then remove them"""
+        snapshots = []
+        for path in dead_paths:
+            try:
+                with open(path, 'r') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                # Truncated by a crash mid-write; nothing to recover
+                pass
+        if snapshots:
+            aggregate_path = self._aggregate_path()
+            try:
+                with open(aggregate_path, 'r') as f:
+                    snapshots.insert(0, json.load(f))
+            except FileNotFoundError:
+                pass
+            self._write_json(aggregate_path, self.merge_snapshots(snapshots))
+        for path in dead_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    @staticmethod
+    def merge_snapshots(snapshots: List[Dict]) -> Dict:
+        """
+        Sum histograms and counters from several snapshots
+        
+        Snapshots with different bucket layouts than the first are skipped.
+        """
+        merged = {'buckets': None, 'histograms': {}, 'counters': {}}
+        for snap in snapshots:
+            if merged['buckets'] is None:
+                merged['buckets'] = list(snap['buckets'])
+            elif list(snap['buckets']) != merged['buckets']:
+                continue
+            
+            for op, hist in snap['histograms'].items():
+                target = merged['histograms'].setdefault(
+                    op, {'buckets': [0] * len(hist['buckets']), 'sum': 0.0, 'count': 0})
+                target['buckets'] = [a + b for a, b in zip(target['buckets'], hist['buckets'])]
+                target['sum'] += hist['sum']
+                target['count'] += hist['count']
+            
+            for counter, value in snap['counters'].items():
+                merged['counters'][counter] = merged['counters'].get(counter, 0) + value
+        
+        if merged['buckets'] is None:
+            merged['buckets'] = []
+        return merged
+    
+    def collect(self) -> Dict:
+        """
+        Snapshot to export: this process only, or every live process's
+        snapshot file for this monitor name when multiprocess mode is enabled
+
+        Snapshot files of processes that have exited are folded into the
+        aggregate file, which is exported along with the live snapshots.
+        """
+        if not self.multiprocess_dir:
+            return self.snapshot()
+        
+        self.flush()
+        # Folding and reading under one lock: a snapshot is folded exactly
+        # once and never counted both live and in the aggregate
+        with self._directory_lock():
+            dead = [path for path, pid in self._snapshot_files()
+                    if pid is not None and not _pid_alive(pid)]
+            if dead:
+                self._fold_dead(dead)
+            
+            snapshots = []
+            for path, _ in self._snapshot_files():
+                try:
+                    with open(path, 'r') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, json.JSONDecodeError):
+                    # Snapshot being replaced or removed by its process
+                    continue
+        return self.merge_snapshots(snapshots)
+    
+    def render_prometheus(self, namespace: str = 'nexus') -> str:
+        """
+        Render histograms and counters in Prometheus text exposition format
+        
+        Args:
+            namespace: Metric name prefix
+        
+        Returns:
+            Exposition text (serve with content type 'text/plain; version=0.0.4')
+        """
+        return render_monitors([self], namespace)
+
+
+def render_monitors(monitors: List[PerformanceMonitor], namespace: str = 'nexus') -> str:
+    """
+    Render several monitors as one exposition, each series labelled with
+    its monitor's name (monitor="api", monitor="rewriter")
+    """
+    duration = f"{namespace}_operation_duration_milliseconds"
+    events = f"{namespace}_events_total"
+    collected = [(_escape_label(m.name), m.collect()) for m in monitors]
+    
+    lines = [
+        f"# HELP {duration} Operation latency in milliseconds.",
+        f"# TYPE {duration} histogram",
+    ]
+    for monitor, data in collected:
+        bounds = [_format_bound(b) for b in data['buckets']] + ['+Inf']
+        for op in sorted(data['histograms']):
+            hist = data['histograms'][op]
+            labels = f'monitor="{monitor}",operation="{_escape_label(op)}"'
+            cumulative = 0
+            for bound, count in zip(bounds, hist['buckets']):
+                cumulative += count
+                lines.append(f'{duration}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{duration}_sum{{{labels}}} {hist["sum"]}')
+            lines.append(f'{duration}_count{{{labels}}} {hist["count"]}')
+    
+    lines.append(f"# HELP {events} Event counters.")
+    lines.append(f"# TYPE {events} counter")
+    for monitor, data in collected:
+        for counter in sorted(data['counters']):
+            lines.append(f'{events}{{monitor="{monitor}",name="{_escape_label(counter)}"}} '
+                         f'{data["counters"][counter]}')
+    
+    return '\n'.join(lines) + '\n'
+
+
+def _format_bound(bound: float) -> str:
+    """Format a bucket bound the way Prometheus clients do (1 -> '1.0')"""
+    return repr(float(bound))
+
+
+def _escape_label(value: str) -> str:
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
 
 
 # Test function
@@ -138,9 +661,23 @@ if __name__ == "__main__":
         delay_ms = random.uniform(5, 15)
         monitor.record('query_rewrite', delay_ms)
     
+    # Timer API: context manager and sampled decorator
+    with monitor.timer('lexicon_load'):
+        time.sleep(0.002)
+    
+    @monitor.timed('hot_path', sample_every=10)
+    def hot_path(x):
+        return x * 2
+    
+    for i in range(1000):
+        hot_path(i)
+    
     # Print report
     monitor.print_report()
     
+    print("\nPrometheus exposition:")
+    print(monitor.render_prometheus())
+    
     # Check against requirement
     stats = monitor.get_stats('query_rewrite')
     target_p95 = 40
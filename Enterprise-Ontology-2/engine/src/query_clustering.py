@@ -0,0 +1,530 @@
+"""
+Query Clustering
+
+Rebuilds query_analysis.csv (conversation, cluster_final, cluster_name,
+timestamp, failure_mode, in_scope) from telemetry and CSV exports without
+the notebook.
+
+- Vectors: queries are tokenized into words and word bigrams, hashed
+  (CRC32) into a fixed number of features and weighted with sublinear
+  TF-IDF, then L2-normalized. They are stored as a CSR triple of NumPy
+  arrays (~30 non-zeros per query), so 100k queries take a few MB and
+  the feature space never grows.
+- Clustering: mini-batch k-means (Sculley, 2010) with k-means++ seeding.
+  Each batch moves the centers towards the mean of the rows assigned to
+  them with a per-center learning rate of 1/count. Memory is the k dense
+  centers plus one batch.
+- Incremental: the fitted model (hash size, IDF, centers, counts and
+  cluster labels) is saved as .npz. `assign` puts new queries in the
+  nearest existing cluster; with --update the centers also take a
+  mini-batch step, so clusters follow the traffic without a refit.
+- Labels: fitting can be seeded from an existing query_analysis.csv. Its
+  clusters become the initial centers and keep their cluster_name,
+  failure_mode and in_scope. Other clusters are named after their top
+  terms, and when telemetry tells which queries matched an entity their
+  in_scope / failure_mode come from the cluster's match rate.
+
+Usage:
+    python src/query_clustering.py fit --csv ../../query_analysis.csv \\
+        --telemetry outputs/telemetry_logs.jsonl --seed-labels ../../query_analysis.csv \\
+        --model outputs/query_clusters.npz --out outputs/query_analysis.csv
+    python src/query_clustering.py assign --model outputs/query_clusters.npz \\
+        --telemetry outputs/telemetry_logs.jsonl --update --out outputs/query_analysis_new.csv
+"""
+
+import argparse
+import csv
+import json
+import re
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from telemetry_logger import merge_streams
+
+MODEL_FORMAT_VERSION = 1
+
+OUTPUT_COLUMNS = ('conversation', 'cluster_final', 'cluster_name', 'timestamp', 'failure_mode', 'in_scope')
+
+DEFAULT_N_FEATURES = 1 << 16
+DEFAULT_BATCH_SIZE = 1024
+
+# Keeps site codes (DFW10), N+1, cross-connect and 2.5mw as single tokens
+TOKEN_RE = re.compile(r"[0-9a-zäöüß]+(?:[+\-.'][0-9a-zäöüß]+)*\+?")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can could do does for from has have how i in is it me my of on or our
+please should so that the their there this to us was we what when where which who will with would
+you your
+""".split())
+
+# Match rate thresholds for labeling clusters without seeded labels
+IN_SCOPE_MATCH_RATE = 0.5
+PARTIAL_MATCH_RATE = 0.1
+
+
+class Query(NamedTuple):
+    text: str
+    timestamp: str = ''
+    matched: Optional[bool] = None
+    label: Optional[str] = None
+
+
+class SparseRows(NamedTuple):
+    """CSR rows: row i is indices/data[indptr[i]:indptr[i + 1]]"""
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def non_empty(self) -> np.ndarray:
+        """Rows with at least one feature (queries of only stopwords have none)"""
+        return np.flatnonzero(np.diff(self.indptr) > 0)
+
+    def row_ids(self) -> np.ndarray:
+        """Row number of every stored value"""
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def take(self, rows: np.ndarray) -> 'SparseRows':
+        """Subset of rows (in the given order)"""
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return SparseRows(indptr, self.indices[positions], self.data[positions])
+
+
+# ----------------------------------------------------------------------
+# Input
+# ----------------------------------------------------------------------
+
+def iter_telemetry(path: str) -> Iterator[Query]:
+    """Queries from TelemetryLogger logs (compact records carry no text and are skipped)"""
+    for record in merge_streams(path):
+        text = record.get('original_query')
+        if text and 'query_rewrite_time_ms' in record:
+            yield Query(text, record.get('timestamp', ''), bool(record.get('matched_entities')))
+
+
+def iter_csv(path: str) -> Iterator[Query]:
+    """Queries from a CSV with a 'conversation' (or 'query') column"""
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            text = row.get('conversation') or row.get('query')
+            if text:
+                yield Query(text, row.get('timestamp', ''), None, row.get('cluster_final') or None)
+
+
+def read_cluster_labels(path: str) -> Dict[str, Dict[str, str]]:
+    """cluster_final -> {cluster_name, failure_mode, in_scope} from a query_analysis.csv"""
+    labels = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            cluster = row.get('cluster_final')
+            if cluster not in (None, '') and cluster not in labels:
+                labels[cluster] = {
+                    'cluster_name': row.get('cluster_name', ''),
+                    'failure_mode': row.get('failure_mode', ''),
+                    'in_scope': row.get('in_scope', '')
+                }
+    return labels
+
+
+# ----------------------------------------------------------------------
+# Vectors
+# ----------------------------------------------------------------------
+
+class HashingVectorizer:
+    """
+    Words + word bigrams hashed into n_features columns (no vocabulary to grow)
+    """
+
+    def __init__(self, n_features: int = DEFAULT_N_FEATURES):
+        self.n_features = n_features
+        self._cache = {}
+        # One readable token per feature, for naming clusters
+        self.feature_names = {}
+
+    def _index(self, token: str) -> int:
+        index = self._cache.get(token)
+        if index is None:
+            index = zlib.crc32(token.encode('utf-8')) % self.n_features
+            if len(self._cache) < 1_000_000:
+                self._cache[token] = index
+            self.feature_names.setdefault(index, token)
+        return index
+
+    def tokens(self, text: str) -> List[str]:
+        words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def transform(self, texts: Iterable[str]) -> SparseRows:
+        """Raw term counts as CSR rows"""
+        indptr = [0]
+        indices = []
+        for text in texts:
+            indices.extend(self._index(token) for token in self.tokens(text))
+            indptr.append(len(indices))
+        indptr = np.asarray(indptr, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int32)
+        # Merge repeated features within each row into counts
+        row_ids = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        keys, counts = np.unique(row_ids * self.n_features + indices, return_counts=True)
+        rows = keys // self.n_features
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(indptr) - 1))))
+        return SparseRows(indptr, (keys % self.n_features).astype(np.int32), counts.astype(np.float32))
+
+
+def document_frequency(counts: SparseRows, n_features: int) -> np.ndarray:
+    return np.bincount(counts.indices, minlength=n_features).astype(np.float64)
+
+
+def smooth_idf(df: np.ndarray, n_docs: int) -> np.ndarray:
+    return (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+
+
+def tfidf(counts: SparseRows, idf: np.ndarray) -> SparseRows:
+    """Sublinear TF-IDF, L2-normalized per row"""
+    data = (1 + np.log(counts.data)) * idf[counts.indices]
+    norms = np.sqrt(np.bincount(counts.row_ids(), weights=data * data, minlength=len(counts)))
+    norms[norms == 0] = 1.0
+    data = data / norms[counts.row_ids()]
+    return SparseRows(counts.indptr, counts.indices, data.astype(np.float32))
+
+
+def row_sums(values: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """Sum values[..., indptr[i]:indptr[i + 1]] per row (empty rows -> 0)"""
+    n_rows = len(indptr) - 1
+    if values.shape[-1] == 0:
+        return np.zeros(values.shape[:-1] + (n_rows,), dtype=values.dtype)
+    starts = np.minimum(indptr[:-1], values.shape[-1] - 1)
+    sums = np.add.reduceat(values, starts, axis=-1)
+    sums[..., np.diff(indptr) == 0] = 0
+    return sums
+
+
+# ----------------------------------------------------------------------
+# Mini-batch k-means
+# ----------------------------------------------------------------------
+
+class MiniBatchKMeans:
+    """
+    Mini-batch k-means over L2-normalized sparse rows with dense centers
+
+    Rows are assigned by cosine distance (spherical k-means). With plain
+    Euclidean distance, the averaged centers of big clusters have small
+    norms and pull in every short query.
+    """
+
+    def __init__(self, n_clusters: int, n_features: int, batch_size: int = DEFAULT_BATCH_SIZE,
+                 seed: int = 0):
+        self.n_clusters = n_clusters
+        self.n_features = n_features
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self.centers = np.zeros((n_clusters, n_features), dtype=np.float32)
+        self.counts = np.zeros(n_clusters, dtype=np.float64)
+
+    def _distances(self, rows: SparseRows) -> np.ndarray:
+        """Cosine distances (k, n) between centers and unit-norm rows"""
+        dots = row_sums(self.centers[:, rows.indices] * rows.data, rows.indptr)
+        center_norms = np.sqrt(np.einsum('ij,ij->i', self.centers, self.centers))
+        return 1.0 - dots / np.maximum(center_norms, 1e-12)[:, None]
+
+    def init_kmeans_pp(self, rows: SparseRows, sample_size: int = 4096):
+        """k-means++ seeding on a random sample of rows"""
+        candidates = rows.non_empty()
+        sample = rows.take(self.rng.choice(candidates, min(sample_size, len(candidates)), replace=False))
+        row_ids = sample.row_ids()
+        first = self.rng.integers(len(sample))
+        closest = np.full(len(sample), np.inf)
+        for j in range(self.n_clusters):
+            if j:
+                weights = np.maximum(closest, 0)
+                total = weights.sum()
+                first = (self.rng.choice(len(sample), p=weights / total) if total > 0
+                         else self.rng.integers(len(sample)))
+            self.centers[j] = 0
+            mask = row_ids == first
+            self.centers[j, sample.indices[mask]] = sample.data[mask]
+            closest = np.minimum(closest, self._distances_to(j, sample))
+
+    def _distances_to(self, j: int, rows: SparseRows) -> np.ndarray:
+        center = self.centers[j]
+        norm = max(float(np.sqrt(center @ center)), 1e-12)
+        return 1.0 - row_sums(center[rows.indices] * rows.data, rows.indptr) / norm
+
+    def init_from_labels(self, rows: SparseRows, labels: np.ndarray):
+        """Centers = mean of the rows with each label (0..k-1; -1 = unlabeled)"""
+        keep = labels[rows.row_ids()] >= 0
+        np.add.at(self.centers, (labels[rows.row_ids()][keep], rows.indices[keep]), rows.data[keep])
+        sizes = np.bincount(labels[labels >= 0], minlength=self.n_clusters)
+        self.centers /= np.maximum(sizes, 1)[:, None]
+        self.counts = sizes.astype(np.float64)
+
+    def partial_fit(self, rows: SparseRows) -> np.ndarray:
+        """One mini-batch step; returns the batch's labels"""
+        labels = self._distances(rows).argmin(axis=0)
+        batch_counts = np.bincount(labels, minlength=self.n_clusters)
+        active = batch_counts > 0
+        self.counts += batch_counts
+        # c <- c + (b / N) * (mean(x) - c) for every center with b assigned rows
+        self.centers[active] *= (1 - batch_counts[active] / self.counts[active])[:, None].astype(np.float32)
+        value_labels = labels[rows.row_ids()]
+        np.add.at(self.centers, (value_labels, rows.indices),
+                  (rows.data / self.counts[value_labels]).astype(np.float32))
+        return labels
+
+    def fit(self, rows: SparseRows, epochs: int = 3, tol: float = 1e-4):
+        """Shuffled mini-batches over the rows, `epochs` times (or until the centers settle)"""
+        for _ in range(epochs):
+            before = self.centers.copy()
+            won = np.zeros(self.n_clusters, dtype=np.int64)
+            order = self.rng.permutation(len(rows))
+            for start in range(0, len(rows), self.batch_size):
+                labels = self.partial_fit(rows.take(order[start:start + self.batch_size]))
+                won += np.bincount(labels, minlength=self.n_clusters)
+            self._reseed(rows, np.flatnonzero(won == 0))
+            if float(np.square(self.centers - before).sum()) < tol * self.n_clusters:
+                break
+        return self
+
+    def _reseed(self, rows: SparseRows, empty: np.ndarray):
+        """Move clusters that won no rows onto the worst-fitting rows"""
+        if not len(empty):
+            return
+        self.counts[empty] = 0
+        candidates = rows.non_empty()
+        sample = rows.take(self.rng.choice(candidates, min(len(candidates), 4 * self.batch_size),
+                                           replace=False))
+        worst = np.argsort(-self._distances(sample).min(axis=0))[:len(empty)]
+        row_ids = sample.row_ids()
+        for j, row in zip(empty, worst):
+            self.centers[j] = 0
+            mask = row_ids == row
+            self.centers[j, sample.indices[mask]] = sample.data[mask]
+
+    def predict(self, rows: SparseRows) -> Tuple[np.ndarray, np.ndarray]:
+        """(labels, cosine distance to the assigned center), in batches"""
+        labels = np.empty(len(rows), dtype=np.int64)
+        distances = np.empty(len(rows), dtype=np.float64)
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows.take(np.arange(start, min(start + self.batch_size, len(rows))))
+            d = self._distances(batch)
+            labels[start:start + len(batch)] = d.argmin(axis=0)
+            distances[start:start + len(batch)] = d.min(axis=0)
+        return labels, distances
+
+
+# ----------------------------------------------------------------------
+# Model
+# ----------------------------------------------------------------------
+
+class QueryClusterModel:
+    """Vectorizer settings, IDF, centers and cluster labels; saved as .npz"""
+
+    def __init__(self, n_features: int = DEFAULT_N_FEATURES, batch_size: int = DEFAULT_BATCH_SIZE,
+                 seed: int = 0):
+        self.vectorizer = HashingVectorizer(n_features)
+        self.batch_size = batch_size
+        self.seed = seed
+        self.idf = None
+        self.kmeans = None
+        self.clusters = []      # per cluster: {cluster_final, cluster_name, failure_mode, in_scope}
+
+    def vectors(self, texts: Iterable[str]) -> SparseRows:
+        return tfidf(self.vectorizer.transform(texts), self.idf)
+
+    def fit(self, queries: List[Query], n_clusters: int,
+            seed_labels: Optional[Dict[str, Dict[str, str]]] = None, epochs: int = 3):
+        """
+        Fit IDF and centers on queries
+
+        Args:
+            n_clusters: Number of clusters (at least the number of seeded ones)
+            seed_labels: cluster_final -> labels (read_cluster_labels); queries
+                whose Query.label is one of them seed those clusters' centers
+        """
+        counts = self.vectorizer.transform(q.text for q in queries)
+        self.idf = smooth_idf(document_frequency(counts, self.vectorizer.n_features), len(queries))
+        rows = tfidf(counts, self.idf)
+
+        seeded = sorted(seed_labels or {}, key=lambda c: (len(c), c))
+        n_clusters = max(n_clusters, len(seeded))
+        self.kmeans = MiniBatchKMeans(n_clusters, self.vectorizer.n_features, self.batch_size, self.seed)
+        if seeded:
+            position = {c: i for i, c in enumerate(seeded)}
+            labels = np.array([position.get(q.label, -1) for q in queries])
+            self.kmeans.init_from_labels(rows, labels)
+            if n_clusters > len(seeded):
+                # Extra clusters start on the rows the seeded centers fit worst
+                self.kmeans._reseed(rows, np.arange(len(seeded), n_clusters))
+        else:
+            self.kmeans.init_kmeans_pp(rows)
+        self.kmeans.fit(rows, epochs=epochs)
+
+        self.clusters = [dict(seed_labels[c], cluster_final=c) for c in seeded]
+        next_id = max([int(c) for c in seeded if c.isdigit()] + [-1]) + 1
+        for j in range(len(seeded), n_clusters):
+            self.clusters.append({'cluster_final': str(next_id), 'cluster_name': '',
+                                  'failure_mode': '', 'in_scope': ''})
+            next_id += 1
+        labels, _ = self.kmeans.predict(rows)
+        self._label_new_clusters(queries, labels)
+        return labels
+
+    def _label_new_clusters(self, queries: List[Query], labels: np.ndarray):
+        """Name unlabeled clusters after their top terms; scope from match rate when known"""
+        known = np.array([q.matched is not None for q in queries])
+        matched = np.array([bool(q.matched) for q in queries])
+        for j, cluster in enumerate(self.clusters):
+            if cluster['cluster_name']:
+                continue
+            cluster['cluster_name'] = ' / '.join(self.top_terms(j, 3)) or f"Cluster {cluster['cluster_final']}"
+            members = (labels == j) & known
+            if not members.any():
+                continue
+            rate = matched[members].mean()
+            if rate >= IN_SCOPE_MATCH_RATE:
+                cluster['in_scope'], cluster['failure_mode'] = 'Yes', ''
+            elif rate >= PARTIAL_MATCH_RATE:
+                cluster['in_scope'], cluster['failure_mode'] = 'Partial', 'Partial Match'
+            else:
+                cluster['in_scope'], cluster['failure_mode'] = 'No', 'No-Hit (Out-of-Scope)'
+
+    def top_terms(self, cluster: int, n: int = 10) -> List[str]:
+        center = self.kmeans.centers[cluster]
+        order = np.argsort(-center)[:n * 2]
+        names = [self.vectorizer.feature_names.get(int(i)) for i in order if center[i] > 0]
+        return [name for name in names if name][:n]
+
+    def assign(self, queries: List[Query], update: bool = False) -> np.ndarray:
+        """Nearest existing cluster per query; update=True also moves the centers"""
+        rows = self.vectors(q.text for q in queries)
+        if update:
+            for start in range(0, len(rows), self.batch_size):
+                self.kmeans.partial_fit(rows.take(np.arange(start, min(start + self.batch_size, len(rows)))))
+        return self.kmeans.predict(rows)[0]
+
+    def rows(self, queries: List[Query], labels: np.ndarray) -> Iterator[dict]:
+        """query_analysis.csv rows"""
+        for query, label in zip(queries, labels):
+            cluster = self.clusters[label]
+            yield {
+                'conversation': query.text,
+                'cluster_final': cluster['cluster_final'],
+                'cluster_name': cluster['cluster_name'],
+                'timestamp': query.timestamp,
+                'failure_mode': cluster['failure_mode'],
+                'in_scope': cluster['in_scope']
+            }
+
+    def save(self, path: str):
+        # Names only for features some center uses (for top_terms after loading)
+        used = self.kmeans.centers.any(axis=0)
+        names = {str(k): v for k, v in self.vectorizer.feature_names.items() if used[k]}
+        np.savez_compressed(
+            path,
+            centers=self.kmeans.centers,
+            counts=self.kmeans.counts,
+            idf=self.idf,
+            meta=np.array(json.dumps({
+                'version': MODEL_FORMAT_VERSION,
+                'n_features': self.vectorizer.n_features,
+                'batch_size': self.batch_size,
+                'seed': self.seed,
+                'clusters': self.clusters,
+                'feature_names': names
+            }))
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'QueryClusterModel':
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            model = cls(meta['n_features'], meta['batch_size'], meta['seed'])
+            model.idf = data['idf']
+            model.kmeans = MiniBatchKMeans(len(meta['clusters']), meta['n_features'], meta['batch_size'],
+                                           meta['seed'])
+            model.kmeans.centers = data['centers']
+            model.kmeans.counts = data['counts']
+        model.clusters = meta['clusters']
+        model.vectorizer.feature_names = {int(k): v for k, v in meta['feature_names'].items()}
+        return model
+
+
+def load_queries(csv_paths: List[str], telemetry_paths: List[str]) -> List[Query]:
+    queries = []
+    for path in csv_paths or []:
+        queries.extend(iter_csv(path))
+    for path in telemetry_paths or []:
+        queries.extend(iter_telemetry(path))
+    return queries
+
+
+def write_csv(path: str, rows: Iterable[dict]) -> int:
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster queries into the query_analysis.csv schema")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    fit = sub.add_parser('fit', help='Fit clusters and write the labeled CSV')
+    fit.add_argument('--k', type=int, default=5, help='Number of clusters')
+    fit.add_argument('--seed-labels', help='query_analysis.csv whose clusters seed the centers and names')
+    fit.add_argument('--epochs', type=int, default=3)
+    fit.add_argument('--n-features', type=int, default=DEFAULT_N_FEATURES)
+    fit.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    fit.add_argument('--seed', type=int, default=0)
+
+    assign = sub.add_parser('assign', help='Assign queries to the clusters of a saved model')
+    assign.add_argument('--update', action='store_true', help='Also move the centers (saved to --model)')
+
+    for command in (fit, assign):
+        command.add_argument('--csv', action='append', default=[], help="CSV with a 'conversation' column")
+        command.add_argument('--telemetry', action='append', default=[], help='TelemetryLogger log path')
+        command.add_argument('--model', default='outputs/query_clusters.npz')
+        command.add_argument('--out', default='outputs/query_analysis.csv')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    queries = load_queries(args.csv, args.telemetry)
+    if not queries:
+        parser.error('no queries: pass --csv and/or --telemetry')
+    print(f"Loaded {len(queries)} queries in {time.perf_counter() - start:.1f}s")
+
+    if args.command == 'fit':
+        model = QueryClusterModel(args.n_features, args.batch_size, args.seed)
+        seed_labels = read_cluster_labels(args.seed_labels) if args.seed_labels else None
+        labels = model.fit(queries, args.k, seed_labels, args.epochs)
+        model.save(args.model)
+    else:
+        model = QueryClusterModel.load(args.model)
+        labels = model.assign(queries, update=args.update)
+        if args.update:
+            model.save(args.model)
+
+    written = write_csv(args.out, model.rows(queries, labels))
+    sizes = np.bincount(labels, minlength=len(model.clusters))
+    for j, cluster in enumerate(model.clusters):
+        print(f"  {cluster['cluster_final']:>3} {cluster['cluster_name'][:40]:<40} {sizes[j]:>8} "
+              f"{cluster['in_scope'] or '-'}")
+    print(f"✓ {written} rows written to {args.out} in {time.perf_counter() - start:.1f}s "
+          f"(model: {args.model})")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,21 +11,26 @@ Combines all components:
 Version: 0.2.0
 Last Updated: 2025-11-21
 Changes: Added enhanced normalization (whitespace, punctuation removal)
+
+The module-level functions compile each lexicon dict once and reuse the
+snapshot while the dict and its build_timestamp stay the same. Callers
+that edit a lexicon dict in place (add a synonym, drop an entity) must
+call invalidate_lexicon(lexicon) afterwards; re-hashing the whole
+lexicon on every query would cost about as much as the rewrite itself.
 """
 
 import json
-import re
-import time
-from performance_monitor import PerformanceMonitor
-from telemetry_logger import TelemetryLogger
-from disambiguation_rules import Disambiguator
+import threading
+from collections import OrderedDict
+from rewriter_context import RewriterContext, get_default_context
+from rewriter_engine import RewriterEngine, normalize_query  # noqa: F401 (re-export)
 
 __version__ = "0.2.0"
 
-# Global instances
-_monitor = PerformanceMonitor()
-_telemetry = TelemetryLogger()
-_disambiguator = Disambiguator()
+# Compiled engines for recently used lexicon dicts (see _engine_for)
+_MAX_CACHED_ENGINES = 4
+_engines = OrderedDict()
+_engines_lock = threading.Lock()
 
 
 def load_lexicon(lexicon_path='data/ontology_runtime.json'):
@@ -41,31 +46,75 @@ def load_lexicon(lexicon_path='data/ontology_runtime.json'):
         return None
 
 
-def normalize_query(user_input: str) -> str:
+def _engine_for(lexicon: dict) -> RewriterEngine:
+    """
+    RewriterEngine compiled for a lexicon dict, cached by identity and
+    build_timestamp
+    
+    The cache entry keeps a reference to the lexicon, so its id() can't be
+    reused by another dict while the entry is alive. Replacing the dict's
+    contents with a rebuilt artifact changes build_timestamp and recompiles;
+    other in-place edits need invalidate_lexicon().
+    """
+    key = id(lexicon)
+    built = lexicon.get('build_timestamp')
+    with _engines_lock:
+        entry = _engines.get(key)
+        if entry is not None and entry[0] is lexicon and entry[1] == built:
+            _engines.move_to_end(key)
+            return entry[2]
+    
+    engine = RewriterEngine(lexicon)
+    with _engines_lock:
+        _engines[key] = (lexicon, built, engine)
+        _engines.move_to_end(key)
+        while len(_engines) > _MAX_CACHED_ENGINES:
+            _engines.popitem(last=False)
+    return engine
+
+
+def invalidate_lexicon(lexicon: dict = None):
     """
-    Enhanced query normalization
+    Drop the compiled engine for a lexicon dict (or every cached engine)
     
-    Process:
-    1. Lowercase
-    2. Strip leading/trailing whitespace
-    3. Normalize multiple spaces to single space
-    4. Remove punctuation (except hyphens and spaces)
+    Call after editing a lexicon dict in place; the next call recompiles it.
+    """
+    with _engines_lock:
+        if lexicon is None:
+            _engines.clear()
+        else:
+            _engines.pop(id(lexicon), None)
+
+
+def match_entities(query_lower: str, lexicon: dict) -> list:
+    """
+    Match canonical entity names, then synonyms, against a normalized query
     
     Args:
-        user_input: Original query string
+        query_lower: Output of normalize_query()
+        lexicon: Loaded ontology runtime artifact
     
     Returns:
-        Normalized query string
+        Matched canonical entity names (canonical matches first)
+    """
+    return _engine_for(lexicon).snapshot.match(query_lower)
+
+
+def expand_entities(matched_entities: list, lexicon: dict, max_expansions: int = 8) -> list:
+    """
+    Expand matched entities with weighted canonical, synonym and related terms
+    
+    Weights: canonical 1.0, synonym 0.8, related 0.6 (max 3 per entity)
+    
+    Args:
+        matched_entities: Output of match_entities()
+        lexicon: Loaded ontology runtime artifact
+        max_expansions: Cap on the number of expanded terms
     
-    Examples:
-        "  Is  SF   available???  " -> "is sf available"
-        "What's the capacity?" -> "whats the capacity"
+    Returns:
+        List of {'term', 'weight', 'source'} dicts
     """
-    query = user_input.lower()
-    query = query.strip()
-    query = ' '.join(query.split())
-    query = re.sub(r'[^\w\s-]', '', query)
-    return query
+    return _engine_for(lexicon).snapshot.expand(matched_entities, max_expansions)
 
 
 def rewrite_query(user_input: str, 
@@ -73,10 +122,17 @@ def rewrite_query(user_input: str,
                   track_performance=False,
                   log_telemetry=False,
                   use_disambiguation=True,
-                  user_id='anonymous') -> dict:
+                  user_id='anonymous',
+                  trace_stages=False,
+                  context: RewriterContext = None) -> dict:
     """
     Enhanced query rewriting with all features
     
+    Delegates to a RewriterEngine compiled once per lexicon dict (call
+    invalidate_lexicon() after editing the dict in place). Long-lived
+    services should hold their own RewriterEngine and call reload() when
+    the artifact changes.
+    
     Args:
         user_input: Original user query
         lexicon: Loaded ontology runtime artifact
@@ -84,6 +140,10 @@ def rewrite_query(user_input: str,
         log_telemetry: Enable telemetry logging
         use_disambiguation: Enable disambiguation
         user_id: User identifier (hashed if logging enabled)
+        trace_stages: Time each stage separately; stage timings are recorded
+            in the monitor as 'rewrite.<stage>' and in the telemetry record
+        context: RewriterContext supplying monitor/telemetry/disambiguator
+            (default: the lazily created process-wide context)
     
     Returns:
         {
@@ -96,17 +156,6 @@ def rewrite_query(user_input: str,
             'query_id': str (if logging)
         }
     """
-    start_time = time.time()
-    
-    # Validate inputs
-    if not user_input or not user_input.strip():
-        return {
-            'original_query': user_input,
-            'matched_entities': [],
-            'expanded_terms': [],
-            'expansion_count': 0
-        }
-    
     if not lexicon or 'entities' not in lexicon:
         return {
             'original_query': user_input,
@@ -115,115 +164,25 @@ def rewrite_query(user_input: str,
             'expansion_count': 0
         }
     
-    # 1. Get disambiguation context
-    disambiguation_context = {}
-    if use_disambiguation:
-        disambiguation_context = _disambiguator.get_disambiguation_context(user_input)
-    
-    # 2. Enhanced normalization
-    query_lower = normalize_query(user_input)
-    
-    # 3. Match canonical entity names
-    matched_entities = []
-    for entity_name, entity_data in lexicon['entities'].items():
-        entity_lower = entity_name.lower()
-        pattern = r'\b' + re.escape(entity_lower) + r'\b'
-        
-        if re.search(pattern, query_lower):
-            matched_entities.append(entity_name)
-    
-    # 4. Match synonyms
-    for entity_name, entity_data in lexicon['entities'].items():
-        if entity_name in matched_entities:
-            continue
-        
-        synonyms = entity_data.get('synonyms', [])
-        for syn in synonyms:
-            syn_lower = syn.lower()
-            pattern = r'\b' + re.escape(syn_lower) + r'\b'
-            
-            if re.search(pattern, query_lower):
-                matched_entities.append(entity_name)
-                break
-    
-    # 5. Expand with synonyms and related terms
-    expanded_terms = []
-    for entity_name in matched_entities:
-        entity_data = lexicon['entities'][entity_name]
-        
-        # Canonical (1.0)
-        expanded_terms.append({
-            'term': entity_name,
-            'weight': 1.0,
-            'source': 'canonical'
-        })
-        
-        # Synonyms (0.8)
-        for syn in entity_data.get('synonyms', []):
-            expanded_terms.append({
-                'term': syn,
-                'weight': 0.8,
-                'source': 'synonym'
-            })
-        
-        # Related terms (0.6, max 3)
-        for related in entity_data.get('related_terms', [])[:3]:
-            expanded_terms.append({
-                'term': related,
-                'weight': 0.6,
-                'source': 'related'
-            })
-    
-    # 6. Limit to 8 expansions
-    if len(expanded_terms) > 8:
-        expanded_terms = expanded_terms[:8]
-    
-    # Calculate timing
-    end_time = time.time()
-    total_time_ms = (end_time - start_time) * 1000
-    
-    # 7. Track performance
-    if track_performance:
-        _monitor.record('query_rewrite', total_time_ms)
-    
-    # Build result
-    result = {
-        'original_query': user_input,
-        'matched_entities': matched_entities,
-        'expanded_terms': expanded_terms,
-        'expansion_count': len(expanded_terms),
-        'disambiguation_context': disambiguation_context
-    }
-    
-    if track_performance:
-        result['performance'] = {
-            'total_time_ms': round(total_time_ms, 2)
-        }
-    
-    # 8. Log telemetry
-    if log_telemetry:
-        query_id = _telemetry.generate_query_id()
-        _telemetry.log_query(
-            query_id=query_id,
-            user_id=user_id,
-            original_query=user_input,
-            rewritten_query=result,
-            performance={'time_ms': total_time_ms},
-            metadata={'has_disambiguation': bool(disambiguation_context)}
-        )
-        result['query_id'] = query_id
-    
-    return result
+    return _engine_for(lexicon).rewrite(
+        user_input,
+        track_performance=track_performance,
+        log_telemetry=log_telemetry,
+        use_disambiguation=use_disambiguation,
+        user_id=user_id,
+        trace_stages=trace_stages,
+        context=context
+    )
 
 
 def get_performance_report():
     """Get performance statistics"""
-    return _monitor.get_stats()
+    return get_default_context().monitor.get_stats()
 
 
 def print_performance_report():
     """Print formatted performance report"""
-    stats = _monitor.get_stats('query_rewrite')
+    stats = get_default_context().monitor.get_stats('query_rewrite')
     if stats:
         print("\nPerformance Statistics:")
         print(f"  Queries: {stats['count']}")
@@ -233,7 +192,7 @@ def print_performance_report():
 
 def get_telemetry_statistics():
     """Get telemetry statistics"""
-    return _telemetry.get_statistics()
+    return get_default_context().telemetry.get_statistics()
 
 
 # Test function
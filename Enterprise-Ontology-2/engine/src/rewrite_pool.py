@@ -0,0 +1,327 @@
+"""
+Rewrite Pool
+
+Runs the v2 query rewriter across several worker processes so traffic
+replays are not limited to a single core.
+
+The runtime artifact is loaded once in the parent. With the 'fork' start
+method the workers inherit it copy-on-write; otherwise each worker loads it
+once at startup. Queries are sent to workers in chunks over pipes and the
+results are reassembled in input order.
+
+A query that raises inside a worker fails the whole map() call with
+RewriteWorkerError; the worker keeps running. A worker that cannot load
+the lexicon (spawn/forkserver, or a respawn after the file went missing)
+answers every chunk with RewriteWorkerError instead of empty rewrites. Every message carries the
+generation of the map() call that sent it, outstanding replies are drained
+before a failed call returns, and workers that died are respawned, so the
+next call starts on a clean pool.
+
+Usage:
+    with RewritePool(processes=4) as pool:
+        results = pool.map(queries)
+        print(pool.get_worker_stats())
+
+    # From async code (e.g. a FastAPI endpoint)
+    results = await pool.amap(queries)
+"""
+
+import asyncio
+import multiprocessing as mp
+import os
+import threading
+import time
+import traceback
+from multiprocessing.connection import wait
+from typing import Dict, List, Optional
+
+from query_rewriter_v2_enhanced import load_lexicon, rewrite_query
+
+
+# Lexicon inherited by forked workers (set in the parent before start)
+_inherited_lexicon = None
+
+
+class RewriteWorkerError(RuntimeError):
+    """A rewrite failed inside a worker (message carries the worker traceback)"""
+
+
+def _worker_main(conn, lexicon_path: str, rewrite_options: dict):
+    """
+    Worker loop: receive chunks, rewrite them, send results back
+
+    Messages in:  (generation, chunk_id, [query, ...]) or None to stop
+    Messages out: (generation, chunk_id, [result, ...] or RewriteWorkerError, busy_seconds)
+    """
+    lexicon = _inherited_lexicon
+    load_error = None
+    if lexicon is None:
+        lexicon = load_lexicon(lexicon_path)
+        if lexicon is None:
+            # Answer every chunk with the error rather than empty rewrites
+            load_error = RewriteWorkerError(
+                f"Could not load lexicon from {lexicon_path} in worker {os.getpid()}")
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        generation, chunk_id, queries = message
+        if load_error is not None:
+            conn.send((generation, chunk_id, load_error, 0.0))
+            continue
+        start = time.perf_counter()
+        try:
+            results = [rewrite_query(q, lexicon, **rewrite_options) for q in queries]
+        except Exception:
+            # Sent back as text: arbitrary exceptions may not pickle
+            results = RewriteWorkerError(f"Rewrite failed in worker {os.getpid()}:\n"
+                                         f"{traceback.format_exc()}")
+        conn.send((generation, chunk_id, results, time.perf_counter() - start))
+
+    conn.close()
+
+
+class RewritePool:
+    """
+    Pool of rewriter worker processes sharing one read-only lexicon
+
+    Tracks per-worker throughput: chunks, queries, busy time, queries/sec
+    """
+
+    def __init__(self,
+                 lexicon_path: str = 'data/ontology_runtime.json',
+                 processes: Optional[int] = None,
+                 chunk_size: int = 64,
+                 start_method: Optional[str] = None,
+                 **rewrite_options):
+        """
+        Args:
+            lexicon_path: Path to the ontology runtime artifact
+            processes: Number of workers (default: CPU count)
+            chunk_size: Queries sent to a worker per message
+            start_method: 'fork', 'spawn' or 'forkserver' (default: fork when available)
+            **rewrite_options: Passed through to rewrite_query
+                (e.g. use_disambiguation=False)
+        """
+        self.lexicon_path = lexicon_path
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        if start_method is None:
+            start_method = 'fork' if 'fork' in mp.get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+        self.rewrite_options = rewrite_options
+
+        self._workers = []
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._ctx = None
+
+    def start(self):
+        """Load the lexicon and start the worker processes"""
+        global _inherited_lexicon
+
+        if self._workers:
+            return self
+
+        self._ctx = mp.get_context(self.start_method)
+        if self.start_method == 'fork':
+            _inherited_lexicon = load_lexicon(self.lexicon_path)
+            if _inherited_lexicon is None:
+                raise RuntimeError(f"Could not load lexicon from {self.lexicon_path}")
+
+        try:
+            for _ in range(self.processes):
+                self._workers.append(self._spawn())
+        finally:
+            # Workers hold their own copy; don't pin it in the parent
+            _inherited_lexicon = None
+
+        return self
+
+    def _spawn(self):
+        """Start one worker process; returns (process, parent_conn)"""
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.lexicon_path, self.rewrite_options),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._stats[process.pid] = {
+            'chunks': 0,
+            'queries': 0,
+            'busy_seconds': 0.0
+        }
+        return process, parent_conn
+
+    def _replace_dead(self, dead_conns):
+        """Respawn workers whose pipe broke (the lexicon is reloaded from disk)"""
+        for index, (process, conn) in enumerate(self._workers):
+            if conn in dead_conns:
+                conn.close()
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+                self._workers[index] = self._spawn()
+
+    def close(self):
+        """Stop all worker processes"""
+        for process, conn in self._workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process, conn in self._workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def map(self, queries: List[str]) -> List[dict]:
+        """
+        Rewrite queries across the pool
+
+        Args:
+            queries: Query strings
+
+        Returns:
+            Rewrite results in the same order as the input
+
+        Raises:
+            RewriteWorkerError: A query raised inside a worker, or a worker
+                could not load the lexicon
+            RuntimeError: A worker process died (it is respawned)
+        """
+        if not self._workers:
+            self.start()
+
+        chunks = [queries[i:i + self.chunk_size]
+                  for i in range(0, len(queries), self.chunk_size)]
+        results = [None] * len(chunks)
+
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            conn_to_pid = {conn: process.pid for process, conn in self._workers}
+            pending = list(range(len(chunks)))
+            pending.reverse()
+            in_flight = {}
+            dead = set()
+            error = None
+
+            def dispatch(conn):
+                nonlocal error
+                chunk_id = pending.pop()
+                try:
+                    conn.send((generation, chunk_id, chunks[chunk_id]))
+                except (BrokenPipeError, OSError):
+                    dead.add(conn)
+                    error = error or RuntimeError(
+                        f"Rewrite worker {conn_to_pid[conn]} exited unexpectedly")
+                    return
+                in_flight[conn] = chunk_id
+
+            # Prime every worker with one chunk, then refill as results arrive
+            for process, conn in self._workers:
+                if not pending or error is not None:
+                    break
+                dispatch(conn)
+
+            # After a failure, stop dispatching but still drain every
+            # outstanding reply so none is left in a pipe for the next call
+            while in_flight:
+                for conn in wait(list(in_flight)):
+                    try:
+                        reply_generation, chunk_id, chunk_results, busy = conn.recv()
+                    except (EOFError, OSError):
+                        del in_flight[conn]
+                        dead.add(conn)
+                        error = error or RuntimeError(
+                            f"Rewrite worker {conn_to_pid[conn]} exited unexpectedly")
+                        continue
+                    if reply_generation != generation:
+                        continue  # Stale reply from an earlier call
+                    del in_flight[conn]
+
+                    if isinstance(chunk_results, BaseException):
+                        error = error or chunk_results
+                    else:
+                        results[chunk_id] = chunk_results
+                        stats = self._stats[conn_to_pid[conn]]
+                        stats['chunks'] += 1
+                        stats['queries'] += len(chunk_results)
+                        stats['busy_seconds'] += busy
+
+                    if pending and error is None:
+                        dispatch(conn)
+
+            if dead:
+                self._replace_dead(dead)
+            if error is not None:
+                raise error
+
+        return [result for chunk in results for result in chunk]
+
+    async def amap(self, queries: List[str]) -> List[dict]:
+        """Async wrapper around map() that runs it in the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.map, queries)
+
+    def get_worker_stats(self) -> Dict[int, dict]:
+        """
+        Get per-worker throughput
+
+        Returns:
+            {pid: {'chunks', 'queries', 'busy_seconds', 'queries_per_sec'}}
+        """
+        report = {}
+        for pid, stats in self._stats.items():
+            busy = stats['busy_seconds']
+            report[pid] = {
+                **stats,
+                'queries_per_sec': stats['queries'] / busy if busy > 0 else 0.0
+            }
+        return report
+
+
+# Test function
+if __name__ == "__main__":
+    import csv
+
+    print("Testing RewritePool...\n")
+
+    queries = []
+    try:
+        with open('../../query_analysis.csv', newline='') as f:
+            queries = [row['conversation'] for row in csv.DictReader(f)]
+    except FileNotFoundError:
+        queries = ["Is SF available at DFW10?", "Power capacity at PHX10"] * 500
+
+    start = time.perf_counter()
+    with RewritePool(processes=4, use_disambiguation=True) as pool:
+        results = pool.map(queries)
+        elapsed = time.perf_counter() - start
+
+        print(f"Rewrote {len(results)} queries in {elapsed:.2f}s "
+              f"({len(results) / elapsed:.0f} queries/sec)")
+        assert [r['original_query'] for r in results] == queries
+        print("✓ Results returned in input order\n")
+
+        print("Per-worker throughput:")
+        for pid, stats in pool.get_worker_stats().items():
+            print(f"  worker {pid}: {stats['queries']} queries, "
+                  f"{stats['queries_per_sec']:.0f} queries/sec")
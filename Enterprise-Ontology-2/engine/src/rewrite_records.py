@@ -0,0 +1,119 @@
+"""
+Rewrite Records
+
+Compact record types for rewrite output:
+- ExpandedTerm: immutable (term, weight, source) named tuple. The compiled
+  lexicon builds one per lexicon term up front, and every rewrite
+  references those shared instances instead of allocating new dicts.
+- RewriteResult: __slots__ record for one rewrite. to_dict() returns
+  the dict format used by the API and telemetry.
+
+Source labels are interned, so every record shares the same three strings.
+
+Usage:
+    record = engine.rewrite_record("Is SF available at DFW10?")
+    record.matched_entities           # ('DFW10', 'ServiceFabric')
+    record.expanded_terms[0].term     # 'DFW10'
+    json.dumps(record, default=encode_record)
+    json.dumps(record.expanded_terms[0].to_dict())   # not the tuple itself
+"""
+
+import sys
+from typing import NamedTuple, Optional, Tuple
+
+SOURCE_CANONICAL = sys.intern('canonical')
+SOURCE_SYNONYM = sys.intern('synonym')
+SOURCE_RELATED = sys.intern('related')
+
+
+class ExpandedTerm(NamedTuple):
+    """One weighted expansion term"""
+    term: str
+    weight: float
+    source: str
+
+    def to_dict(self) -> dict:
+        return {'term': self.term, 'weight': self.weight, 'source': self.source}
+
+
+class RewriteResult:
+    """
+    Output of one rewrite
+
+    matched_entities and expanded_terms are tuples; expanded_terms holds
+    ExpandedTerm instances shared with the compiled lexicon.
+    """
+
+    __slots__ = ('original_query', 'matched_entities', 'expanded_terms',
+                 'disambiguation_context', 'performance', 'query_id')
+
+    def __init__(self,
+                 original_query: str,
+                 matched_entities: Tuple[str, ...] = (),
+                 expanded_terms: Tuple[ExpandedTerm, ...] = (),
+                 disambiguation_context: Optional[dict] = None,
+                 performance: Optional[dict] = None,
+                 query_id: Optional[str] = None):
+        self.original_query = original_query
+        self.matched_entities = matched_entities
+        self.expanded_terms = expanded_terms
+        self.disambiguation_context = disambiguation_context
+        self.performance = performance
+        self.query_id = query_id
+
+    @property
+    def expansion_count(self) -> int:
+        return len(self.expanded_terms)
+
+    def to_dict(self) -> dict:
+        """
+        Dict in the rewrite_query() result format
+
+        Optional keys ('disambiguation_context', 'performance', 'query_id')
+        are only present when set, as before.
+        """
+        result = {
+            'original_query': self.original_query,
+            'matched_entities': list(self.matched_entities),
+            'expanded_terms': [{'term': t, 'weight': w, 'source': s}
+                               for t, w, s in self.expanded_terms],
+            'expansion_count': len(self.expanded_terms)
+        }
+        if self.disambiguation_context is not None:
+            result['disambiguation_context'] = self.disambiguation_context
+        if self.performance is not None:
+            result['performance'] = self.performance
+        if self.query_id is not None:
+            result['query_id'] = self.query_id
+        return result
+
+    def __repr__(self) -> str:
+        return (f"RewriteResult({self.original_query!r}, matched={self.matched_entities!r}, "
+                f"expansions={len(self.expanded_terms)})")
+
+
+def encode_record(obj):
+    """
+    json.dumps(default=...) hook for RewriteResult
+
+    json encodes named tuples natively, as [term, weight, source] lists, so the
+    hook is never called for a bare ExpandedTerm; call term.to_dict() first
+    """
+    if isinstance(obj, RewriteResult):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# Test function
+if __name__ == "__main__":
+    import json
+
+    print("Testing rewrite records...\n")
+
+    terms = (ExpandedTerm('ServiceFabric', 1.0, SOURCE_CANONICAL),
+             ExpandedTerm('SF', 0.8, SOURCE_SYNONYM))
+    record = RewriteResult("Is SF available?", ('ServiceFabric',), terms, disambiguation_context={})
+    print(record)
+    print(json.dumps(record, default=encode_record))
+    assert record.to_dict()['expansion_count'] == 2
+    print(f"\n✓ Record size: {sys.getsizeof(record)} bytes (+ shared terms)")
@@ -0,0 +1,117 @@
+"""
+Rewriter Context
+
+Holds the performance monitor, telemetry logger, disambiguator and tracer
+used by the query rewriter. Each component is created on first use, so
+importing the rewriter does no file IO (no artifact read, no outputs/
+directory) and stays cheap in read-only containers.
+
+Callers can inject their own components or a whole context:
+
+Usage:
+    ctx = RewriterContext(telemetry=TelemetryLogger('/tmp/telemetry.jsonl'))
+    result = rewrite_query(query, lexicon, log_telemetry=True, context=ctx)
+
+    # Or replace the process-wide default
+    set_default_context(ctx)
+"""
+
+import threading
+from typing import Optional
+
+
+class RewriterContext:
+    """
+    Lazily constructed rewriter dependencies
+
+    Components passed to the constructor are used as-is; the rest are
+    built on first access with the given paths.
+    """
+
+    def __init__(self,
+                 monitor=None,
+                 telemetry=None,
+                 disambiguator=None,
+                 tracer=None,
+                 telemetry_path: str = 'outputs/telemetry_logs.jsonl',
+                 ontology_path: Optional[str] = None):
+        """
+        Args:
+            monitor: PerformanceMonitor (default: created on first use)
+            telemetry: TelemetryLogger (default: created on first use)
+            disambiguator: Disambiguator (default: created on first use)
+            tracer: Tracer (default: created on first use, bound to the monitor)
+            telemetry_path: Storage path for the default TelemetryLogger
+            ontology_path: Runtime artifact for the default Disambiguator
+        """
+        self._monitor = monitor
+        self._telemetry = telemetry
+        self._disambiguator = disambiguator
+        self._disambiguator_injected = disambiguator is not None
+        self._tracer = tracer
+        self.telemetry_path = telemetry_path
+        self.ontology_path = ontology_path
+        self._lock = threading.Lock()
+
+    @property
+    def monitor(self):
+        if self._monitor is None:
+            with self._lock:
+                if self._monitor is None:
+                    from performance_monitor import PerformanceMonitor
+                    self._monitor = PerformanceMonitor(name='rewriter')
+        return self._monitor
+
+    @property
+    def telemetry(self):
+        if self._telemetry is None:
+            with self._lock:
+                if self._telemetry is None:
+                    from telemetry_logger import TelemetryLogger
+                    self._telemetry = TelemetryLogger(self.telemetry_path)
+        return self._telemetry
+
+    @property
+    def disambiguator(self):
+        if self._disambiguator is None:
+            with self._lock:
+                if self._disambiguator is None:
+                    from disambiguation_rules import Disambiguator
+                    self._disambiguator = Disambiguator(ontology_path=self.ontology_path)
+        return self._disambiguator
+
+    @property
+    def disambiguator_override(self):
+        """Disambiguator injected by the caller (None when it would be built lazily)"""
+        return self._disambiguator if self._disambiguator_injected else None
+
+    @property
+    def tracer(self):
+        if self._tracer is None:
+            monitor = self.monitor
+            with self._lock:
+                if self._tracer is None:
+                    from tracing import Tracer
+                    self._tracer = Tracer(monitor, prefix='rewrite')
+        return self._tracer
+
+
+_default_context = None
+_default_lock = threading.Lock()
+
+
+def get_default_context() -> RewriterContext:
+    """Process-wide context used when callers don't pass one"""
+    global _default_context
+    if _default_context is None:
+        with _default_lock:
+            if _default_context is None:
+                _default_context = RewriterContext()
+    return _default_context
+
+
+def set_default_context(context: Optional[RewriterContext]):
+    """Replace the process-wide context (None resets to a fresh lazy one)"""
+    global _default_context
+    with _default_lock:
+        _default_context = context
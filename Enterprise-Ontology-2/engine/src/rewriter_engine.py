@@ -0,0 +1,421 @@
+"""
+Rewriter Engine
+
+Explicit query rewriting object that owns an immutable compiled lexicon
+snapshot (matcher index, precomputed expansions, disambiguator) plus an
+optional result cache.
+
+rewrite() is safe to call from many threads. reload() compiles a new
+snapshot and swaps it in with a single reference assignment (copy-on-write):
+requests already running finish on the snapshot they started with.
+Several engines can run side by side with different lexicon versions.
+
+Usage:
+    engine = RewriterEngine(load_lexicon('data/ontology_runtime.json'), cache_size=10000)
+    result = engine.rewrite("Is SF available at DFW10?")
+    engine.reload(load_lexicon('data/ontology_runtime_v2.json'))
+"""
+
+import itertools
+import re
+import threading
+from collections import OrderedDict
+from time import perf_counter_ns
+from types import MappingProxyType
+from typing import Optional
+
+from disambiguation_rules import Disambiguator
+from rewrite_records import (
+    SOURCE_CANONICAL,
+    SOURCE_RELATED,
+    SOURCE_SYNONYM,
+    ExpandedTerm,
+    RewriteResult,
+)
+from rewriter_context import RewriterContext, get_default_context
+from tracing import NULL_TRACE
+
+# Expansion weights by source
+CANONICAL_WEIGHT = 1.0
+SYNONYM_WEIGHT = 0.8
+RELATED_WEIGHT = 0.6
+MAX_RELATED_PER_ENTITY = 3
+MAX_EXPANSIONS = 8
+
+_TOKEN_RE = re.compile(r'\w+|-')
+_PUNCTUATION_RE = re.compile(r'[^\w\s-]')
+
+_snapshot_ids = itertools.count(1)
+
+
+def normalize_query(user_input: str) -> str:
+    """
+    Enhanced query normalization
+
+    Process:
+    1. Lowercase
+    2. Strip leading/trailing whitespace
+    3. Normalize multiple spaces to single space
+    4. Remove punctuation (except hyphens and spaces)
+
+    Args:
+        user_input: Original query string
+
+    Returns:
+        Normalized query string
+
+    Examples:
+        "  Is  SF   available???  " -> "is sf available"
+        "What's the capacity?" -> "whats the capacity"
+    """
+    query = user_input.lower()
+    query = query.strip()
+    query = ' '.join(query.split())
+    query = _PUNCTUATION_RE.sub('', query)
+    return query
+
+
+def term_key(term: str) -> Optional[str]:
+    """
+    Matching key for a lexicon term: word tokens and hyphens joined by spaces
+
+    Mirrors the old per-term `\\b<term>\\b` regex search over the normalized
+    query: "co-location" matches "co-location" but not "co location".
+    Terms that normalization would alter (e.g. "N+1") could never match a
+    normalized query, so they get no key (None).
+    """
+    lowered = term.lower()
+    if normalize_query(lowered) != lowered:
+        return None
+    return ' '.join(_TOKEN_RE.findall(lowered))
+
+
+class PreparedQuery:
+    """
+    Normalized, tokenized query that can be shared between engines
+
+    Normalization does not depend on the lexicon, so shadow/A-B evaluation
+    prepares a query once and hands it to every engine.
+    """
+
+    __slots__ = ('original', 'normalized', 'tokens')
+
+    def __init__(self, original: str):
+        self.original = original
+        self.normalized = normalize_query(original)
+        self.tokens = tuple(_TOKEN_RE.findall(self.normalized))
+
+
+def _freeze(value):
+    """Recursively convert dicts/lists to read-only mappings/tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class CompiledLexicon:
+    """
+    Immutable, precompiled view of a runtime artifact
+
+    - term_index: term key -> ((entity position, is_canonical), ...)
+    - expansions: per-entity ExpandedTerm tuples in expansion order
+
+    Keys in the artifact's precomputed 'lookup' table (see
+    lexicon_validator.build_lookup) resolve to that single entity; keys it
+    lacks (older artifacts, entities edited after the build) fall back to
+    postings for every entity listing the term. A lookup entry naming an
+    entity that no longer lists the key is ignored the same way.
+    """
+
+    __slots__ = ('snapshot_id', 'version', 'build_timestamp', 'entities', 'entity_names',
+                 'positions', 'term_index', 'max_phrase_words', 'expansions', 'disambiguator')
+
+    def __init__(self, lexicon: dict):
+        self.snapshot_id = next(_snapshot_ids)
+        self.version = lexicon.get('version')
+        self.build_timestamp = lexicon.get('build_timestamp')
+        self.entities = _freeze(lexicon.get('entities', {}))
+        self.entity_names = tuple(self.entities)
+        self.positions = MappingProxyType({name: i for i, name in enumerate(self.entity_names)})
+
+        term_index = {}
+        max_words = 1
+        expansions = []
+        for position, (name, data) in enumerate(self.entities.items()):
+            keys = [(term_key(name), True)]
+            keys.extend((term_key(syn), False) for syn in data.get('synonyms', ()))
+            for key, is_canonical in keys:
+                if not key:
+                    continue
+                postings = term_index.setdefault(key, [])
+                if (position, is_canonical) not in postings:
+                    postings.append((position, is_canonical))
+                max_words = max(max_words, key.count(' ') + 1)
+
+            terms = [ExpandedTerm(name, CANONICAL_WEIGHT, SOURCE_CANONICAL)]
+            terms.extend(ExpandedTerm(syn, SYNONYM_WEIGHT, SOURCE_SYNONYM)
+                         for syn in data.get('synonyms', ()))
+            terms.extend(ExpandedTerm(rel, RELATED_WEIGHT, SOURCE_RELATED)
+                         for rel in data.get('related_terms', ())[:MAX_RELATED_PER_ENTITY])
+            expansions.append(tuple(terms))
+
+        for key, entry in (lexicon.get('lookup') or {}).items():
+            position = self.positions.get(entry.get('entity'))
+            # Only narrow to one of the key's own postings; a stale entry is skipped
+            owned = [p for p in term_index.get(key, ()) if p[0] == position]
+            if owned:
+                term_index[key] = owned[:1]
+
+        self.term_index = MappingProxyType({k: tuple(v) for k, v in term_index.items()})
+        self.max_phrase_words = max_words
+        self.expansions = tuple(expansions)
+        self.disambiguator = Disambiguator.from_artifact(lexicon)
+
+    def match(self, query_lower: str) -> list:
+        """
+        Match canonical names and synonyms in one pass over query n-grams
+
+        Returns:
+            Matched entity names: canonical matches first, then synonym
+            matches, each in lexicon order (same order as the old scan)
+        """
+        return self.match_tokens(_TOKEN_RE.findall(query_lower))
+
+    def match_tokens(self, tokens) -> list:
+        """match() over an already tokenized query (see PreparedQuery)"""
+        term_index = self.term_index
+        max_words = self.max_phrase_words
+        canonical_hits = set()
+        synonym_hits = set()
+
+        for i in range(len(tokens)):
+            phrase = tokens[i]
+            for n in range(max_words):
+                if n:
+                    if i + n >= len(tokens):
+                        break
+                    phrase = phrase + ' ' + tokens[i + n]
+                postings = term_index.get(phrase)
+                if postings:
+                    for position, is_canonical in postings:
+                        (canonical_hits if is_canonical else synonym_hits).add(position)
+
+        names = self.entity_names
+        matched = [names[p] for p in sorted(canonical_hits)]
+        matched.extend(names[p] for p in sorted(synonym_hits - canonical_hits))
+        return matched
+
+    def expand_records(self, matched_entities, max_expansions: int = MAX_EXPANSIONS) -> tuple:
+        """Shared ExpandedTerm instances for matched entities (capped at max_expansions)"""
+        expansions = self.expansions
+        positions = self.positions
+        if len(matched_entities) == 1:
+            return expansions[positions[matched_entities[0]]][:max_expansions]
+        expanded_terms = []
+        for name in matched_entities:
+            expanded_terms.extend(expansions[positions[name]])
+            if len(expanded_terms) >= max_expansions:
+                break
+        return tuple(expanded_terms[:max_expansions])
+
+    def expand(self, matched_entities: list, max_expansions: int = MAX_EXPANSIONS) -> list:
+        """Weighted expansion terms for matched entities as {'term', 'weight', 'source'} dicts"""
+        return [t.to_dict() for t in self.expand_records(matched_entities, max_expansions)]
+
+
+class RewriterEngine:
+    """
+    Thread-safe query rewriter over a swappable compiled lexicon snapshot
+    """
+
+    def __init__(self,
+                 lexicon: dict,
+                 context: Optional[RewriterContext] = None,
+                 cache_size: int = 0,
+                 max_expansions: int = MAX_EXPANSIONS):
+        """
+        Args:
+            lexicon: Loaded ontology runtime artifact
+            context: RewriterContext for monitor/telemetry/tracer
+                (default: the process-wide context)
+            cache_size: Max cached match/expansion results (0 disables caching)
+            max_expansions: Cap on expanded terms per query
+        """
+        self.context = context
+        self.cache_size = cache_size
+        self.max_expansions = max_expansions
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._snapshot = CompiledLexicon(lexicon)
+
+    @property
+    def snapshot(self) -> CompiledLexicon:
+        """Current compiled lexicon (read once per request)"""
+        return self._snapshot
+
+    def reload(self, lexicon: dict) -> CompiledLexicon:
+        """
+        Compile a new lexicon and swap it in
+
+        Compilation happens outside the swap, so concurrent rewrite() calls
+        never block; they see either the old or the new snapshot.
+        """
+        with self._reload_lock:
+            snapshot = CompiledLexicon(lexicon)
+            self._snapshot = snapshot
+            with self._cache_lock:
+                self._cache.clear()
+        return snapshot
+
+    @staticmethod
+    def prepare(user_input: str) -> PreparedQuery:
+        """Normalize and tokenize a query once (reusable across engines)"""
+        return PreparedQuery(user_input)
+
+    def _match_and_expand(self, snap: CompiledLexicon, prepared: PreparedQuery, trace):
+        """Match + expand (as tuples), served from the cache when enabled"""
+        if self.cache_size:
+            key = (snap.snapshot_id, prepared.normalized)
+            with self._cache_lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+            if cached is not None:
+                return cached
+
+        with trace.span('match'):
+            matched_entities = tuple(snap.match_tokens(prepared.tokens))
+        with trace.span('expand'):
+            expanded_terms = snap.expand_records(matched_entities, self.max_expansions)
+
+        if self.cache_size:
+            with self._cache_lock:
+                self._cache[key] = (matched_entities, expanded_terms)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return matched_entities, expanded_terms
+
+    def rewrite(self,
+                user_input: str,
+                track_performance=False,
+                log_telemetry=False,
+                use_disambiguation=True,
+                user_id='anonymous',
+                trace_stages=False,
+                context: Optional[RewriterContext] = None,
+                prepared: Optional[PreparedQuery] = None) -> dict:
+        """
+        Rewrite a query against the current snapshot
+
+        Args and result format are the same as rewrite_query() in
+        query_rewriter_v2_enhanced. `prepared` skips normalization when the
+        caller already has a PreparedQuery for user_input.
+        """
+        return self.rewrite_record(user_input, track_performance, log_telemetry, use_disambiguation,
+                                   user_id, trace_stages, context, prepared).to_dict()
+
+    def rewrite_record(self,
+                       user_input: str,
+                       track_performance=False,
+                       log_telemetry=False,
+                       use_disambiguation=True,
+                       user_id='anonymous',
+                       trace_stages=False,
+                       context: Optional[RewriterContext] = None,
+                       prepared: Optional[PreparedQuery] = None) -> RewriteResult:
+        """
+        rewrite() returning a RewriteResult record instead of a dict
+
+        Cheaper for batch callers: expanded terms are shared ExpandedTerm
+        instances from the compiled lexicon, so no per-term dicts are built.
+        """
+        start_ns = perf_counter_ns()
+        snap = self._snapshot
+
+        if not user_input or not user_input.strip():
+            return RewriteResult(user_input)
+
+        ctx = context or self.context or get_default_context()
+        trace = ctx.tracer.start() if trace_stages else NULL_TRACE
+
+        # 1. Disambiguation (an injected context disambiguator wins over the snapshot's)
+        disambiguation_context = {}
+        if use_disambiguation:
+            disambiguator = ctx.disambiguator_override or snap.disambiguator
+            disambiguation_context = disambiguator.get_disambiguation_context(user_input, trace=trace)
+
+        # 2. Normalization
+        if prepared is None:
+            with trace.span('normalize'):
+                prepared = PreparedQuery(user_input)
+
+        # 3-6. Match and expand (max_expansions)
+        matched_entities, expanded_terms = self._match_and_expand(snap, prepared, trace)
+
+        total_time_ms = (perf_counter_ns() - start_ns) / 1e6
+
+        # 7. Track performance
+        if track_performance:
+            ctx.monitor.record('query_rewrite', total_time_ms)
+            if not matched_entities:
+                ctx.monitor.increment('rewrite_zero_match')
+
+        result = RewriteResult(user_input, matched_entities, expanded_terms, disambiguation_context)
+
+        if track_performance:
+            result.performance = {
+                'total_time_ms': round(total_time_ms, 2)
+            }
+
+        # 8. Log telemetry
+        if log_telemetry:
+            query_id = ctx.telemetry.generate_query_id()
+            ctx.telemetry.log_query(
+                query_id=query_id,
+                user_id=user_id,
+                original_query=user_input,
+                rewritten_query=result,
+                performance={'time_ms': total_time_ms},
+                metadata={'has_disambiguation': bool(disambiguation_context),
+                          'lexicon_version': snap.version},
+                trace=trace
+            )
+            result.query_id = query_id
+
+        # 9. Record stage timings
+        if trace.enabled:
+            ctx.tracer.finish(trace)
+            if track_performance:
+                result.performance['stages_ms'] = trace.as_ms()
+
+        return result
+
+
+# Test function
+if __name__ == "__main__":
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+
+    print("Testing RewriterEngine...\n")
+
+    with open('data/ontology_runtime.json', 'r') as f:
+        lexicon = json.load(f)
+
+    engine = RewriterEngine(lexicon, cache_size=1000)
+    for query in ["Is SF available at DFW10?", "Tell me about co-location", "Power capacity at PHX10"]:
+        result = engine.rewrite(query)
+        print(f"{query!r} -> {result['matched_entities']} ({result['expansion_count']} expansions)")
+
+    # Concurrent rewrites while the snapshot is swapped
+    queries = ["Is SF available at DFW10?", "What's the fabric topology?"] * 2000
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(engine.rewrite, q) for q in queries]
+        for _ in range(20):
+            engine.reload(lexicon)
+        results = [f.result() for f in futures]
+    assert all(r['matched_entities'] for r in results[::2])
+    print(f"\n✓ {len(results)} concurrent rewrites across 20 snapshot swaps")
@@ -0,0 +1,188 @@
+"""
+Serialization
+
+Fast JSON encoding for telemetry records and API responses.
+
+- dumps(): compact JSON as UTF-8 bytes. Uses orjson when it is installed,
+  otherwise the stdlib encoder. Rewrite records, numpy values, datetimes
+  and sets are handled by the same default hook in both cases.
+- TelemetryRecordEncoder: writes a telemetry line from pre-encoded pieces.
+  Schema keys and the constant null fields (retrieval_time_ms, ...) are
+  encoded once. Expanded terms are shared ExpandedTerm instances, so their
+  encoded bytes are cached. Only the variable fields are encoded per record.
+
+Usage:
+    from serialization import dumps, TelemetryRecordEncoder
+    body = dumps({'metrics': ...})
+    line = TelemetryRecordEncoder().encode(query_id=..., ...)
+"""
+
+import json
+import math
+import numbers
+from datetime import date, datetime
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def _default(obj):
+    """Encode types the JSON backends don't know natively"""
+    to_dict = getattr(obj, 'to_dict', None)
+    if to_dict is not None:
+        return to_dict()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # numpy scalars / arrays without importing numpy
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj) -> bytes:
+        """Compact JSON as UTF-8 bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def _encode_str(value: str) -> bytes:
+        return orjson.dumps(value)
+else:
+    _json_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_default)
+
+    def dumps(obj) -> bytes:
+        """Compact JSON as UTF-8 bytes"""
+        return _json_encoder.encode(obj).encode('utf-8')
+
+    def _encode_str(value: str) -> bytes:
+        # C-accelerated in CPython; ASCII output with \\u escapes
+        return encode_basestring_ascii(value).encode('ascii')
+
+
+def _encode_number(value) -> bytes:
+    """
+    JSON number (or null / true / false) for a Python or numpy scalar
+
+    Coerced through int() / float() first: repr() of a numpy scalar is
+    'np.float64(1.5)' and repr() of a bool is 'True'.
+    """
+    if value is None:
+        return b'null'
+    # numpy.bool_ is not a bool subclass; its dtype kind is 'b'
+    if isinstance(value, bool) or getattr(getattr(value, 'dtype', None), 'kind', None) == 'b':
+        return b'true' if value else b'false'
+    if isinstance(value, numbers.Integral):
+        return str(int(value)).encode('ascii')
+    value = float(value)
+    if not math.isfinite(value):
+        return b'null'
+    return repr(value).encode('ascii')
+
+
+# Fields that are always null when the rewriter logs a query
+_STATIC_NULLS = (b',"retrieval_time_ms":null,"generation_time_ms":null,'
+                 b'"first_answer_success":null,"user_feedback":null')
+
+
+class TelemetryRecordEncoder:
+    """
+    Encodes TelemetryLogger query records from pre-encoded parts
+
+    The output parses to the same dict as json.dumps() of the record;
+    key order matches the TelemetryLogger schema.
+    """
+
+    def __init__(self, max_cached_terms: int = 50000):
+        self.max_cached_terms = max_cached_terms
+        self._term_cache = {}
+
+    def _encode_term(self, term) -> bytes:
+        """One expanded term (ExpandedTerm or dict), cached by value"""
+        if isinstance(term, dict):
+            key = (term.get('term'), term.get('weight'), term.get('source'))
+        else:
+            key = term
+        cached = self._term_cache.get(key)
+        if cached is None:
+            text, weight, source = key
+            cached = b''.join((b'{"term":', _encode_str(text), b',"weight":', _encode_number(weight),
+                               b',"source":', _encode_str(source), b'}'))
+            if len(self._term_cache) >= self.max_cached_terms:
+                self._term_cache.clear()
+            self._term_cache[key] = cached
+        return cached
+
+    def encode(self, query_id: str, user_id_hash: str, timestamp: str, original_query: str,
+               matched_entities, expanded_terms, expansion_count: int, query_rewrite_time_ms,
+               stage_timings_ms: dict, metadata: dict, sample_weight: float = 1.0) -> bytes:
+        """Encode one full record as a JSONL line (with trailing newline)"""
+        return b''.join((
+            b'{"query_id":', _encode_str(query_id),
+            b',"user_id_hash":', _encode_str(user_id_hash),
+            b',"timestamp":', _encode_str(timestamp),
+            b',"original_query":', _encode_str(original_query),
+            b',"matched_entities":[', b','.join([_encode_str(e) for e in matched_entities]),
+            b'],"expanded_terms":[', b','.join([self._encode_term(t) for t in expanded_terms]),
+            b'],"expansion_count":', _encode_number(expansion_count),
+            b',"query_rewrite_time_ms":', _encode_number(query_rewrite_time_ms),
+            b',"stage_timings_ms":', dumps(stage_timings_ms) if stage_timings_ms else b'{}',
+            _STATIC_NULLS,
+            b',"metadata":', dumps(metadata) if metadata else b'{}',
+            b',"sample_weight":', _encode_number(sample_weight),
+            b'}\n'
+        ))
+
+    def encode_compact(self, query_id: str, user_id_hash: str, timestamp: str, matched_entities,
+                       expansion_count: int, query_rewrite_time_ms, stage_timings_ms: dict,
+                       sample_weight: float = 1.0) -> bytes:
+        """Encode a compact record: IDs, entities and timings only"""
+        return b''.join((
+            b'{"query_id":', _encode_str(query_id),
+            b',"user_id_hash":', _encode_str(user_id_hash),
+            b',"timestamp":', _encode_str(timestamp),
+            b',"matched_entities":[', b','.join([_encode_str(e) for e in matched_entities]),
+            b'],"expansion_count":', _encode_number(expansion_count),
+            b',"query_rewrite_time_ms":', _encode_number(query_rewrite_time_ms),
+            b',"stage_timings_ms":', dumps(stage_timings_ms) if stage_timings_ms else b'{}',
+            b',"verbosity":"compact","sample_weight":', _encode_number(sample_weight),
+            b'}\n'
+        ))
+
+
+# Test function
+if __name__ == "__main__":
+    print(f"Testing serialization (backend: {BACKEND})...\n")
+
+    encoder = TelemetryRecordEncoder()
+    record = {
+        'query_id': 'query_20251121_120000_abcd1234',
+        'user_id_hash': '6f1ed002ab5595859',
+        'timestamp': datetime.now().isoformat(),
+        'original_query': 'Is SF available at "DFW10"? – über',
+        'matched_entities': ['DFW10', 'ServiceFabric'],
+        'expanded_terms': [{'term': 'DFW10', 'weight': 1.0, 'source': 'canonical'}],
+        'expansion_count': 1,
+        'query_rewrite_time_ms': 0.0421,
+        'stage_timings_ms': {'match': 0.01},
+        'retrieval_time_ms': None,
+        'generation_time_ms': None,
+        'first_answer_success': None,
+        'user_feedback': None,
+        'metadata': {'has_disambiguation': True},
+        'sample_weight': 1.0
+    }
+    line = encoder.encode(**{k: v for k, v in record.items()
+                             if k not in ('retrieval_time_ms', 'generation_time_ms',
+                                          'first_answer_success', 'user_feedback')})
+    assert json.loads(line) == record
+    assert list(json.loads(line)) == list(record)
+    print(line.decode('utf-8'))
+    print(f"✓ Round-trips to the json.dumps record ({len(line)} bytes)")
@@ -0,0 +1,227 @@
+"""
+Shadow Rewriter
+
+A/B shadow mode: every query is rewritten by the production engine and
+returned immediately; a candidate engine (e.g. a new lexicon version)
+rewrites the same prepared query on a background thread. The entity and
+expansion diffs and the candidate/production latency ratio are written to
+the telemetry shadow stream (TelemetryLogger.shadow_path).
+
+Normalization and tokenization run once and are shared by both engines.
+The background queue is bounded: when the candidate falls behind, new
+comparisons are dropped (counted as 'shadow_dropped') instead of building up.
+
+Usage:
+    shadow = ShadowRewriter(RewriterEngine(prod_lexicon), RewriterEngine(candidate_lexicon))
+    result = shadow.rewrite("Is SF available at DFW10?", log_telemetry=True)
+    shadow.close()
+    print(shadow.telemetry.get_shadow_statistics())
+"""
+
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter_ns
+from typing import Optional
+
+from rewriter_context import get_default_context
+from rewriter_engine import PreparedQuery, RewriterEngine
+
+logger = logging.getLogger(__name__)
+
+
+def diff_rewrites(production: dict, candidate: dict) -> dict:
+    """
+    Entity and expansion differences between two rewrite results
+
+    Returns:
+        entities_added/removed (candidate relative to production),
+        expansions_added/removed (by term), identical flag
+    """
+    prod_entities = production['matched_entities']
+    cand_entities = candidate['matched_entities']
+    prod_terms = [t['term'] for t in production['expanded_terms']]
+    cand_terms = [t['term'] for t in candidate['expanded_terms']]
+
+    prod_entity_set = set(prod_entities)
+    cand_entity_set = set(cand_entities)
+    prod_term_set = set(prod_terms)
+    cand_term_set = set(cand_terms)
+
+    return {
+        'entities_added': [e for e in cand_entities if e not in prod_entity_set],
+        'entities_removed': [e for e in prod_entities if e not in cand_entity_set],
+        'expansions_added': [t for t in cand_terms if t not in prod_term_set],
+        'expansions_removed': [t for t in prod_terms if t not in cand_term_set],
+        'production_match_count': len(prod_entities),
+        'candidate_match_count': len(cand_entities),
+        'identical': (prod_entities == cand_entities
+                      and production['expanded_terms'] == candidate['expanded_terms'])
+    }
+
+
+class ShadowRewriter:
+    """
+    Serves production rewrites and evaluates a candidate engine off the critical path
+    """
+
+    def __init__(self,
+                 production: RewriterEngine,
+                 candidate: RewriterEngine,
+                 telemetry=None,
+                 sample_rate: float = 1.0,
+                 max_pending: int = 1000):
+        """
+        Args:
+            production: Engine whose results are returned
+            candidate: Engine evaluated in the background
+            telemetry: TelemetryLogger for comparisons (default: production
+                engine's context, else the process-wide context)
+            sample_rate: Fraction of queries shadowed (0.0 - 1.0)
+            max_pending: Max queued comparisons before new ones are dropped
+        """
+        self.production = production
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self._context = production.context or get_default_context()
+        self.telemetry = telemetry or self._context.telemetry
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow-rewriter')
+        self._pending = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def rewrite(self, user_input: str, user_id: str = 'anonymous', **kwargs) -> dict:
+        """
+        Rewrite with the production engine and schedule the shadow comparison
+
+        Accepts the same keyword arguments as RewriterEngine.rewrite().
+        Latencies exclude the shared normalization; the production time
+        includes its own telemetry write when log_telemetry is set.
+        """
+        prepared = PreparedQuery(user_input)
+        start_ns = perf_counter_ns()
+        result = self.production.rewrite(user_input, user_id=user_id, prepared=prepared, **kwargs)
+        production_ns = perf_counter_ns() - start_ns
+
+        if not prepared.normalized or random.random() >= self.sample_rate:
+            return result
+
+        # Snapshot what the comparison needs; the caller may mutate the result
+        production = {
+            'matched_entities': list(result['matched_entities']),
+            'expanded_terms': [dict(t) for t in result['expanded_terms']]
+        }
+
+        # Checked and submitted under the lock so close() cannot slip in between
+        with self._lock:
+            if self._closed:
+                return result
+            if self._pending >= self.max_pending:
+                self._context.monitor.increment('shadow_dropped')
+                return result
+            self._pending += 1
+            self._executor.submit(self._compare, prepared, production, production_ns,
+                                  result.get('query_id'), user_id,
+                                  kwargs.get('use_disambiguation', True))
+        return result
+
+    def _compare(self, prepared: PreparedQuery, production: dict, production_ns: int,
+                 query_id: Optional[str], user_id: str, use_disambiguation: bool):
+        """Background: run the candidate, diff, and log the comparison"""
+        try:
+            start_ns = perf_counter_ns()
+            candidate = self.candidate.rewrite(prepared.original, prepared=prepared,
+                                               use_disambiguation=use_disambiguation)
+            candidate_ns = perf_counter_ns() - start_ns
+
+            comparison = diff_rewrites(production, candidate)
+            comparison.update({
+                'normalized_query': prepared.normalized,
+                'production_version': self.production.snapshot.version,
+                'candidate_version': self.candidate.snapshot.version,
+                'production_time_ms': round(production_ns / 1e6, 4),
+                'candidate_time_ms': round(candidate_ns / 1e6, 4),
+                'latency_ratio': round(candidate_ns / production_ns, 3) if production_ns else None
+            })
+
+            self.telemetry.log_shadow_comparison(
+                query_id=query_id or self.telemetry.generate_query_id(),
+                user_id=user_id,
+                original_query=prepared.original,
+                comparison=comparison
+            )
+            self._context.monitor.increment('shadow_compared')
+            if not comparison['identical']:
+                self._context.monitor.increment('shadow_diff')
+        except Exception as e:
+            # Shadow evaluation must never affect production traffic
+            logger.warning("Shadow comparison failed: %s", e, exc_info=True)
+            self._context.monitor.increment('shadow_errors')
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until queued comparisons are logged; False on timeout"""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def close(self):
+        """
+        Finish queued comparisons and stop the background thread
+
+        Later rewrite() calls still serve production results, unshadowed.
+        """
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# Test function
+if __name__ == "__main__":
+    import copy
+    import json
+    import os
+    import tempfile
+    from telemetry_logger import TelemetryLogger
+
+    print("Testing ShadowRewriter...\n")
+
+    with open('data/ontology_runtime.json', 'r') as f:
+        production_lexicon = json.load(f)
+
+    # Candidate: one new synonym, one removed entity
+    candidate_lexicon = copy.deepcopy(production_lexicon)
+    candidate_lexicon['version'] = f"{production_lexicon.get('version')}-candidate"
+    candidate_lexicon['entities']['ServiceFabric']['synonyms'].append('virtual fabric')
+    candidate_lexicon['entities'].pop('DFW10', None)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        telemetry = TelemetryLogger(os.path.join(tmp_dir, 'telemetry_logs.jsonl'))
+        queries = ["Is SF available at DFW10?", "Need a virtual fabric", "Power capacity at PHX10"]
+
+        with ShadowRewriter(RewriterEngine(production_lexicon), RewriterEngine(candidate_lexicon),
+                            telemetry=telemetry) as shadow:
+            for query in queries:
+                result = shadow.rewrite(query)
+                print(f"{query!r} -> {result['matched_entities']}")
+            shadow.flush()
+
+        for log in telemetry.read_logs(path=telemetry.shadow_path):
+            print(f"  {log['original_query']!r}: +{log['entities_added']} -{log['entities_removed']}"
+                  f" ratio={log['latency_ratio']}")
+        stats = telemetry.get_shadow_statistics()
+        assert stats['total_comparisons'] == len(queries)
+        print(f"\n✓ Shadow statistics: {stats}")
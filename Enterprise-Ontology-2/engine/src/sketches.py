@@ -0,0 +1,429 @@
+"""
+Sketches
+
+Mergeable, fixed-size summaries for dashboard and telemetry statistics.
+
+- HyperLogLog: distinct counting (WAU/MAU, unique users). 2^p one-byte
+  registers; sketches with the same precision merge by register-wise max,
+  so daily sketches union into weekly/monthly counts.
+
+  Error bound: relative standard error is 1.04 / sqrt(2^p), i.e. 1.6% at
+  the default p=12 (4 KB), so ~95% of estimates fall within +-3.3% of the
+  true count. Below ~2.5 * 2^p distinct values linear counting is used,
+  which is close to exact for small populations (tens to hundreds of users).
+
+  exact=True also keeps the exact set of values: count() then returns the
+  exact cardinality while estimate() still returns the sketch estimate, to
+  validate the error bound on real data.
+
+  Values are hashed with 64-bit BLAKE2b, so sketches are stable across
+  processes and can be persisted (to_dict / from_dict) and merged later.
+
+- SpaceSaving: heavy hitters (top entities, top users) with at most
+  `capacity` counters. Counters sit in a Stream-Summary (buckets of equal
+  count in a sorted linked list), so a unit increment is O(1) and top(n)
+  walks down from the largest bucket in O(n) without sorting. A reported
+  count overestimates the true count by at most its recorded error, which
+  is at most total / capacity; with fewer distinct keys than capacity,
+  counts are exact. Summaries merge across time windows.
+
+Usage:
+    from sketches import HyperLogLog, SpaceSaving
+    monday = HyperLogLog(); monday.update(user_ids)
+    week = HyperLogLog.union([monday, tuesday, ...])
+    week.estimate()
+
+    entities = SpaceSaving(capacity=1000)
+    entities.update(['ServiceFabric', 'DFW10'])
+    entities.top(10)    # [('ServiceFabric', 1), ('DFW10', 1)]
+"""
+
+import base64
+import hashlib
+import math
+import zlib
+from typing import Iterable, Optional
+
+DEFAULT_PRECISION = 12
+
+DEFAULT_TOPK_CAPACITY = 1000
+
+
+def hash64(value) -> int:
+    """Stable 64-bit hash of a value's string form"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter (64-bit hashes, linear counting for small ranges)
+    """
+
+    __slots__ = ('p', 'm', 'registers', 'exact')
+
+    def __init__(self, p: int = DEFAULT_PRECISION, exact: bool = False):
+        """
+        Args:
+            p: Precision, 4-16; 2^p registers, standard error 1.04 / sqrt(2^p)
+            exact: Also keep the exact value set (for validation)
+        """
+        if not 4 <= p <= 16:
+            raise ValueError(f"precision must be between 4 and 16, got {p}")
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self.exact = set() if exact else None
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of estimate()"""
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value):
+        """Add one value"""
+        h = hash64(value)
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+        if self.exact is not None:
+            self.exact.add(value)
+
+    def update(self, values: Iterable):
+        """Add many values"""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Union another sketch into this one (in place)"""
+        if other.p != self.p:
+            raise ValueError(f"cannot merge sketches with precision {self.p} and {other.p}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        if self.exact is not None:
+            if other.exact is None:
+                # The union is no longer exactly known
+                self.exact = None
+            else:
+                self.exact |= other.exact
+        return self
+
+    @classmethod
+    def union(cls, sketches: Iterable['HyperLogLog'], p: Optional[int] = None) -> 'HyperLogLog':
+        """
+        New sketch for the union of sketches
+
+        Exact sets are kept only if every input has one. With no inputs,
+        returns an empty sketch of precision p.
+        """
+        sketches = list(sketches)
+        if not sketches:
+            return cls(p or DEFAULT_PRECISION)
+        result = sketches[0].copy()
+        for sketch in sketches[1:]:
+            result.merge(sketch)
+        return result
+
+    def copy(self) -> 'HyperLogLog':
+        clone = HyperLogLog(self.p)
+        clone.registers = bytearray(self.registers)
+        clone.exact = set(self.exact) if self.exact is not None else None
+        return clone
+
+    def estimate(self) -> int:
+        """Estimated number of distinct values"""
+        m = self.m
+        zeros = self.registers.count(0)
+        if zeros == m:
+            return 0
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def count(self) -> int:
+        """Exact count in exact mode, otherwise estimate()"""
+        if self.exact is not None:
+            return len(self.exact)
+        return self.estimate()
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form (registers zlib-compressed, base64-encoded)"""
+        data = {
+            'p': self.p,
+            'registers': base64.b64encode(zlib.compress(bytes(self.registers))).decode('ascii')
+        }
+        if self.exact is not None:
+            data['exact'] = sorted(map(str, self.exact))
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HyperLogLog':
+        sketch = cls(data['p'])
+        registers = zlib.decompress(base64.b64decode(data['registers']))
+        if len(registers) != sketch.m:
+            raise ValueError(f"expected {sketch.m} registers, got {len(registers)}")
+        sketch.registers = bytearray(registers)
+        if 'exact' in data:
+            sketch.exact = set(data['exact'])
+        return sketch
+
+    def __repr__(self) -> str:
+        return f"HyperLogLog(p={self.p}, estimate={self.estimate()})"
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters summary over a Stream-Summary structure
+    """
+
+    __slots__ = ('capacity', 'total', '_counts', '_errors', '_buckets', '_higher', '_lower',
+                 '_min', '_max')
+
+    def __init__(self, capacity: int = DEFAULT_TOPK_CAPACITY):
+        """
+        Args:
+            capacity: Max counters kept; counts are exact below this many keys
+        """
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        # count -> keys with that count (insertion ordered); buckets form a
+        # doubly linked list sorted by count via _higher/_lower
+        self._buckets = {}
+        self._higher = {}
+        self._lower = {}
+        self._min = None
+        self._max = None
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, key) -> bool:
+        return key in self._counts
+
+    def _link_after(self, anchor, count):
+        """Insert bucket `count` into the list above `anchor` (None: walk from the bottom)"""
+        if anchor is None:
+            lower, higher = None, self._min
+        else:
+            lower, higher = anchor, self._higher[anchor]
+        while higher is not None and higher < count:
+            lower, higher = higher, self._higher[higher]
+        self._buckets[count] = {}
+        self._lower[count] = lower
+        self._higher[count] = higher
+        if lower is None:
+            self._min = count
+        else:
+            self._higher[lower] = count
+        if higher is None:
+            self._max = count
+        else:
+            self._lower[higher] = count
+
+    def _unlink(self, count):
+        lower = self._lower.pop(count)
+        higher = self._higher.pop(count)
+        del self._buckets[count]
+        if lower is None:
+            self._min = higher
+        else:
+            self._higher[lower] = higher
+        if higher is None:
+            self._max = lower
+        else:
+            self._lower[higher] = lower
+
+    def _place(self, key, count, anchor):
+        if count not in self._buckets:
+            self._link_after(anchor, count)
+        self._buckets[count][key] = None
+
+    def _remove(self, key, count):
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            self._unlink(count)
+
+    def add(self, key, count: int = 1):
+        """Count one occurrence (or `count` occurrences) of key"""
+        if count <= 0:
+            return
+        self.total += count
+        current = self._counts.get(key)
+        if current is not None:
+            new = current + count
+            # Link the new bucket before unlinking the old one (it is the anchor)
+            self._place(key, new, current)
+            self._remove(key, current)
+            self._counts[key] = new
+            return
+
+        if len(self._counts) < self.capacity:
+            self._counts[key] = count
+            self._errors[key] = 0
+            self._place(key, count, None)
+            return
+
+        # Full: replace the oldest key with the smallest count
+        floor = self._min
+        evicted = next(iter(self._buckets[floor]))
+        new = floor + count
+        self._place(key, new, floor)
+        self._remove(evicted, floor)
+        del self._counts[evicted]
+        del self._errors[evicted]
+        self._counts[key] = new
+        self._errors[key] = floor
+
+    def update(self, keys: Iterable):
+        """Count each key once"""
+        for key in keys:
+            self.add(key)
+
+    def count(self, key) -> int:
+        """Upper bound on key's count (0 if not tracked)"""
+        return self._counts.get(key, 0)
+
+    def error(self, key) -> int:
+        """Max overestimate of count(key)"""
+        return self._errors.get(key, 0)
+
+    def top(self, n: int = 10):
+        """
+        The n largest (key, count) pairs, largest first
+
+        Walks buckets down from the maximum: O(n) plus one step per
+        distinct count passed, no sort. Ties keep first-counted order.
+        """
+        result = []
+        bucket = self._max
+        while bucket is not None and len(result) < n:
+            for key in self._buckets[bucket]:
+                result.append((key, bucket))
+                if len(result) == n:
+                    break
+            bucket = self._lower[bucket]
+        return result
+
+    def items(self):
+        """All tracked (key, count, error) triples, largest count first"""
+        return [(key, count, self._errors[key]) for key, count in self.top(len(self._counts))]
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """
+        Combine another summary into this one (in place)
+
+        Keys missing from a full summary may have had up to its minimum
+        count, which is added to their count and error (mergeable summaries
+        bound). The largest `capacity` counters are kept.
+        """
+        self_floor = self._min if len(self._counts) >= self.capacity else 0
+        other_floor = other._min if len(other._counts) >= other.capacity else 0
+        merged = {}
+        for key, count, error in self.items():
+            merged[key] = [count + other_floor, error + other_floor]
+        for key, count, error in other.items():
+            if key in merged:
+                merged[key][0] += count - other_floor
+                merged[key][1] += error - other_floor
+            else:
+                merged[key] = [count + self_floor, error + self_floor]
+
+        total = self.total + other.total
+        kept = sorted(merged.items(), key=lambda item: -item[1][0])[:self.capacity]
+        self._reset()
+        for key, (count, error) in reversed(kept):
+            self._counts[key] = count
+            self._errors[key] = error
+            self._place(key, count, self._max)
+        self.total = total
+        return self
+
+    def _reset(self):
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        self._buckets = {}
+        self._higher = {}
+        self._lower = {}
+        self._min = None
+        self._max = None
+
+    def copy(self) -> 'SpaceSaving':
+        return SpaceSaving.from_dict(self.to_dict())
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form (keys must be JSON values, e.g. strings)"""
+        return {
+            'capacity': self.capacity,
+            'total': self.total,
+            'items': [list(item) for item in self.items()]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SpaceSaving':
+        summary = cls(data['capacity'])
+        # items are largest first; insert smallest first so each bucket is appended at the top
+        for key, count, error in reversed(data['items']):
+            summary._counts[key] = count
+            summary._errors[key] = error
+            summary._place(key, count, summary._max)
+        summary.total = data['total']
+        return summary
+
+    def __repr__(self) -> str:
+        return f"SpaceSaving(capacity={self.capacity}, tracked={len(self._counts)}, total={self.total})"
+
+
+# Test function
+if __name__ == "__main__":
+    import json
+    import random
+
+    print("Testing sketches...\n")
+
+    # Error vs exact mode across population sizes
+    for n in (10, 100, 1000, 10000, 100000):
+        sketch = HyperLogLog(exact=True)
+        sketch.update(f"user-{i}" for i in range(n))
+        error = (sketch.estimate() - sketch.count()) / n
+        assert abs(error) < 4 * sketch.relative_error
+        print(f"  n={n:>6}: estimate={sketch.estimate():>6}  error={error:+.2%}")
+
+    # Daily sketches union into weekly counts
+    rng = random.Random(7)
+    days = []
+    for _ in range(7):
+        day = HyperLogLog(exact=True)
+        day.update(f"user-{rng.randrange(5000)}" for _ in range(2000))
+        days.append(day)
+    week = HyperLogLog.union(days)
+    restored = HyperLogLog.from_dict(json.loads(json.dumps(week.to_dict())))
+    assert restored.estimate() == week.estimate() and restored.count() == week.count()
+    print(f"\n  weekly union: estimate={week.estimate()} exact={week.count()}")
+    print(f"\n✓ Standard error at p={week.p}: {week.relative_error:.2%}")
+
+    # Heavy hitters on a Zipf-like stream vs exact counts
+    from collections import Counter
+    stream = [f"entity-{int(rng.paretovariate(1.2))}" for _ in range(50000)]
+    exact = Counter(stream)
+    summary = SpaceSaving(capacity=100)
+    summary.update(stream[:25000])
+    second = SpaceSaving(capacity=100)
+    second.update(stream[25000:])
+    summary.merge(second)
+    top = summary.top(10)
+    assert [k for k, _ in top[:5]] == [k for k, _ in exact.most_common(5)]
+    assert all(exact[k] <= c <= exact[k] + summary.error(k) for k, c in top)
+    assert SpaceSaving.from_dict(json.loads(json.dumps(summary.to_dict()))).top(10) == top
+    print(f"\n  top 5 of {len(exact)} keys: {top[:5]}")
+    print(f"✓ Top-10 within error bounds ({summary.capacity} counters, {summary.total} events)")
@@ -1,23 +1,334 @@
 """
 Telemetry Logger
 Logs query pipeline telemetry for analysis and A/B testing.
+
+Writes go through a long-lived append handle. With shard_per_process=True
+(several uvicorn workers, RewritePool, multiprocessing scripts) each process
+writes its own buffered shard, telemetry_logs.<pid>.jsonl, so writers never
+contend or interleave. Readers merge the base file and all shards in
+timestamp order (k-way heap merge).
+
+Sampling (TelemetrySampler) drops routine queries at a configurable rate
+and records 'sample_weight' = 1/rate on the ones kept. Errors, slow queries
+and zero-match queries are always kept at weight 1. get_statistics()
+weights records, so its totals stay unbiased. With verbosity='compact',
+routine records keep only IDs, entities and timings. Kept errors, slow
+queries and zero-match queries are always written in full.
+
+With sink='sqlite', query records go to an indexed SQLite database
+instead (see telemetry_sqlite.py): batched inserts from a background
+writer, and read_logs() / get_statistics() run as SQL queries. Shadow
+comparisons stay in JSONL.
 """
 
+import atexit
+import glob
+import heapq
 import json
 import hashlib
+import random
+import threading
+import time
+import weakref
 from datetime import datetime, timezone
 import uuid
 import os
 
+from serialization import TelemetryRecordEncoder, dumps
+from sketches import HyperLogLog
+from telemetry_sqlite import SqliteTelemetrySink
+from tracing import NULL_TRACE
+
+# Shard buffer; records are ~0.5 KB, so a flush rarely splits a line
+SHARD_BUFFER_BYTES = 1 << 20
+
+
+def shard_path(path: str, pid: int) -> str:
+    """outputs/telemetry_logs.jsonl -> outputs/telemetry_logs.<pid>.jsonl"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{pid}{ext}"
+
+
+def shard_pid(path: str):
+    """Writer pid of a shard path (telemetry_logs.<pid>.jsonl), None for the base file"""
+    middle = os.path.splitext(os.path.splitext(os.path.basename(path))[0])[1][1:]
+    return int(middle) if middle.isdigit() else None
+
+
+def pid_alive(pid: int) -> bool:
+    """True if a process with this pid exists (signal 0 probe)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def stream_paths(path: str) -> list:
+    """The base file (if present) plus every per-process shard of it"""
+    stem, ext = os.path.splitext(path)
+    shards = [p for p in glob.glob(f"{glob.escape(stem)}.*{ext}")
+              if os.path.basename(p)[len(os.path.basename(stem)) + 1:-len(ext)].isdigit()]
+    return ([path] if os.path.exists(path) else []) + sorted(shards)
+
+
+def _iter_file(path: str):
+    """Records of one JSONL file; blank and partially flushed lines are skipped"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def merge_streams(path: str):
+    """
+    Yield records from the base file and all shards in timestamp order
+
+    Each file is already in timestamp order (single writer), so a
+    heapq.merge over the files is enough.
+    """
+    files = [_iter_file(p) for p in stream_paths(path)]
+    return heapq.merge(*files, key=lambda record: record.get('timestamp', ''))
+
+
+class _AppendHandle:
+    """
+    Long-lived append-mode file handle
+
+    Unsharded: every record is flushed immediately (one write() per line,
+    like the old open-per-write path). Sharded: the handle writes this
+    process's shard and flushes every `flush_every` records or
+    `flush_interval` seconds. After a fork the child opens its own shard.
+
+    Before the first record of each buffered batch the handle checks that
+    its path still names the open inode; if the file was removed or
+    replaced (compaction, rotation) it reopens instead of appending to an
+    unlinked file.
+    """
+
+    def __init__(self, path: str, sharded: bool, flush_every: int, flush_interval: float):
+        self.path = path
+        self.sharded = sharded
+        self.flush_every = flush_every if sharded else 1
+        self.flush_interval = flush_interval
+        self._file = None
+        self._pid = None
+        self._pending = 0
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def current_path(self) -> str:
+        return shard_path(self.path, os.getpid()) if self.sharded else self.path
+
+    def _open(self):
+        self._file = open(self.current_path, 'ab',
+                          buffering=SHARD_BUFFER_BYTES if self.sharded else -1)
+        self._pid = os.getpid()
+        self._last_flush = time.monotonic()
+
+    def _replaced(self) -> bool:
+        """True if current_path no longer refers to the open file"""
+        try:
+            on_disk = os.stat(self.current_path)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self._file.fileno())
+        return (on_disk.st_ino, on_disk.st_dev) != (opened.st_ino, opened.st_dev)
+
+    def write(self, data: bytes):
+        with self._lock:
+            if self._pid != os.getpid():
+                # New process (or first write): never flush a parent's buffer here
+                self._open()
+            elif self._pending == 0 and self._replaced():
+                # Nothing buffered for the old inode, so reopening loses nothing
+                self._file.close()
+                self._open()
+            self._file.write(data)
+            self._pending += 1
+            if (self._pending >= self.flush_every
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._file is not None and self._pid == os.getpid():
+            self._file.flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+            self._pid = None
+
+    def reset_after_fork(self):
+        """
+        Child side of fork(): replace a lock another thread may have held,
+        and point the inherited file descriptor at /dev/null so the parent's
+        buffered bytes are never written a second time from the child
+        """
+        self._lock = threading.Lock()
+        if self._file is not None and self._pid != os.getpid():
+            try:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                try:
+                    os.dup2(devnull, self._file.fileno())
+                finally:
+                    os.close(devnull)
+            except (OSError, ValueError):
+                pass
+        self._pending = 0
+
+
+# Live loggers, flushed before fork() and at interpreter exit
+_live_loggers = weakref.WeakSet()
+
+
+def _flush_all_loggers():
+    for logger in list(_live_loggers):
+        logger.flush()
+
+
+def _reset_loggers_in_child():
+    for logger in list(_live_loggers):
+        logger._query_handle.reset_after_fork()
+        logger._shadow_handle.reset_after_fork()
+        if logger.sqlite_sink is not None:
+            logger.sqlite_sink._lock = threading.Lock()
+
+
+def _register_exit_flush(logger):
+    # multiprocessing children leave through os._exit (no atexit); flush from its exit hook
+    import multiprocessing.util
+    multiprocessing.util.Finalize(logger, logger.flush, exitpriority=10)
+
+
+atexit.register(_flush_all_loggers)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_flush_all_loggers, after_in_child=_reset_loggers_in_child)
+
+
+class TelemetrySampler:
+    """
+    Head-based sampling decision for one query
+
+    Routine queries are kept with probability `rate` (or the category's
+    rate). With by='user' the decision is derived from the user hash, so
+    a sampled user's whole session is kept; by='query' samples each query
+    independently.
+    """
+    
+    def __init__(self, rate=1.0, category_rates=None, by='user', slow_query_ms=None,
+                 keep_zero_match=True):
+        """
+        Args:
+            rate: Default keep probability for routine queries (0.0 - 1.0)
+            category_rates: Per-category keep probability, e.g. {'faq': 0.05}
+            by: 'user' (deterministic per user hash) or 'query' (random)
+            slow_query_ms: Always keep queries at least this slow
+            keep_zero_match: Always keep queries with no matched entities
+        """
+        if by not in ('user', 'query'):
+            raise ValueError(f"by must be 'user' or 'query', got {by!r}")
+        self.rate = rate
+        self.category_rates = category_rates or {}
+        self.by = by
+        self.slow_query_ms = slow_query_ms
+        self.keep_zero_match = keep_zero_match
+    
+    def decide(self, user_id_hash, category=None, time_ms=0.0, matched=True, error=None):
+        """
+        Returns:
+            (sample_weight, reason): weight 0.0 means drop; reason is one of
+            'error', 'slow', 'zero_match', 'sampled'
+        """
+        if error:
+            return 1.0, 'error'
+        if self.slow_query_ms is not None and time_ms >= self.slow_query_ms:
+            return 1.0, 'slow'
+        if self.keep_zero_match and not matched:
+            return 1.0, 'zero_match'
+        
+        rate = self.category_rates.get(category, self.rate)
+        if rate >= 1.0:
+            return 1.0, 'sampled'
+        if rate <= 0.0:
+            return 0.0, 'sampled'
+        if self.by == 'user':
+            # user_id_hash is hex SHA-256, so its prefix is uniform in [0, 1)
+            draw = int(user_id_hash[:8], 16) / 0x100000000
+        else:
+            draw = random.random()
+        return (1.0 / rate if draw < rate else 0.0), 'sampled'
+
+
 class TelemetryLogger:
-    def __init__(self, storage_path='outputs/telemetry_logs.jsonl'):
+    def __init__(self, storage_path='outputs/telemetry_logs.jsonl', shadow_path=None,
+                 shard_per_process=False, flush_every=64, flush_interval=1.0,
+                 sampler=None, verbosity='full', sink='jsonl', sqlite_path=None):
+        """
+        Args:
+            storage_path: Query log path (shards are written next to it)
+            shadow_path: Shadow comparison log (default: <storage stem>_shadow.jsonl)
+            shard_per_process: Write telemetry_logs.<pid>.jsonl with a buffered handle
+            flush_every: Records buffered per shard before flushing
+            flush_interval: Max seconds a shard record stays buffered
+            sampler: TelemetrySampler (default: keep every query)
+            verbosity: 'full' or 'compact' (routine records: IDs, entities, timings)
+            sink: 'jsonl' or 'sqlite' (query records only)
+            sqlite_path: Database for sink='sqlite' (default: <storage stem>.db)
+        """
+        if verbosity not in ('full', 'compact'):
+            raise ValueError(f"verbosity must be 'full' or 'compact', got {verbosity!r}")
+        if sink not in ('jsonl', 'sqlite'):
+            raise ValueError(f"sink must be 'jsonl' or 'sqlite', got {sink!r}")
+        self.sampler = sampler
+        self.verbosity = verbosity
+        self.sampled_out = 0
         self.storage_path = storage_path
-        self._ensure_storage_exists()
+        # Shadow comparisons go to their own stream so query statistics stay clean
+        self.shadow_path = shadow_path or os.path.splitext(storage_path)[0] + '_shadow.jsonl'
+        self.shard_per_process = shard_per_process
+        # One database for every process; WAL lets them write without shards
+        self.sqlite_sink = None
+        if sink == 'sqlite':
+            self.sqlite_sink = SqliteTelemetrySink(sqlite_path or os.path.splitext(storage_path)[0] + '.db')
+        self._storage_ready = False
+        self._encoder = TelemetryRecordEncoder()
+        self._query_handle = _AppendHandle(self.storage_path, shard_per_process, flush_every,
+                                           flush_interval)
+        self._shadow_handle = _AppendHandle(self.shadow_path, shard_per_process, flush_every,
+                                            flush_interval)
+        _live_loggers.add(self)
+        if shard_per_process:
+            import multiprocessing.util
+            multiprocessing.util.register_after_fork(self, _register_exit_flush)
     
     def _ensure_storage_exists(self):
-        directory = os.path.dirname(self.storage_path)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
+        # Deferred to the first write so constructing a logger does no IO
+        if self._storage_ready:
+            return
+        for path in (self.storage_path, self.shadow_path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._storage_ready = True
     
     def _hash_user_id(self, user_id: str) -> str:
         """Hash user ID for privacy (SHA-256)"""
@@ -29,54 +340,211 @@ class TelemetryLogger:
         unique_id = uuid.uuid4().hex[:8]
         return f"query_{timestamp}_{unique_id}"
     
-    def log_query(self, query_id, user_id, original_query, rewritten_query, performance, metadata=None):
-        """Log a complete query event"""
+    def log_query(self, query_id, user_id, original_query, rewritten_query, performance, metadata=None,
+                  trace=NULL_TRACE, category=None, error=None):
+        """
+        Log a complete query event
+        
+        Stage timings already collected in `trace` are stored as
+        'stage_timings_ms'; the write itself is timed as the 'telemetry' span.
+        `category` selects a per-category sampling rate; `error` (stored in
+        metadata) forces the record to be kept in full.
+        
+        Returns:
+            True if the record was written, False if it was sampled out
+        """
+        with trace.span('telemetry'):
+            return self._write_entry(query_id, user_id, original_query, rewritten_query, performance,
+                                     metadata, trace, category, error)
+    
+    def _write_entry(self, query_id, user_id, original_query, rewritten_query, performance, metadata,
+                     trace, category=None, error=None):
+        user_id_hash = self._hash_user_id(user_id)
+        time_ms = performance.get('time_ms', 0)
+        if isinstance(rewritten_query, dict):
+            matched_entities = rewritten_query.get('matched_entities', [])
+            expanded_terms = rewritten_query.get('expanded_terms', [])
+            expansion_count = rewritten_query.get('expansion_count', 0)
+        else:
+            # RewriteResult record: shared ExpandedTerm tuples encode from cache
+            matched_entities = rewritten_query.matched_entities
+            expanded_terms = rewritten_query.expanded_terms
+            expansion_count = rewritten_query.expansion_count
+        
+        sample_weight, reason = 1.0, 'sampled'
+        if self.sampler is not None:
+            sample_weight, reason = self.sampler.decide(user_id_hash, category, time_ms,
+                                                        bool(matched_entities), error)
+            if not sample_weight:
+                self.sampled_out += 1
+                return False
+        
+        if error or category:
+            metadata = dict(metadata or {})
+            if error:
+                metadata['error'] = str(error)
+            if category:
+                metadata['category'] = category
+        
+        timestamp = datetime.now(timezone.utc).isoformat()
+        compact = self.verbosity == 'compact' and reason == 'sampled'
+        if self.sqlite_sink is not None:
+            record = {
+                'query_id': query_id,
+                'user_id_hash': user_id_hash,
+                'timestamp': timestamp,
+                'original_query': None if compact else original_query,
+                'matched_entities': list(matched_entities),
+                'expanded_terms': () if compact else expanded_terms,
+                'expansion_count': expansion_count,
+                'query_rewrite_time_ms': time_ms,
+                'stage_timings_ms': trace.as_ms(),
+                'metadata': None if compact else metadata,
+                'verbosity': 'compact' if compact else 'full',
+                'sample_weight': sample_weight
+            }
+            self.sqlite_sink.write(record)
+            return True
+        if compact:
+            line = self._encoder.encode_compact(
+                query_id=query_id,
+                user_id_hash=user_id_hash,
+                timestamp=timestamp,
+                matched_entities=matched_entities,
+                expansion_count=expansion_count,
+                query_rewrite_time_ms=time_ms,
+                stage_timings_ms=trace.as_ms(),
+                sample_weight=sample_weight
+            )
+        else:
+            # Same fields and key order as before; static parts are pre-encoded
+            line = self._encoder.encode(
+                query_id=query_id,
+                user_id_hash=user_id_hash,
+                timestamp=timestamp,
+                original_query=original_query,
+                matched_entities=matched_entities,
+                expanded_terms=expanded_terms,
+                expansion_count=expansion_count,
+                query_rewrite_time_ms=time_ms,
+                stage_timings_ms=trace.as_ms(),
+                metadata=metadata,
+                sample_weight=sample_weight
+            )
+        
+        self._ensure_storage_exists()
+        self._query_handle.write(line)
+        return True
+    
+    def log_shadow_comparison(self, query_id, user_id, original_query, comparison):
+        """
+        Log a production vs candidate lexicon comparison (see shadow_rewriter)
+        
+        Args:
+            comparison: Diff and latency fields from ShadowRewriter
+        """
         log_entry = {
             'query_id': query_id,
             'user_id_hash': self._hash_user_id(user_id),
             'timestamp': datetime.now(timezone.utc).isoformat(),
             'original_query': original_query,
-            'matched_entities': rewritten_query.get('matched_entities', []),
-            'expanded_terms': rewritten_query.get('expanded_terms', []),
-            'expansion_count': rewritten_query.get('expansion_count', 0),
-            'query_rewrite_time_ms': performance.get('time_ms', 0),
-            'retrieval_time_ms': None,
-            'generation_time_ms': None,
-            'first_answer_success': None,
-            'user_feedback': None,
-            'metadata': metadata or {}
+            **comparison
         }
         
-        with open(self.storage_path, 'a') as f:
-            f.write(json.dumps(log_entry) + '\n')
+        self._ensure_storage_exists()
+        self._shadow_handle.write(dumps(log_entry) + b'\n')
     
-    def read_logs(self, limit=None):
-        """Read telemetry logs"""
-        logs = []
-        try:
-            with open(self.storage_path, 'r') as f:
-                for line in f:
-                    if line.strip():
-                        logs.append(json.loads(line))
-        except FileNotFoundError:
-            return []
+    def flush(self):
+        """Write out buffered shard records (and wait for queued SQLite inserts)"""
+        self._query_handle.flush()
+        self._shadow_handle.flush()
+        if self.sqlite_sink is not None:
+            self.sqlite_sink.flush()
+    
+    def close(self):
+        """Flush and close the append handles (reopened on the next write)"""
+        self._query_handle.close()
+        self._shadow_handle.close()
+        if self.sqlite_sink is not None:
+            self.sqlite_sink.close()
+    
+    def _reads_sqlite(self, path) -> bool:
+        return self.sqlite_sink is not None and (path is None or path == self.storage_path)
+    
+    def iter_logs(self, path=None):
+        """Yield records from the base file and all shards, in timestamp order"""
+        if self._reads_sqlite(path):
+            return self.sqlite_sink.iter_records()
+        self.flush()
+        return merge_streams(path or self.storage_path)
+    
+    def read_logs(self, limit=None, path=None):
+        """Read telemetry logs (or another stream, e.g. shadow_path)"""
+        if self._reads_sqlite(path):
+            # ORDER BY ts_us DESC LIMIT n instead of reading everything
+            return self.sqlite_sink.read_records(limit)
+        logs = list(self.iter_logs(path))
         
         if limit:
             logs = logs[-limit:]
         return logs
     
     def get_statistics(self):
-        """Get basic statistics from logs"""
-        logs = self.read_logs()
-        if not logs:
+        """
+        Get basic statistics from logs
+        
+        Counts and the mean latency are weighted by each record's
+        sample_weight (1.0 for unsampled or older records), so they estimate
+        the full traffic. unique_users counts users seen in the logged records
+        with a HyperLogLog sketch (~1.6% standard error, near exact for small
+        counts). Logs are streamed, so memory stays constant. With the SQLite
+        sink this is a single SQL aggregate and unique_users is exact.
+        """
+        if self.sqlite_sink is not None:
+            return self.sqlite_sink.statistics()
+        
+        users = HyperLogLog()
+        records = 0
+        total = 0.0
+        with_matches = 0.0
+        weighted_time = 0.0
+        
+        for log in self.iter_logs():
+            weight = log.get('sample_weight', 1.0)
+            records += 1
+            total += weight
+            weighted_time += weight * log['query_rewrite_time_ms']
+            if log['matched_entities']:
+                with_matches += weight
+            users.add(log['user_id_hash'])
+        
+        if not records:
             return {'total_queries': 0}
+        return {
+            'total_queries': round(total),
+            'logged_records': records,
+            'unique_users': users.estimate(),
+            'avg_rewrite_time_ms': weighted_time / total,
+            'queries_with_matches': round(with_matches),
+            'queries_without_matches': round(total - with_matches)
+        }
+    
+    def get_shadow_statistics(self):
+        """Summarize shadow comparisons: agreement rate and relative latency"""
+        logs = self.read_logs(path=self.shadow_path)
+        if not logs:
+            return {'total_comparisons': 0}
         
+        ratios = sorted(log['latency_ratio'] for log in logs if log.get('latency_ratio') is not None)
         return {
-            'total_queries': len(logs),
-            'unique_users': len(set(log['user_id_hash'] for log in logs)),
-            'avg_rewrite_time_ms': sum(log['query_rewrite_time_ms'] for log in logs) / len(logs),
-            'queries_with_matches': sum(1 for log in logs if log['matched_entities']),
-            'queries_without_matches': sum(1 for log in logs if not log['matched_entities'])
+            'total_comparisons': len(logs),
+            'identical_rate': sum(1 for log in logs if log['identical']) / len(logs),
+            'entities_changed': sum(1 for log in logs if log['entities_added'] or log['entities_removed']),
+            'newly_matched': sum(1 for log in logs
+                                 if log['entities_added'] and not log['production_match_count']),
+            'newly_unmatched': sum(1 for log in logs
+                                   if log['entities_removed'] and not log['candidate_match_count']),
+            'median_latency_ratio': ratios[len(ratios) // 2] if ratios else None
         }
 
 if __name__ == "__main__":
@@ -100,4 +568,38 @@ if __name__ == "__main__":
         performance={'time_ms': 8.5}
     )
     print(f"✓ Logged query: {query_id}")
-    print(f"✓ File: {logger.storage_path}")
\ No newline at end of file
+    print(f"✓ File: {logger.storage_path}")
+    # Test per-process shards with a merged, ordered read
+    from multiprocessing import get_context
+    
+    sharded = TelemetryLogger('outputs/test_sharded/telemetry_logs.jsonl', shard_per_process=True)
+    
+    def _log_many(n):
+        for i in range(n):
+            sharded.log_query(sharded.generate_query_id(), f"user_{i % 7}", f"query {i}",
+                              {'matched_entities': []}, {'time_ms': 0.1})
+    
+    ctx = get_context('fork')
+    workers = [ctx.Process(target=_log_many, args=(500,)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    
+    merged = sharded.read_logs()
+    timestamps = [log['timestamp'] for log in merged]
+    assert len(merged) == 2000 and timestamps == sorted(timestamps)
+    print(f"✓ {len(stream_paths(sharded.storage_path))} shards merged into {len(merged)} ordered records")
+    
+    # Test sampling: weighted totals estimate the unsampled traffic
+    sampled = TelemetryLogger('outputs/test_sampled/telemetry_logs.jsonl',
+                              sampler=TelemetrySampler(rate=0.1, slow_query_ms=50.0),
+                              verbosity='compact')
+    for i in range(5000):
+        sampled.log_query(sampled.generate_query_id(), f"user_{i % 997}", f"query {i}",
+                          {'matched_entities': ['ServiceFabric'] if i % 4 else []},
+                          {'time_ms': 80.0 if i % 100 == 0 else 1.0})
+    stats = sampled.get_statistics()
+    print(f"✓ Sampled: {stats['logged_records']} records written, "
+          f"estimated {stats['total_queries']} of 5000 queries "
+          f"({stats['queries_without_matches']} of 1250 zero-match)")
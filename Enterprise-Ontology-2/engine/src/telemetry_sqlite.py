@@ -0,0 +1,458 @@
+"""
+SQLite Telemetry Sink
+
+Stores TelemetryLogger query records in an embedded SQLite database so
+ad hoc questions ("zero-match queries last week", "queries that matched
+DFW10 since Monday") are index range scans instead of full JSONL scans.
+
+- WAL journaling: readers never block the writer and vice versa; several
+  processes can share one database (busy_timeout covers lock waits).
+- Writes are queued and a background thread inserts them in batches with
+  one transaction per batch; a duplicate query_id is skipped along with
+  its entity and expansion rows. The writer takes whatever has
+  queued up while it was busy (up to batch_size), so batches grow with
+  load and a lone record is committed right away. synchronous=NORMAL:
+  durable across process crashes, the last batch can be lost on power
+  failure.
+- Normalized tables:
+    queries          one row per record (ts_us = UTC epoch microseconds)
+    query_entities   (query_id, entity, ts_us) per matched entity
+    query_expansions (query_id, position, term, weight, source)
+  indexed on ts_us, (match_count, ts_us) and (entity, ts_us).
+
+Records read back (iter_records / read_records) have the same fields as
+the JSONL records, so TelemetryLogger readers work with either sink.
+
+Usage:
+    sink = SqliteTelemetrySink('outputs/telemetry_logs.db')
+    sink.write(record)                  # dict with the JSONL record fields
+    sink.flush()
+    sink.statistics(start='2025-11-20')
+    sink.zero_match_queries(start='2025-11-20', limit=50)
+    sink.entity_queries('DFW10', start='2025-11-20')
+
+    logger = TelemetryLogger('outputs/telemetry_logs.jsonl', sink='sqlite')
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# Records per INSERT transaction
+DEFAULT_BATCH_SIZE = 512
+
+# Queued records before write() blocks (backpressure on a stalled disk)
+MAX_QUEUED_RECORDS = 100000
+
+# Records fetched per round trip when reading back; each chunk becomes an
+# IN (...) list, kept under SQLite's pre-3.32 limit of 999 bound variables
+READ_CHUNK = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    query_id TEXT PRIMARY KEY,
+    ts_us INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    user_id_hash TEXT,
+    original_query TEXT,
+    match_count INTEGER NOT NULL,
+    expansion_count INTEGER,
+    rewrite_time_ms REAL,
+    stage_timings_ms TEXT,
+    metadata TEXT,
+    verbosity TEXT NOT NULL,
+    sample_weight REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queries_ts ON queries (ts_us);
+CREATE INDEX IF NOT EXISTS idx_queries_match_ts ON queries (match_count, ts_us);
+
+CREATE TABLE IF NOT EXISTS query_entities (
+    query_id TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    ts_us INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_query_entities_entity_ts ON query_entities (entity, ts_us);
+CREATE INDEX IF NOT EXISTS idx_query_entities_query ON query_entities (query_id);
+
+CREATE TABLE IF NOT EXISTS query_expansions (
+    query_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    term TEXT NOT NULL,
+    weight REAL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_query_expansions_query ON query_expansions (query_id);
+"""
+
+# Columns read back into records (see _records)
+_QUERY_COLUMNS = ', '.join('q.' + column for column in (
+    'query_id', 'timestamp', 'user_id_hash', 'original_query', 'expansion_count', 'rewrite_time_ms',
+    'stage_timings_ms', 'metadata', 'verbosity', 'sample_weight'))
+
+
+def to_epoch_us(timestamp) -> int:
+    """ISO-8601 timestamp or datetime (naive = UTC) -> epoch microseconds"""
+    if isinstance(timestamp, (int, float)):
+        return int(timestamp)
+    dt = timestamp if isinstance(timestamp, datetime) else datetime.fromisoformat(
+        str(timestamp).replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+
+def _term_fields(term):
+    """(term, weight, source) of an ExpandedTerm or term dict"""
+    if isinstance(term, dict):
+        return term.get('term'), term.get('weight'), term.get('source')
+    return tuple(term)
+
+
+def _window(start, end, column='ts_us'):
+    """SQL conditions and parameters for start <= ts < end"""
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(to_epoch_us(start))
+    if end is not None:
+        conditions.append(f"{column} < ?")
+        params.append(to_epoch_us(end))
+    return conditions, params
+
+
+class SqliteTelemetrySink:
+    """
+    Batched, background-written SQLite store for query telemetry
+    """
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            path: Database file (created with its directory on first write)
+            batch_size: Max records per insert transaction
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.written = 0
+        self.failed = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _start_writer(self):
+        # Called with the lock held; after fork() the child starts its own writer
+        self._queue = queue.Queue(maxsize=MAX_QUEUED_RECORDS)
+        self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                        name='telemetry-sqlite-writer', daemon=True)
+        self._pid = os.getpid()
+        self._thread.start()
+
+    def write(self, record: dict):
+        """Queue one record (JSONL record fields) for the background writer"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start_writer()
+        self._queue.put(record)
+
+    def _run(self, records: queue.Queue):
+        conn = None
+        while True:
+            batch = [records.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(records.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                if conn is None:
+                    conn = self._connect()
+                self._insert(conn, batch)
+            except Exception:
+                # Drop the batch but keep draining: telemetry must never block the rewriter
+                self.failed += len(batch)
+            finally:
+                for _ in batch:
+                    records.task_done()
+
+    def _insert(self, conn: sqlite3.Connection, batch: list):
+        rows = []
+        for record in batch:
+            query_id = record['query_id']
+            ts_us = to_epoch_us(record['timestamp'])
+            matched = record.get('matched_entities') or []
+            query_row = (
+                query_id, ts_us, record['timestamp'], record.get('user_id_hash'),
+                record.get('original_query'), len(matched), record.get('expansion_count'),
+                record.get('query_rewrite_time_ms'),
+                json.dumps(record['stage_timings_ms']) if record.get('stage_timings_ms') else None,
+                json.dumps(record['metadata']) if record.get('metadata') else None,
+                record.get('verbosity', 'full'), record.get('sample_weight', 1.0)
+            )
+            rows.append((query_row, matched, record.get('expanded_terms') or []))
+
+        entity_rows, expansion_rows = [], []
+        with conn:
+            for query_row, matched, expanded in rows:
+                # A duplicate query_id is ignored; so are its child rows
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO queries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    query_row).rowcount
+                if not inserted:
+                    continue
+                query_id, ts_us = query_row[0], query_row[1]
+                entity_rows.extend((query_id, entity, ts_us) for entity in matched)
+                expansion_rows.extend((query_id, position, *_term_fields(term))
+                                      for position, term in enumerate(expanded))
+            conn.executemany("INSERT INTO query_entities VALUES (?, ?, ?)", entity_rows)
+            conn.executemany("INSERT INTO query_expansions VALUES (?, ?, ?, ?, ?)", expansion_rows)
+        self.written += len(batch)
+
+    def flush(self):
+        """Block until every queued record is committed"""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Flush; the writer thread is a daemon and needs no shutdown"""
+        self.flush()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def _records(self, conn: sqlite3.Connection, rows: list) -> list:
+        """Rebuild JSONL-shaped records for rows of _QUERY_COLUMNS"""
+        if not rows:
+            return []
+        ids = [row[0] for row in rows]
+        placeholders = ','.join('?' * len(ids))
+        entities = {query_id: [] for query_id in ids}
+        for query_id, entity in conn.execute(
+                f"SELECT query_id, entity FROM query_entities WHERE query_id IN ({placeholders}) "
+                f"ORDER BY rowid", ids):
+            entities[query_id].append(entity)
+        terms = {query_id: [] for query_id in ids}
+        for query_id, term, weight, source in conn.execute(
+                f"SELECT query_id, term, weight, source FROM query_expansions "
+                f"WHERE query_id IN ({placeholders}) ORDER BY query_id, position", ids):
+            terms[query_id].append({'term': term, 'weight': weight, 'source': source})
+
+        records = []
+        for (query_id, timestamp, user_id_hash, original_query, expansion_count, rewrite_time_ms,
+             stage_timings, metadata, verbosity, sample_weight) in rows:
+            stage_timings_ms = json.loads(stage_timings) if stage_timings else {}
+            if verbosity == 'compact':
+                records.append({
+                    'query_id': query_id,
+                    'user_id_hash': user_id_hash,
+                    'timestamp': timestamp,
+                    'matched_entities': entities[query_id],
+                    'expansion_count': expansion_count,
+                    'query_rewrite_time_ms': rewrite_time_ms,
+                    'stage_timings_ms': stage_timings_ms,
+                    'verbosity': 'compact',
+                    'sample_weight': sample_weight
+                })
+                continue
+            records.append({
+                'query_id': query_id,
+                'user_id_hash': user_id_hash,
+                'timestamp': timestamp,
+                'original_query': original_query,
+                'matched_entities': entities[query_id],
+                'expanded_terms': terms[query_id],
+                'expansion_count': expansion_count,
+                'query_rewrite_time_ms': rewrite_time_ms,
+                'stage_timings_ms': stage_timings_ms,
+                'retrieval_time_ms': None,
+                'generation_time_ms': None,
+                'first_answer_success': None,
+                'user_feedback': None,
+                'metadata': json.loads(metadata) if metadata else {},
+                'sample_weight': sample_weight
+            })
+        return records
+
+    def _select(self, where: list, params: list, order='q.ts_us, q.rowid', limit=None, joins=''):
+        sql = f"SELECT {_QUERY_COLUMNS} FROM queries q{joins}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order}"
+        if limit:
+            sql += " LIMIT ?"
+            params = params + [limit]
+        return sql, params
+
+    def iter_records(self, start=None, end=None):
+        """Yield records with start <= timestamp < end, in timestamp order"""
+        self.flush()
+        if not os.path.exists(self.path):
+            return
+        where, params = _window(start, end, 'q.ts_us')
+        sql, params = self._select(where, params)
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(READ_CHUNK)
+                if not rows:
+                    break
+                yield from self._records(conn, rows)
+        finally:
+            conn.close()
+
+    def read_records(self, limit=None, start=None, end=None) -> list:
+        """Records in timestamp order; with limit, the most recent `limit` of them"""
+        if not limit:
+            return list(self.iter_records(start, end))
+        return self._query(*_window(start, end, 'q.ts_us'), limit=limit)
+
+    def _query(self, where, params, limit=None, joins='') -> list:
+        """Newest `limit` matching records, returned oldest first"""
+        self.flush()
+        if not os.path.exists(self.path):
+            return []
+        sql, params = self._select(where, params, order='q.ts_us DESC, q.rowid DESC', limit=limit,
+                                   joins=joins)
+        conn = self._connect()
+        try:
+            return self._records(conn, conn.execute(sql, params).fetchall()[::-1])
+        finally:
+            conn.close()
+
+    def zero_match_queries(self, start=None, end=None, limit=100) -> list:
+        """Most recent queries with no matched entity (match_count index)"""
+        where, params = _window(start, end, 'q.ts_us')
+        return self._query(['q.match_count = 0'] + where, params, limit)
+
+    def entity_queries(self, entity: str, start=None, end=None, limit=100) -> list:
+        """Most recent queries that matched an entity ((entity, ts_us) index)"""
+        where, params = _window(start, end, 'e.ts_us')
+        return self._query(['e.entity = ?'] + where, [entity] + params, limit,
+                           joins=' JOIN query_entities e ON e.query_id = q.query_id')
+
+    def entity_counts(self, start=None, end=None, limit=20) -> list:
+        """[(entity, weighted count)] for the most matched entities"""
+        self.flush()
+        if not os.path.exists(self.path):
+            return []
+        where, params = _window(start, end, 'e.ts_us')
+        sql = ("SELECT e.entity, SUM(q.sample_weight) AS n FROM query_entities e "
+               "JOIN queries q ON q.query_id = e.query_id")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY e.entity ORDER BY n DESC LIMIT ?"
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params + [limit]).fetchall()
+        finally:
+            conn.close()
+
+    def statistics(self, start=None, end=None) -> dict:
+        """TelemetryLogger.get_statistics() as one SQL aggregate (unique_users is exact)"""
+        self.flush()
+        if not os.path.exists(self.path):
+            return {'total_queries': 0}
+        where, params = _window(start, end)
+        sql = ("SELECT COUNT(*), SUM(sample_weight), SUM(sample_weight * rewrite_time_ms), "
+               "SUM(CASE WHEN match_count > 0 THEN sample_weight ELSE 0 END), "
+               "COUNT(DISTINCT user_id_hash) FROM queries")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        conn = self._connect()
+        try:
+            records, total, weighted_time, with_matches, users = conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+        if not records:
+            return {'total_queries': 0}
+        return {
+            'total_queries': round(total),
+            'logged_records': records,
+            'unique_users': users,
+            'avg_rewrite_time_ms': weighted_time / total,
+            'queries_with_matches': round(with_matches),
+            'queries_without_matches': round(total - with_matches)
+        }
+
+    def explain(self, sql: str, params=()) -> list:
+        """EXPLAIN QUERY PLAN details, to check which index a query uses"""
+        conn = self._connect()
+        try:
+            return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        finally:
+            conn.close()
+
+
+# Test function
+if __name__ == "__main__":
+    import tempfile
+    from datetime import timedelta
+
+    print("Testing SQLite telemetry sink...\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sink = SqliteTelemetrySink(os.path.join(tmp_dir, 'telemetry.db'), batch_size=64)
+        now = datetime.now(timezone.utc)
+        for i in range(1000):
+            matched = ['DFW10'] if i % 3 == 0 else (['ServiceFabric'] if i % 3 == 1 else [])
+            sink.write({
+                'query_id': f'query_{i:05d}',
+                'user_id_hash': f'user{i % 50}',
+                'timestamp': (now - timedelta(minutes=1000 - i)).isoformat(),
+                'original_query': f'query {i}',
+                'matched_entities': matched,
+                'expanded_terms': [{'term': e, 'weight': 1.0, 'source': 'canonical'} for e in matched],
+                'expansion_count': len(matched),
+                'query_rewrite_time_ms': 1.0 + i % 5,
+                'stage_timings_ms': {'match': 0.5},
+                'metadata': {},
+                'sample_weight': 1.0
+            })
+        sink.flush()
+        assert sink.written == 1000
+
+        stats = sink.statistics()
+        assert stats['total_queries'] == 1000 and stats['unique_users'] == 50
+        assert stats['queries_without_matches'] == 333
+        print(f"✓ Wrote {sink.written} records in batches; statistics: {stats}")
+
+        last_hour = now - timedelta(hours=1)
+        zero = sink.zero_match_queries(start=last_hour, limit=10)
+        assert len(zero) == 10 and all(not r['matched_entities'] for r in zero)
+        dfw = sink.entity_queries('DFW10', start=last_hour)
+        assert dfw and all(r['matched_entities'] == ['DFW10'] for r in dfw)
+        assert dfw[0]['expanded_terms'][0]['term'] == 'DFW10'
+        print(f"✓ Last hour: {len(dfw)} DFW10 queries, newest zero-match {zero[-1]['query_id']}")
+
+        plan = sink.explain("SELECT query_id FROM query_entities WHERE entity = ? AND ts_us >= ?",
+                            ('DFW10', 0))
+        assert any('idx_query_entities_entity_ts' in step for step in plan)
+        print(f"✓ Entity window query plan: {plan[0]}")
+
+        records = sink.read_records()
+        assert [r['query_id'] for r in records] == [f'query_{i:05d}' for i in range(1000)]
+        print(f"✓ Read back {len(records)} records in timestamp order")
@@ -0,0 +1,555 @@
+"""
+Columnar Telemetry Store
+
+Compacts closed telemetry JSONL segments into NumPy .npz column files and
+answers analytics queries with vectorized operations instead of parsing
+every line with json.loads.
+
+Segment layout (one .npz per source .jsonl file, named
+<source stem>-<first record epoch us>-<inode>.npz):
+- typed columns: timestamp_us (int64, UTC epoch microseconds),
+  rewrite_time_ms (float64), expansion_count / match_count (int32),
+  first_answer_success / user_feedback (int8, -1 = unknown),
+  sample_weight (float32, 1/sampling rate; 1.0 for unsampled records)
+- dictionary-encoded columns: user codes + user_dict, entity codes in a
+  CSR layout (entity_offsets, entity_codes) + entity_dict,
+  expanded terms the same way (term_offsets, term_codes, term_weights,
+  term_source_codes) + term_dict / source_dict
+- stage timings: one float64 column per stage (stage__<name>, NaN if absent)
+- query_id / original_query as fixed-width unicode arrays
+
+A segment is "closed" when it hasn't been modified for `min_age_s`
+seconds; the file being appended to is left alone. A source keeps its
+segment name as it grows, so recompaction replaces the segment; a file
+recreated at the same path (after delete_source, or a shard of a reused
+pid) gets a new segment instead of overwriting the old one.
+
+With delete_source, per-process shards are only removed once their writer
+pid has exited (an idle live writer keeps its handle open). A removable
+file is first renamed into <log_dir>/.compacting/, so writers reopen a
+fresh file at the original path; the renamed file is then compacted and
+deleted. Files left there by an interrupted run are compacted on the
+next run.
+
+Usage:
+    python src/telemetry_store.py compact --log-dir outputs --out outputs/telemetry_segments
+    python src/telemetry_store.py summary --segments outputs/telemetry_segments --entity ServiceFabric
+
+    store = TelemetryStore.load('outputs/telemetry_segments')
+    view = store.select(start='2025-11-20', entity='ServiceFabric')
+    print(view.count, view.latency_percentiles())
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from telemetry_logger import pid_alive, shard_pid
+
+SEGMENT_FORMAT_VERSION = 1
+STAGE_PREFIX = 'stage__'
+
+# Subdirectory of log_dir holding sources renamed away for compaction
+CLAIM_DIR = '.compacting'
+
+_FEEDBACK_CODES = {'positive': 1, 'negative': 0, True: 1, False: 0}
+
+
+def _to_epoch_us(timestamp) -> int:
+    """ISO-8601 timestamp (naive = UTC) -> epoch microseconds"""
+    if isinstance(timestamp, (int, np.integer)):
+        return int(timestamp)
+    dt = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+
+def _tri_state(value) -> int:
+    """True/positive -> 1, False/negative -> 0, missing -> -1"""
+    return _FEEDBACK_CODES.get(value, -1)
+
+
+class _Dictionary:
+    """Assigns dense integer codes to strings in first-seen order"""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+    def values(self) -> np.ndarray:
+        return np.array(list(self.codes), dtype=str) if self.codes else np.array([], dtype='U1')
+
+
+def _encode_records(records: Iterable[dict]) -> Dict[str, np.ndarray]:
+    """Convert telemetry records into segment columns"""
+    users, entities, terms, sources = _Dictionary(), _Dictionary(), _Dictionary(), _Dictionary()
+
+    query_ids, queries, timestamps, latencies = [], [], [], []
+    expansion_counts, success, feedback, user_codes, weights = [], [], [], [], []
+    entity_offsets, entity_codes = [0], []
+    term_offsets, term_codes, term_weights, term_sources = [0], [], [], []
+    stage_rows = []
+
+    for record in records:
+        query_ids.append(record.get('query_id') or '')
+        queries.append(record.get('original_query') or '')
+        timestamps.append(_to_epoch_us(record['timestamp']))
+        latencies.append(float(record.get('query_rewrite_time_ms') or 0.0))
+        expansion_counts.append(int(record.get('expansion_count') or 0))
+        success.append(_tri_state(record.get('first_answer_success')))
+        feedback.append(_tri_state(record.get('user_feedback')))
+        user_codes.append(users.encode(record.get('user_id_hash') or ''))
+        weights.append(float(record.get('sample_weight', 1.0)))
+
+        for entity in record.get('matched_entities') or []:
+            entity_codes.append(entities.encode(entity))
+        entity_offsets.append(len(entity_codes))
+
+        for term in record.get('expanded_terms') or []:
+            term_codes.append(terms.encode(term.get('term', '')))
+            term_weights.append(float(term.get('weight', 0.0)))
+            term_sources.append(sources.encode(term.get('source', '')))
+        term_offsets.append(len(term_codes))
+
+        stage_rows.append(record.get('stage_timings_ms') or {})
+
+    entity_offsets = np.array(entity_offsets, dtype=np.int64)
+    columns = {
+        'format_version': np.array(SEGMENT_FORMAT_VERSION, dtype=np.int32),
+        'query_id': np.array(query_ids, dtype=str),
+        'original_query': np.array(queries, dtype=str),
+        'timestamp_us': np.array(timestamps, dtype=np.int64),
+        'rewrite_time_ms': np.array(latencies, dtype=np.float64),
+        'expansion_count': np.array(expansion_counts, dtype=np.int32),
+        'match_count': np.diff(entity_offsets).astype(np.int32),
+        'first_answer_success': np.array(success, dtype=np.int8),
+        'user_feedback': np.array(feedback, dtype=np.int8),
+        'user_codes': np.array(user_codes, dtype=np.int32),
+        'sample_weight': np.array(weights, dtype=np.float32),
+        'user_dict': users.values(),
+        'entity_offsets': entity_offsets,
+        'entity_codes': np.array(entity_codes, dtype=np.int32),
+        'entity_dict': entities.values(),
+        'term_offsets': np.array(term_offsets, dtype=np.int64),
+        'term_codes': np.array(term_codes, dtype=np.int32),
+        'term_weights': np.array(term_weights, dtype=np.float32),
+        'term_source_codes': np.array(term_sources, dtype=np.int8),
+        'term_dict': terms.values(),
+        'source_dict': sources.values(),
+    }
+
+    stage_names = sorted({name for row in stage_rows for name in row})
+    for name in stage_names:
+        columns[STAGE_PREFIX + name] = np.array([row.get(name, np.nan) for row in stage_rows],
+                                                dtype=np.float64)
+    return columns
+
+
+def _read_jsonl(path: str) -> List[dict]:
+    """Parse a JSONL segment, skipping blank and truncated lines"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"WARNING: Skipping malformed line in {path}")
+    return records
+
+
+def _first_timestamp(path: str):
+    """Timestamp of the first complete record in a JSONL file (None if empty)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record.get('timestamp'):
+                return record['timestamp']
+    return None
+
+
+def _segment_name(jsonl_path: str, first_timestamp) -> str:
+    """<source stem>-<first record epoch us>-<inode>: one name per source file"""
+    stem = os.path.splitext(os.path.basename(jsonl_path))[0]
+    return f"{stem}-{_to_epoch_us(first_timestamp)}-{os.stat(jsonl_path).st_ino}"
+
+
+def compact_segment(jsonl_path: str, output_dir: str,
+                    segment_name: Optional[str] = None) -> Optional[str]:
+    """
+    Convert one JSONL telemetry segment into a columnar .npz file
+
+    segment_name overrides the name derived from the source file.
+
+    Returns:
+        Path of the written segment, or None if the source had no records
+    """
+    records = [r for r in _read_jsonl(jsonl_path) if r.get('timestamp')]
+    if not records:
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    name = segment_name or _segment_name(jsonl_path, records[0]['timestamp'])
+    output_path = os.path.join(output_dir, f"{name}.npz")
+    tmp_path = output_path + '.tmp.npz'
+    np.savez_compressed(tmp_path, **_encode_records(records))
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _compact_claimed(claimed_path: str, output_dir: str) -> Optional[str]:
+    """
+    Compact a file renamed into the claim directory, then delete it
+
+    A writer that checked the path just before the rename can still append
+    one record to the renamed file, so it is reread until its size holds.
+    """
+    name = os.path.splitext(os.path.basename(claimed_path))[0]
+    while True:
+        size = os.path.getsize(claimed_path)
+        output_path = compact_segment(claimed_path, output_dir, name)
+        if os.path.getsize(claimed_path) == size:
+            break
+    os.remove(claimed_path)
+    return output_path
+
+
+def compact_telemetry(log_dir: str = 'outputs',
+                      output_dir: str = 'outputs/telemetry_segments',
+                      pattern: str = 'telemetry_logs*.jsonl',
+                      min_age_s: float = 60.0,
+                      delete_source: bool = False) -> List[str]:
+    """
+    Compact every closed telemetry segment in log_dir
+
+    Segments modified within the last `min_age_s` seconds are treated as
+    open and skipped. Segments whose .npz is already newer than the source
+    are not rewritten. delete_source keeps shards whose writer process is
+    still alive; they are recompacted once they change again. Other files
+    are renamed away before they are read, so no appended line is lost.
+
+    Returns:
+        Paths of the .npz segments written in this run
+    """
+    written = []
+    claim_dir = os.path.join(log_dir, CLAIM_DIR)
+
+    # Files claimed by an interrupted run
+    for claimed in sorted(glob.glob(os.path.join(claim_dir, '*.jsonl'))):
+        output_path = _compact_claimed(claimed, output_dir)
+        if output_path:
+            written.append(output_path)
+
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(log_dir, pattern))):
+        if '_shadow' in os.path.basename(path):
+            continue
+        source_mtime = os.path.getmtime(path)
+        if now - source_mtime < min_age_s:
+            continue
+
+        first_timestamp = _first_timestamp(path)
+        if first_timestamp is None:
+            continue
+        name = _segment_name(path, first_timestamp)
+
+        pid = shard_pid(path)
+        if delete_source and (pid is None or not pid_alive(pid)):
+            # Writers see the replaced path and reopen a new file there
+            os.makedirs(claim_dir, exist_ok=True)
+            claimed = os.path.join(claim_dir, f"{name}.jsonl")
+            os.replace(path, claimed)
+            output_path = _compact_claimed(claimed, output_dir)
+        else:
+            target = os.path.join(output_dir, f"{name}.npz")
+            if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+                continue
+            output_path = compact_segment(path, output_dir)
+        if output_path:
+            written.append(output_path)
+    return written
+
+
+def _weighted_percentiles(values: np.ndarray, weights: np.ndarray, percentiles) -> np.ndarray:
+    """
+    Percentiles of values each standing for `weights` queries
+
+    Uniform weights give np.percentile's (interpolated) result; otherwise
+    the inverted CDF of the weighted distribution.
+    """
+    if np.all(weights == weights[0]):
+        return np.percentile(values, percentiles)
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order], dtype=np.float64)
+    ranks = np.asarray(percentiles, dtype=np.float64) / 100 * cumulative[-1]
+    idx = np.minimum(np.searchsorted(cumulative, ranks, side='left'), len(values) - 1)
+    return values[order][idx]
+
+
+def _remap(local_dict: np.ndarray, global_dict: dict) -> np.ndarray:
+    """Map a segment's dictionary codes onto the store-wide dictionary"""
+    return np.array([global_dict.setdefault(v, len(global_dict)) for v in local_dict.tolist()],
+                    dtype=np.int32)
+
+
+class TelemetryStore:
+    """
+    All compacted segments concatenated into store-wide columns
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, np.ndarray]):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self._entity_index = {name: i for i, name in enumerate(dictionaries['entity'].tolist())}
+        self._user_index = {name: i for i, name in enumerate(dictionaries['user'].tolist())}
+
+    @classmethod
+    def load(cls, segment_dir: str = 'outputs/telemetry_segments') -> 'TelemetryStore':
+        """Load and merge every .npz segment in segment_dir"""
+        paths = sorted(p for p in glob.glob(os.path.join(segment_dir, '*.npz'))
+                       if not p.endswith('.tmp.npz'))
+        return cls.from_segments(paths)
+
+    @classmethod
+    def from_segments(cls, paths: List[str]) -> 'TelemetryStore':
+        """Merge segments, re-keying their dictionaries into shared ones"""
+        users, entities, terms, sources = {}, {}, {}, {}
+        parts = {name: [] for name in ('query_id', 'original_query', 'timestamp_us',
+                                       'rewrite_time_ms', 'expansion_count', 'match_count',
+                                       'first_answer_success', 'user_feedback', 'user_codes',
+                                       'sample_weight',
+                                       'entity_codes', 'term_codes', 'term_weights',
+                                       'term_source_codes')}
+        entity_offsets, term_offsets = [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)]
+        stage_parts = {}
+        rows = 0
+
+        for path in paths:
+            with np.load(path) as seg:
+                n = len(seg['timestamp_us'])
+                for name in ('query_id', 'original_query', 'timestamp_us', 'rewrite_time_ms',
+                             'expansion_count', 'match_count', 'first_answer_success',
+                             'user_feedback', 'term_weights'):
+                    parts[name].append(seg[name])
+                parts['user_codes'].append(_remap(seg['user_dict'], users)[seg['user_codes']])
+                parts['sample_weight'].append(seg['sample_weight'] if 'sample_weight' in seg.files
+                                              else np.ones(n, dtype=np.float32))
+                parts['entity_codes'].append(_remap(seg['entity_dict'], entities)[seg['entity_codes']])
+                parts['term_codes'].append(_remap(seg['term_dict'], terms)[seg['term_codes']])
+                parts['term_source_codes'].append(
+                    _remap(seg['source_dict'], sources)[seg['term_source_codes']])
+                entity_offsets.append(seg['entity_offsets'][1:] + entity_offsets[-1][-1])
+                term_offsets.append(seg['term_offsets'][1:] + term_offsets[-1][-1])
+
+                for name in seg.files:
+                    if name.startswith(STAGE_PREFIX):
+                        stage_parts.setdefault(name, []).append((rows, seg[name]))
+                rows += n
+
+        columns = {name: np.concatenate(chunks) if chunks else np.array([])
+                   for name, chunks in parts.items()}
+        columns['entity_offsets'] = np.concatenate(entity_offsets)
+        columns['term_offsets'] = np.concatenate(term_offsets)
+        for name, chunks in stage_parts.items():
+            column = np.full(rows, np.nan)
+            for offset, values in chunks:
+                column[offset:offset + len(values)] = values
+            columns[name] = column
+
+        dictionaries = {
+            'user': np.array(list(users), dtype=str),
+            'entity': np.array(list(entities), dtype=str),
+            'term': np.array(list(terms), dtype=str),
+            'source': np.array(list(sources), dtype=str),
+        }
+        return cls(columns, dictionaries)
+
+    def __len__(self) -> int:
+        return len(self.columns['timestamp_us'])
+
+    def entity_mask(self, entity: str) -> np.ndarray:
+        """Rows whose matched entities include `entity`"""
+        mask = np.zeros(len(self), dtype=bool)
+        code = self._entity_index.get(entity)
+        if code is None:
+            return mask
+        hits = np.flatnonzero(self.columns['entity_codes'] == code)
+        # Row of each hit: the CSR offset interval that contains it
+        rows = np.searchsorted(self.columns['entity_offsets'], hits, side='right') - 1
+        mask[rows] = True
+        return mask
+
+    def select(self,
+               start: Union[str, datetime, None] = None,
+               end: Union[str, datetime, None] = None,
+               entity: Optional[str] = None,
+               user_id_hash: Optional[str] = None,
+               matched: Optional[bool] = None) -> 'TelemetryView':
+        """
+        Filter rows by time range [start, end), entity, user and match status
+        """
+        mask = np.ones(len(self), dtype=bool)
+        ts = self.columns['timestamp_us']
+        if start is not None:
+            mask &= ts >= _to_epoch_us(start.isoformat() if isinstance(start, datetime) else start)
+        if end is not None:
+            mask &= ts < _to_epoch_us(end.isoformat() if isinstance(end, datetime) else end)
+        if entity is not None:
+            mask &= self.entity_mask(entity)
+        if user_id_hash is not None:
+            mask &= self.columns['user_codes'] == self._user_index.get(user_id_hash, -1)
+        if matched is not None:
+            mask &= (self.columns['match_count'] > 0) == matched
+        return TelemetryView(self, mask)
+
+    def all(self) -> 'TelemetryView':
+        return TelemetryView(self, np.ones(len(self), dtype=bool))
+
+
+class TelemetryView:
+    """
+    A filtered set of rows with vectorized aggregations
+
+    Rates, entity counts and latency statistics are weighted by
+    sample_weight, like TelemetryLogger.get_statistics(): the sampler keeps
+    every zero-match, slow and error record, so unweighted numbers would
+    overstate them.
+    """
+
+    def __init__(self, store: TelemetryStore, mask: np.ndarray):
+        self.store = store
+        self.mask = mask
+
+    @property
+    def count(self) -> int:
+        return int(self.mask.sum())
+
+    @property
+    def estimated_count(self) -> float:
+        """Queries represented by the rows (sum of sample weights)"""
+        return float(self.column('sample_weight').sum())
+
+    def column(self, name: str) -> np.ndarray:
+        return self.store.columns[name][self.mask]
+
+    def latency_percentiles(self, percentiles=(50, 95, 99), stage: Optional[str] = None) -> Dict[str, float]:
+        """Rewrite latency (or one stage's) percentiles in ms"""
+        values = self.column(STAGE_PREFIX + stage if stage else 'rewrite_time_ms')
+        weights = self.column('sample_weight')
+        present = ~np.isnan(values)
+        values, weights = values[present], weights[present]
+        if not len(values):
+            return {}
+        result = {f"p{p}": float(v)
+                  for p, v in zip(percentiles, _weighted_percentiles(values, weights, percentiles))}
+        result['mean'] = float(np.average(values, weights=weights))
+        return result
+
+    def zero_match_rate(self) -> float:
+        if not self.count:
+            return 0.0
+        weights = self.column('sample_weight')
+        return float(weights[self.column('match_count') == 0].sum() / weights.sum())
+
+    def unique_users(self) -> int:
+        return int(np.unique(self.column('user_codes')).size)
+
+    def entity_counts(self, top: Optional[int] = None) -> Dict[str, int]:
+        """Estimated queries per matched entity (sum of sample weights), most frequent first"""
+        offsets = self.store.columns['entity_offsets']
+        lengths = np.diff(offsets)
+        hit_mask = np.repeat(self.mask, lengths)
+        hit_weights = np.repeat(self.store.columns['sample_weight'], lengths)[hit_mask]
+        counts = np.bincount(self.store.columns['entity_codes'][hit_mask], weights=hit_weights,
+                             minlength=len(self.store.dictionaries['entity']))
+        order = np.argsort(-counts, kind='stable')
+        order = order[counts[order] > 0][:top]
+        names = self.store.dictionaries['entity']
+        return {str(names[i]): int(round(counts[i])) for i in order}
+
+    def latency_by_period(self, period: str = 'day', percentile: float = 95) -> Dict[str, Dict]:
+        """Query count and (weighted) latency percentile per hour or day (UTC)"""
+        unit = {'hour': 'h', 'day': 'D'}[period]
+        buckets = self.column('timestamp_us').astype('datetime64[us]').astype(f'datetime64[{unit}]')
+        latencies = self.column('rewrite_time_ms')
+        weights = self.column('sample_weight')
+        order = np.argsort(buckets, kind='stable')
+        buckets, latencies, weights = buckets[order], latencies[order], weights[order]
+        keys, starts = np.unique(buckets, return_index=True)
+        result = {}
+        for key, chunk, chunk_weights in zip(keys, np.split(latencies, starts[1:]),
+                                             np.split(weights, starts[1:])):
+            result[str(key)] = {
+                'count': int(chunk.size),
+                'estimated_count': round(float(chunk_weights.sum())),
+                f'p{percentile:g}': float(_weighted_percentiles(chunk, chunk_weights, percentile)),
+                'mean': float(np.average(chunk, weights=chunk_weights))
+            }
+        return result
+
+    def summary(self) -> Dict:
+        return {
+            'queries': self.count,
+            'estimated_queries': round(self.estimated_count),
+            'unique_users': self.unique_users(),
+            'zero_match_rate': round(self.zero_match_rate(), 4),
+            'latency_ms': self.latency_percentiles(),
+            'top_entities': self.entity_counts(top=10)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar telemetry compaction and queries")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    compact = sub.add_parser('compact', help='Convert closed JSONL segments to .npz')
+    compact.add_argument('--log-dir', default='outputs')
+    compact.add_argument('--out', default='outputs/telemetry_segments')
+    compact.add_argument('--pattern', default='telemetry_logs*.jsonl')
+    compact.add_argument('--min-age', type=float, default=60.0,
+                         help='Seconds since last write before a segment counts as closed')
+    compact.add_argument('--delete-source', action='store_true')
+
+    summary = sub.add_parser('summary', help='Aggregate compacted segments')
+    summary.add_argument('--segments', default='outputs/telemetry_segments')
+    summary.add_argument('--start')
+    summary.add_argument('--end')
+    summary.add_argument('--entity')
+    summary.add_argument('--by', choices=['hour', 'day'])
+
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        written = compact_telemetry(args.log_dir, args.out, args.pattern, args.min_age,
+                                    args.delete_source)
+        for path in written:
+            print(f"✓ Compacted {path}")
+        print(f"✓ {len(written)} segment(s) written")
+        return
+
+    start = time.perf_counter()
+    store = TelemetryStore.load(args.segments)
+    view = store.select(start=args.start, end=args.end, entity=args.entity)
+    result = view.latency_by_period(args.by) if args.by else view.summary()
+    print(json.dumps(result, indent=2))
+    print(f"\n✓ {view.count} of {len(store)} rows in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Telemetry Tail
+
+Follows the telemetry stream (base file plus per-process shards) as it is
+written, and turns new records into small additive deltas for live views.
+
+- TelemetryTailer: remembers a byte offset per file and only reads what
+  was appended since the last poll. Shards that appear later are picked
+  up. A partially flushed last line is held back until its newline
+  arrives. A file that shrinks (truncated or replaced) is re-read from
+  the start.
+- LiveAggregator: folds records into a delta. The delta holds query
+  counts (weighted by sample_weight), a latency histogram delta (the
+  PerformanceMonitor bucket layout), per-entity match counts and the
+  new zero-result queries. Deltas are additive, so merge_deltas() can
+  coalesce several into one when a consumer falls behind.
+
+Usage:
+    tailer = TelemetryTailer('outputs/telemetry_logs.jsonl')
+    aggregator = LiveAggregator()
+    while True:
+        delta = aggregator.delta(tailer.poll())
+        if delta['records']:
+            publish(delta)
+        time.sleep(1)
+"""
+
+import heapq
+import json
+import os
+from bisect import bisect_left
+from datetime import datetime
+
+from performance_monitor import DEFAULT_BUCKETS_MS
+from telemetry_logger import stream_paths
+
+# Zero-result queries carried per delta (the rest are only counted)
+MAX_ZERO_RESULT_QUERIES = 20
+
+# Entities carried per delta, by match count
+MAX_DELTA_ENTITIES = 20
+
+# Upper bound on bytes read from one file per poll
+MAX_READ_BYTES = 8 << 20
+
+
+class TelemetryTailer:
+    """
+    Incremental reader over a telemetry stream and its shards
+    """
+
+    def __init__(self, storage_path: str, from_start: bool = False):
+        """
+        Args:
+            storage_path: Base telemetry path (shards are found next to it)
+            from_start: Also return records already in the files; by default
+                only records written after the first poll are returned
+        """
+        self.storage_path = storage_path
+        self._offsets = {}
+        self._partial = {}
+        self._initialized = from_start
+
+    def _skip_existing(self):
+        for path in stream_paths(self.storage_path):
+            try:
+                self._offsets[path] = os.path.getsize(path)
+            except OSError:
+                continue
+        self._initialized = True
+
+    def poll(self) -> list:
+        """Records appended since the last poll (all files, each in write order)"""
+        if not self._initialized:
+            self._skip_existing()
+            return []
+
+        records = []
+        for path in stream_paths(self.storage_path):
+            records.extend(self._read_new(path))
+        return records
+
+    def _read_new(self, path: str) -> list:
+        offset = self._offsets.get(path, 0)
+        try:
+            size = os.path.getsize(path)
+            if size < offset:
+                # Truncated or replaced: start over
+                offset = 0
+                self._partial.pop(path, None)
+            if size == offset:
+                return []
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(min(size - offset, MAX_READ_BYTES))
+        except OSError:
+            return []
+        self._offsets[path] = offset + len(data)
+
+        data = self._partial.pop(path, b'') + data
+        lines = data.split(b'\n')
+        if lines[-1]:
+            # No newline yet: the writer hasn't finished flushing this line
+            self._partial[path] = lines[-1]
+        records = []
+        for line in lines[:-1]:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+
+def empty_delta(buckets=DEFAULT_BUCKETS_MS) -> dict:
+    return {
+        'records': 0,
+        'queries': 0.0,
+        'matched': 0.0,
+        'zero_match': 0.0,
+        'latency': {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1), 'sum_ms': 0.0},
+        'entities': {},
+        'zero_result_queries': [],
+        'zero_result_dropped': 0
+    }
+
+
+def merge_deltas(target: dict, delta: dict) -> dict:
+    """Add delta into target (in place) and return target"""
+    target['records'] += delta['records']
+    target['queries'] += delta['queries']
+    target['matched'] += delta['matched']
+    target['zero_match'] += delta['zero_match']
+    target['latency']['counts'] = [a + b for a, b in zip(target['latency']['counts'],
+                                                         delta['latency']['counts'])]
+    target['latency']['sum_ms'] += delta['latency']['sum_ms']
+    for entity, count in delta['entities'].items():
+        target['entities'][entity] = target['entities'].get(entity, 0) + count
+    room = MAX_ZERO_RESULT_QUERIES - len(target['zero_result_queries'])
+    incoming = delta['zero_result_queries']
+    target['zero_result_queries'].extend(incoming[:max(room, 0)])
+    target['zero_result_dropped'] += delta['zero_result_dropped'] + max(len(incoming) - max(room, 0), 0)
+    if 'since' in delta:
+        target.setdefault('since', delta['since'])
+    if 'until' in delta:
+        target['until'] = delta['until']
+    return target
+
+
+class LiveAggregator:
+    """
+    Folds telemetry records into additive deltas
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self._last_until = None
+
+    def delta(self, records: list) -> dict:
+        """Delta for a batch of records (an empty delta if there are none)"""
+        delta = empty_delta(self.buckets)
+        counts = delta['latency']['counts']
+        entities = delta['entities']
+        zero_results = delta['zero_result_queries']
+
+        for record in records:
+            if 'query_rewrite_time_ms' not in record:
+                # Not a query record (e.g. a shadow comparison)
+                continue
+            weight = record.get('sample_weight', 1.0)
+            time_ms = record.get('query_rewrite_time_ms') or 0.0
+            matched = record.get('matched_entities') or []
+
+            delta['records'] += 1
+            delta['queries'] += weight
+            counts[bisect_left(self.buckets, time_ms)] += 1
+            delta['latency']['sum_ms'] += time_ms
+            if matched:
+                delta['matched'] += weight
+                for entity in matched:
+                    entities[entity] = entities.get(entity, 0) + weight
+            else:
+                delta['zero_match'] += weight
+                if len(zero_results) < MAX_ZERO_RESULT_QUERIES:
+                    zero_results.append({
+                        'query_id': record.get('query_id'),
+                        'query': record.get('original_query'),
+                        'timestamp': record.get('timestamp')
+                    })
+                else:
+                    delta['zero_result_dropped'] += 1
+
+        if len(entities) > MAX_DELTA_ENTITIES:
+            delta['entities'] = dict(heapq.nlargest(MAX_DELTA_ENTITIES, entities.items(),
+                                                    key=lambda item: item[1]))
+        now = datetime.now().isoformat()
+        delta['since'] = self._last_until or now
+        delta['until'] = now
+        self._last_until = now
+        return delta
+
+
+# Test function
+if __name__ == "__main__":
+    import tempfile
+    from telemetry_logger import TelemetryLogger
+
+    print("Testing telemetry tail...\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'telemetry_logs.jsonl')
+        logger = TelemetryLogger(path, flush_every=1)
+        tailer = TelemetryTailer(path)
+        aggregator = LiveAggregator()
+
+        logger.log_query(logger.generate_query_id(), 'alice', 'old query', {'matched_entities': []},
+                         {'time_ms': 1.0})
+        assert tailer.poll() == []  # existing records are skipped
+
+        for i in range(5):
+            matched = ['DFW10'] if i % 2 else []
+            logger.log_query(logger.generate_query_id(), f'user{i}', f'query {i}',
+                             {'matched_entities': matched}, {'time_ms': 2.0 + i})
+        # A half-written line is held back until it is complete
+        with open(path, 'ab') as f:
+            f.write(b'{"query_id": "partial"')
+
+        delta = aggregator.delta(tailer.poll())
+        assert delta['records'] == 5 and delta['zero_match'] == 3
+        print(f"  delta: {delta['records']} records, {delta['zero_match']:.0f} zero-match, "
+              f"entities={delta['entities']}")
+
+        combined = merge_deltas(empty_delta(), delta)
+        merge_deltas(combined, delta)
+        assert combined['records'] == 10 and sum(combined['latency']['counts']) == 10
+        print(f"✓ Tailed {delta['records']} new records; merged deltas add up")
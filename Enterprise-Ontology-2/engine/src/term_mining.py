@@ -0,0 +1,375 @@
+"""
+Lexicon Term Mining
+
+Finds lexicon candidates in the queries the rewriter couldn't match. One
+streaming pass over the telemetry logs (base file and shards, any order)
+keeps memory bounded with Space-Saving counters (sketches.py):
+
+- zero-match counter: word 1-3 grams of queries with no matched entity,
+  or with a zero result count in their metadata. Each n-gram is counted
+  once per query. N-grams that start or end with a stopword, or that are
+  already lexicon terms, are skipped.
+- co-occurrence counters: over distinct matched query texts, how many
+  contain each n-gram and how many of those matched each entity. Logs
+  repeat popular queries, so counting every copy would let one query
+  repeated a hundred times look like 100% confidence.
+
+Candidates are ranked by zero-match frequency x (1 + confidence), where
+confidence is the share of the n-gram's distinct matched queries that also
+matched its most frequent entity. An n-gram is proposed as a synonym of
+that entity only when it occurs in at least `min_queries` distinct matched
+queries, and the confidence is high and also well above the entity's base
+rate (lift), so words that merely co-occur with a very common entity
+such as "capacity" are not proposed. The lift needed is capped at halfway
+between 1 and the entity's highest possible lift (1 / base rate): an entity
+matched by half the queries can't reach a lift of 3, so an n-gram only has
+to close half the gap from its base rate to certainty. Generic request words ("explain",
+"compare", "difference") are never candidates. Tokens shaped like site codes
+(3 letters + 2-3 digits) are proposed as facilities, with market and
+region copied from a known facility with the same prefix. The patch is written in the
+lexicon_v01_final.yaml layout, so a reviewer can merge entries into the
+matching sections. The remaining frequent n-grams are listed as comments.
+
+Usage:
+    python src/term_mining.py --telemetry outputs/telemetry_logs.jsonl \\
+        --lexicon data/lexicon_v01_final.yaml --out outputs/lexicon_patch.yaml
+"""
+
+import argparse
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+import yaml
+
+from sketches import SpaceSaving
+from telemetry_logger import stream_paths
+
+try:
+    from orjson import loads
+except ImportError:  # optional dependency
+    from json import loads
+
+LEXICON_SECTIONS = ('products', 'facilities', 'technical_terms', 'partners', 'geographic_terms')
+
+# Counters per summary; exact while fewer distinct keys are seen
+DEFAULT_CAPACITY = 50000
+
+MAX_NGRAM = 3
+
+TOKEN_RE = re.compile(r"[0-9a-zäöüß]+(?:[+\-.'][0-9a-zäöüß]+)*\+?")
+
+# "3 letters (market) + 2-3 digits" (lexicon usage notes), e.g. dfw10, lhr20
+SITE_CODE_RE = re.compile(r"^[a-z]{3}\d{2,3}$")
+
+# English function words, generic request verbs and conversational filler;
+# never lexicon terms on their own
+STOPWORDS = frozenset("""
+a about above actually after again all also am an and any anything are as at based be because
+been before being below best better between both but by can can't could compare comparison
+create currently details did difference differences different do does doesn't doing don't done
+each else end every everything example examples explain few find for from further get give go
+going got had has have having he hello help her here hers hey hi him his how i i'd i'm i've if
+im in info information into is it its itself just know let like list looking make many may
+maybe me more most much my need new no nor not now of off ok okay on once one only option
+options or other our out over own please provide question questions really review same see
+send share she should show so some something still stuff such summary sure tell than thank
+thanks that the their them then there these they thing things this those through to today too
+trying under until up us use versus very vs want was way we well were what when where which
+while who whom why will with wondering worse would yes yet you your
+""".split())
+
+# Distinct query texts whose n-grams are cached (logs repeat popular queries)
+NGRAM_CACHE_SIZE = 100000
+
+
+def lexicon_terms(lexicon: dict) -> Dict[str, str]:
+    """Lowercased canonical, synonym, related and market terms -> owning canonical"""
+    terms = {}
+    for section in LEXICON_SECTIONS:
+        for item in lexicon.get(section) or []:
+            canonical = item.get('canonical')
+            if not canonical:
+                continue
+            terms.setdefault(canonical.lower(), canonical)
+            for key in ('synonyms', 'related_terms', 'key_markets'):
+                for term in item.get(key) or []:
+                    terms.setdefault(str(term).lower(), canonical)
+    for rule in lexicon.get('disambiguation') or []:
+        if rule.get('term'):
+            terms.setdefault(rule['term'].lower(), rule['term'])
+    return terms
+
+
+def ngrams(text: str, known: Set[str], max_n: int = MAX_NGRAM) -> Set[str]:
+    """Distinct candidate n-grams of a query"""
+    words = TOKEN_RE.findall(text.lower())
+    found = set()
+    for n in range(1, max_n + 1):
+        for i in range(len(words) - n + 1):
+            first, last = words[i], words[i + n - 1]
+            if first in STOPWORDS or last in STOPWORDS:
+                continue
+            gram = ' '.join(words[i:i + n])
+            if len(gram) < 2 or gram.isdigit() or gram in known:
+                continue
+            found.add(gram)
+    return found
+
+
+def _zero_results(record: dict) -> bool:
+    metadata = record.get('metadata') or {}
+    for key in ('result_count', 'resultCount'):
+        if metadata.get(key) == 0:
+            return True
+    return False
+
+
+def iter_records(path: str) -> Iterable[dict]:
+    """Records of the log and its shards, file by file (order doesn't matter here)"""
+    for file_path in stream_paths(path):
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield loads(line)
+                except ValueError:
+                    continue
+
+
+class TermMiner:
+    """
+    Single-pass, bounded-memory n-gram counts over telemetry
+    """
+
+    def __init__(self, lexicon: dict, capacity: int = DEFAULT_CAPACITY, max_n: int = MAX_NGRAM):
+        self.lexicon = lexicon
+        self.known = lexicon_terms(lexicon)
+        self.max_n = max_n
+        self.zero_match = SpaceSaving(capacity)
+        # Distinct matched query texts per n-gram / (n-gram, entity)
+        self.matched = SpaceSaving(capacity)
+        self.pairs = SpaceSaving(capacity * 2)
+        # One counter per lexicon entity, so a plain dict stays small
+        self.entity_counts = {}
+        self.records = 0
+        self.matched_queries = 0
+        self.zero_match_queries = 0
+        self._cache = {}
+
+    def _entry(self, text: str) -> list:
+        """[n-grams, counted as a matched query yet] for a query text"""
+        entry = self._cache.get(text)
+        if entry is None:
+            entry = [ngrams(text, self.known, self.max_n), False]
+            if len(self._cache) >= NGRAM_CACHE_SIZE:
+                # Texts seen again after a clear count once more as distinct
+                self._cache.clear()
+            self._cache[text] = entry
+        return entry
+
+    def add(self, record: dict):
+        text = record.get('original_query')
+        if not text or 'query_rewrite_time_ms' not in record:
+            # Compact records carry no text; shadow comparisons aren't queries
+            return
+        self.records += 1
+        entry = self._entry(text)
+        grams = entry[0]
+        entities = record.get('matched_entities') or []
+        if not entities or _zero_results(record):
+            self.zero_match_queries += 1
+            self.zero_match.update(grams)
+        if entities and not entry[1]:
+            entry[1] = True
+            self.matched_queries += 1
+            for entity in entities:
+                self.entity_counts[entity] = self.entity_counts.get(entity, 0) + 1
+            for gram in grams:
+                self.matched.add(gram)
+                for entity in entities:
+                    self.pairs.add((gram, entity))
+
+    def consume(self, records: Iterable[dict]) -> 'TermMiner':
+        for record in records:
+            self.add(record)
+        return self
+
+    def _associations(self) -> Dict[str, tuple]:
+        """n-gram -> (entity, pair count) for its most frequent co-occurring entity"""
+        best = {}
+        for (gram, entity), count, _ in self.pairs.items():
+            if gram not in best or count > best[gram][1]:
+                best[gram] = (entity, count)
+        return best
+
+    def candidates(self, min_count: int = 5, top: int = 100, min_confidence: float = 0.3,
+                   min_lift: float = 3.0, min_queries: int = 10) -> List[dict]:
+        """
+        Ranked candidates
+
+        Args:
+            min_count: Zero-match queries (all copies) a candidate needs
+            top: Candidates returned
+            min_confidence, min_lift: Entity association a synonym needs; the
+                lift needed is capped at (1 + 1 / base rate) / 2 for common entities
+            min_queries: Distinct matched queries an n-gram must occur in
+                before its association is trusted
+
+        Returns:
+            [{'term', 'count', 'kind': 'site_code' | 'synonym' | 'unassigned',
+              'entity', 'confidence', 'lift', 'queries', 'score'}], best first
+        """
+        associations = self._associations()
+        ranked = []
+        for gram, count, error in self.zero_match.items():
+            # count - error is a guaranteed lower bound on the true count
+            if count - error < min_count:
+                continue
+            entity, confidence, lift, lift_needed, total = None, 0.0, 0.0, min_lift, 0
+            if gram in associations:
+                candidate, pair_count = associations[gram]
+                total = self.matched.count(gram)
+                if total >= min_queries:
+                    entity, confidence = candidate, min(pair_count / total, 1.0)
+                    base_rate = self.entity_counts.get(entity, 0) / max(self.matched_queries, 1)
+                    lift = confidence / base_rate if base_rate else 0.0
+                    if base_rate:
+                        lift_needed = min(min_lift, (1 + 1 / base_rate) / 2)
+            if SITE_CODE_RE.match(gram):
+                kind = 'site_code'
+            elif entity and confidence >= min_confidence and lift > 1 and lift >= lift_needed:
+                kind = 'synonym'
+            else:
+                kind = 'unassigned'
+            ranked.append({
+                'term': gram,
+                'count': count - error,
+                'kind': kind,
+                'entity': entity,
+                'confidence': round(confidence, 3),
+                'lift': round(lift, 2),
+                'queries': total,
+                'score': (count - error) * (1 + confidence)
+            })
+        ranked.sort(key=lambda c: (-c['score'], c['term']))
+        return ranked[:top]
+
+
+def _quote(value: str) -> str:
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _section_of(lexicon: dict, canonical: str) -> Optional[str]:
+    for section in LEXICON_SECTIONS:
+        if any(item.get('canonical') == canonical for item in lexicon.get(section) or []):
+            return section
+    return None
+
+
+def _facility_for_prefix(lexicon: dict, prefix: str) -> dict:
+    for item in lexicon.get('facilities') or []:
+        if str(item.get('canonical', '')).lower().startswith(prefix):
+            return item
+    return {}
+
+
+def render_patch(miner: TermMiner, candidates: List[dict], source: str) -> str:
+    """YAML patch in the lexicon_v01_final.yaml layout"""
+    lexicon = miner.lexicon
+    sections = {section: [] for section in LEXICON_SECTIONS}
+    synonyms = {}
+    unassigned = []
+
+    for c in candidates:
+        if c['kind'] == 'site_code':
+            code = c['term'].upper()
+            known = _facility_for_prefix(lexicon, c['term'][:3])
+            lines = [f"  - canonical: {_quote(code)}  # {c['count']} zero-match queries",
+                     '    type: "facility"']
+            if known:
+                lines.append(f"    market: {_quote(known.get('market', ''))}  # from {known['canonical']}")
+                lines.append(f"    region: {_quote(known.get('region', ''))}")
+            lines.append('    synonyms: []')
+            sections['facilities'].append('\n'.join(lines))
+        elif c['kind'] == 'synonym':
+            synonyms.setdefault(c['entity'], []).append(c)
+        else:
+            unassigned.append(c)
+
+    for entity, found in synonyms.items():
+        section = _section_of(lexicon, entity) or 'technical_terms'
+        lines = [f"  - canonical: {_quote(entity)}", '    synonyms:']
+        for c in found:
+            lines.append(f"      - {_quote(c['term'])}  # {c['count']} zero-match; with {entity} in "
+                         f"{c['confidence']:.0%} of its {c['queries']} distinct matched queries "
+                         f"(lift {c['lift']:.1f})")
+        sections[section].append('\n'.join(lines))
+
+    out = [
+        f"# Lexicon patch generated by term_mining.py on {datetime.now().date().isoformat()}",
+        f"# Source: {source} ({miner.records:,} query records, "
+        f"{miner.zero_match_queries:,} zero-match)",
+        "# Entries below add to (or create) entities in lexicon_v01_final.yaml;",
+        "# review each one before merging, then rebuild the runtime artifact.",
+        ""
+    ]
+    for section in LEXICON_SECTIONS:
+        if sections[section]:
+            out.append(f"{section}:")
+            out.append('\n\n'.join(sections[section]))
+            out.append("")
+    if unassigned:
+        out.append("# Frequent zero-match n-grams without a clear entity (review manually):")
+        for c in unassigned:
+            hint = f", most often with {c['entity']} ({c['confidence']:.0%})" if c['entity'] else ''
+            out.append(f"#   {_quote(c['term'])}: {c['count']} queries{hint}")
+        out.append("")
+    return '\n'.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mine lexicon candidates from zero-match telemetry")
+    parser.add_argument('--telemetry', default='outputs/telemetry_logs.jsonl',
+                        help='TelemetryLogger log path (shards next to it are included)')
+    parser.add_argument('--lexicon', default='data/lexicon_v01_final.yaml')
+    parser.add_argument('--out', default='outputs/lexicon_patch.yaml')
+    parser.add_argument('--min-count', type=int, default=5, help='Min zero-match queries per candidate')
+    parser.add_argument('--top', type=int, default=100, help='Candidates to emit')
+    parser.add_argument('--min-confidence', type=float, default=0.3,
+                        help='Entity association needed to propose a synonym')
+    parser.add_argument('--min-lift', type=float, default=3.0,
+                        help="Confidence / the entity's share of matched queries needed for a synonym "
+                             "(capped for common entities)")
+    parser.add_argument('--min-queries', type=int, default=10,
+                        help='Distinct matched queries an n-gram needs before it can be a synonym')
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY,
+                        help='Counters per Space-Saving summary (bounds memory)')
+    args = parser.parse_args()
+
+    with open(args.lexicon, 'r') as f:
+        lexicon = yaml.safe_load(f)
+
+    start = time.perf_counter()
+    miner = TermMiner(lexicon, args.capacity).consume(iter_records(args.telemetry))
+    elapsed = time.perf_counter() - start
+    candidates = miner.candidates(args.min_count, args.top, args.min_confidence, args.min_lift,
+                                  args.min_queries)
+
+    with open(args.out, 'w') as f:
+        f.write(render_patch(miner, candidates, args.telemetry))
+
+    kinds = {kind: sum(1 for c in candidates if c['kind'] == kind)
+             for kind in ('site_code', 'synonym', 'unassigned')}
+    print(f"Scanned {miner.records:,} records ({miner.zero_match_queries:,} zero-match) in {elapsed:.1f}s "
+          f"({miner.records / max(elapsed, 1e-9):,.0f} records/s)")
+    for c in candidates[:10]:
+        print(f"  {c['term']:<32} {c['count']:>8}  {c['kind']:<10} {c['entity'] or ''}")
+    print(f"✓ {len(candidates)} candidates ({kinds['site_code']} site codes, {kinds['synonym']} synonyms, "
+          f"{kinds['unassigned']} unassigned) written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Stage Tracing
+
+Lightweight per-stage span timing for the query rewrite pipeline.
+Spans use perf_counter_ns and accumulate into a per-request Trace.
+When tracing is disabled, NULL_TRACE hands out a shared no-op span,
+so instrumented code costs only a method call.
+
+Usage:
+    tracer = Tracer(monitor)
+    trace = tracer.start()
+    with trace.span('normalize'):
+        ...
+    tracer.finish(trace)      # records 'rewrite.normalize' into the monitor
+    print(trace.as_ms())      # {'normalize': 0.0123}
+"""
+
+from time import perf_counter_ns
+from typing import Dict
+
+
+class _Span:
+    """Context manager that adds its elapsed time to a Trace"""
+
+    __slots__ = ('_spans', '_name', '_start')
+
+    def __init__(self, spans: dict, name: str):
+        self._spans = spans
+        self._name = name
+        self._start = 0
+
+    def __enter__(self):
+        self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = perf_counter_ns() - self._start
+        self._spans[self._name] = self._spans.get(self._name, 0) + elapsed
+        return False
+
+
+class _NullSpan:
+    """Shared no-op span used when tracing is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """
+    Per-request collection of stage durations
+
+    Repeated spans with the same name accumulate.
+    """
+
+    __slots__ = ('spans',)
+
+    enabled = True
+
+    def __init__(self):
+        self.spans = {}
+
+    def span(self, name: str) -> _Span:
+        """Time a stage: `with trace.span('match'): ...`"""
+        return _Span(self.spans, name)
+
+    def as_ms(self) -> Dict[str, float]:
+        """Stage durations in milliseconds"""
+        return {name: round(ns / 1e6, 4) for name, ns in self.spans.items()}
+
+
+class _NullTrace:
+    """Trace stand-in that records nothing"""
+
+    __slots__ = ()
+
+    enabled = False
+    spans = {}
+
+    def span(self, name: str) -> _NullSpan:
+        return NULL_SPAN
+
+    def as_ms(self) -> Dict[str, float]:
+        return {}
+
+
+NULL_TRACE = _NullTrace()
+
+
+class Tracer:
+    """
+    Creates traces and forwards finished spans to a PerformanceMonitor
+
+    Each stage is recorded under its own operation name: '<prefix>.<stage>'.
+    """
+
+    def __init__(self, monitor=None, prefix: str = 'rewrite', enabled: bool = True):
+        """
+        Args:
+            monitor: PerformanceMonitor to record stage timings into (optional)
+            prefix: Operation name prefix for recorded stages
+            enabled: When False, start() always returns NULL_TRACE
+        """
+        self.monitor = monitor
+        self.prefix = prefix
+        self.enabled = enabled
+
+    def start(self):
+        """Begin a new trace (or NULL_TRACE when disabled)"""
+        return Trace() if self.enabled else NULL_TRACE
+
+    def finish(self, trace):
+        """Record a finished trace's stages into the monitor"""
+        if not trace.enabled or self.monitor is None:
+            return
+        for name, elapsed_ns in trace.spans.items():
+            self.monitor.record(f"{self.prefix}.{name}", elapsed_ns / 1e6)
+
+
+# Test function
+if __name__ == "__main__":
+    import time
+    from performance_monitor import PerformanceMonitor
+
+    print("Testing Tracer...\n")
+
+    monitor = PerformanceMonitor()
+    tracer = Tracer(monitor)
+
+    for _ in range(20):
+        trace = tracer.start()
+        with trace.span('normalize'):
+            time.sleep(0.001)
+        with trace.span('match'):
+            time.sleep(0.002)
+        tracer.finish(trace)
+
+    print(f"Last trace: {trace.as_ms()}")
+    monitor.print_report()
+
+    # Overhead of a disabled span
+    n = 200_000
+    start = perf_counter_ns()
+    for _ in range(n):
+        with NULL_TRACE.span('noop'):
+            pass
+    print(f"\nDisabled span overhead: {(perf_counter_ns() - start) / n:.0f} ns/span")
@@ -0,0 +1,102 @@
+"""
+Measure bytes transferred per dashboard load.
+
+Replays what the browser fetches against the API app in-process:
+index.html, the assets it references and the four API calls made by
+useApiData (rewriter, adoption, feedback, status). Counts the response
+bytes on the wire (after Content-Encoding) for:
+
+- cold load: empty browser cache
+- warm load: repeat visit; immutable assets come from the cache without a
+  request, index.html is revalidated with If-None-Match
+
+under identity, gzip and brotli (+gzip) Accept-Encoding.
+
+Usage:
+    python scripts/measure_dashboard_load.py
+"""
+
+import os
+import re
+import sys
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dashboard', 'api')
+sys.path.insert(0, os.path.abspath(API_DIR))
+
+from fastapi.testclient import TestClient
+
+from main import app
+from static_files import IMMUTABLE_CACHE_CONTROL
+
+API_CALLS = ('/api/rewriter', '/api/adoption', '/api/feedback', '/api/status')
+
+ASSET_RE = re.compile(r'(?:src|href)="(/assets/[^"]+)"')
+
+ENCODINGS = (('identity', 'identity'), ('gzip', 'gzip'), ('br, gzip', 'br, gzip'))
+
+
+def _fetch(client, path, accept_encoding, headers=None):
+    """(wire bytes, response headers, status) for one GET"""
+    request_headers = {'Accept-Encoding': accept_encoding, **(headers or {})}
+    with client.stream('GET', path, headers=request_headers) as response:
+        wire = sum(len(chunk) for chunk in response.iter_raw())
+        return wire, response.headers, response.status_code
+
+
+def measure_load(client, accept_encoding, cache=None):
+    """
+    Bytes for one dashboard load
+
+    Args:
+        cache: {path: etag or None} from a previous load (warm load), or None (cold)
+
+    Returns:
+        (total bytes, {path: bytes}, cache for the next load)
+    """
+    transferred = {}
+    next_cache = {}
+
+    headers = {}
+    if cache and cache.get('/'):
+        headers['If-None-Match'] = cache['/']
+    wire, response_headers, status = _fetch(client, '/', accept_encoding, headers)
+    transferred['/'] = wire
+    next_cache['/'] = response_headers.get('etag') or (cache or {}).get('/')
+
+    with open(os.path.join(API_DIR, 'static', 'index.html')) as f:
+        assets = ASSET_RE.findall(f.read())
+    for asset in assets:
+        if cache and asset in cache:
+            # Immutable: served from the browser cache without a request
+            transferred[asset] = 0
+            next_cache[asset] = cache[asset]
+            continue
+        wire, response_headers, _ = _fetch(client, asset, accept_encoding)
+        transferred[asset] = wire
+        if response_headers.get('cache-control') == IMMUTABLE_CACHE_CONTROL:
+            next_cache[asset] = response_headers.get('etag')
+
+    for path in API_CALLS:
+        transferred[path], _, _ = _fetch(client, path, accept_encoding)
+
+    return sum(transferred.values()), transferred, next_cache
+
+
+def main():
+    client = TestClient(app)
+    print(f"{'Accept-Encoding':<16} {'cold load':>12} {'warm load':>12}")
+    print("-" * 42)
+    baseline = None
+    for label, accept_encoding in ENCODINGS:
+        cold, cold_detail, cache = measure_load(client, accept_encoding)
+        warm, _, _ = measure_load(client, accept_encoding, cache)
+        if baseline is None:
+            baseline = cold
+        print(f"{label:<16} {cold:>10,} B {warm:>10,} B")
+        for path, size in cold_detail.items():
+            print(f"    {path:<32} {size:>10,} B")
+    print(f"\n✓ Uncompressed, uncached load (previous behaviour): {baseline:,} B per load")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Precompress the built dashboard assets.
+
+Writes file.gz (gzip -9) and, when the optional `brotli` package is
+installed, file.br (quality 11) next to every compressible file, so the
+API serves compressed bytes without compressing per request (see
+dashboard/api/static_files.py). Variants that don't save at least 5% are
+skipped, and stale ones are removed. Run after each frontend build
+(`npm run build` does it via the postbuild script).
+
+Usage:
+    python scripts/precompress_assets.py                       # dashboard/api/static
+    python scripts/precompress_assets.py dashboard/web/dist
+"""
+
+import argparse
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+DEFAULT_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dashboard', 'api', 'static')
+
+COMPRESSIBLE_EXTENSIONS = ('.js', '.mjs', '.css', '.html', '.svg', '.json', '.txt', '.map', '.xml')
+
+# Smaller files fit in a packet or two anyway
+MIN_SIZE = 1024
+
+# Keep a variant only if it is at most this fraction of the original
+MAX_RATIO = 0.95
+
+
+def _write_variant(path: str, suffix: str, data: bytes, original_size: int) -> int:
+    """Write path+suffix if it is worth it; returns the bytes written (0 if skipped)."""
+    target = path + suffix
+    if len(data) > original_size * MAX_RATIO:
+        if os.path.exists(target):
+            os.remove(target)
+        return 0
+    with open(target, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def precompress(directory: str):
+    """Precompress every compressible file under directory; returns per-file sizes."""
+    results = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < MIN_SIZE:
+                continue
+
+            # mtime=0 keeps the output byte-identical across builds
+            gz_size = _write_variant(path, '.gz', gzip.compress(data, compresslevel=9, mtime=0), len(data))
+            br_size = 0
+            if brotli is not None:
+                br_size = _write_variant(path, '.br', brotli.compress(data, quality=11), len(data))
+            results.append((os.path.relpath(path, directory), len(data), gz_size, br_size))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write .gz/.br variants of built dashboard assets")
+    parser.add_argument('directory', nargs='?', default=DEFAULT_STATIC_DIR,
+                        help="Static build directory (default: dashboard/api/static)")
+    args = parser.parse_args()
+
+    results = precompress(args.directory)
+    if brotli is None:
+        print("brotli not installed: writing gzip variants only (pip install brotli)")
+    for path, size, gz_size, br_size in results:
+        line = f"  {path}: {size:,} B -> gzip {gz_size:,} B"
+        if br_size:
+            line += f", brotli {br_size:,} B"
+        print(line)
+    print(f"✓ Precompressed {len(results)} files in {os.path.abspath(args.directory)}")
+
+
+if __name__ == "__main__":
+    main()
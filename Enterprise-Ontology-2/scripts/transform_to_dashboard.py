@@ -1,10 +1,16 @@
 import os
+import sys
 import json
 from datetime import datetime, timedelta
-from collections import defaultdict
 from azure.cosmos import CosmosClient
 from dotenv import load_dotenv
 
+# Daily rollups are shared with the dashboard API (dashboard/api/services)
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dashboard', 'api', 'services')
+sys.path.insert(0, os.path.abspath(SERVICES_DIR))
+from rollup_store import RollupStore
+from sketches import SpaceSaving  # engine/src, put on sys.path by rollup_store
+
 load_dotenv()
 
 # =============================================================================
@@ -177,60 +183,48 @@ def fetch_rewriter_queries(container):
     return results
 
 
-def fetch_all_queries_for_adoption(container, days=None):
-    """Fetch all queries from production for adoption metrics."""
-    
+def _ts_filter(days=None, since_ts=None):
+    """WHERE clause for a days window and/or a _ts watermark (inclusive)."""
+    conditions = []
     if days:
         cutoff = datetime.now() - timedelta(days=days)
-        cutoff_ts = int(cutoff.timestamp())
-        query = f"""
-        SELECT 
-            c.user_id,
-            c.user_name,
-            c.timestamp,
-            c._ts,
-            c.conversation_id,
-            c.conversation,
-            c.llm_telemetry
-        FROM c 
-        WHERE c._ts >= {cutoff_ts}
-        ORDER BY c._ts DESC
-        """
-    else:
-        query = """
-        SELECT 
-            c.user_id,
-            c.user_name,
-            c.timestamp,
-            c._ts,
-            c.conversation_id,
-            c.conversation,
-            c.llm_telemetry
-        FROM c 
-        ORDER BY c._ts DESC
-        """
+        conditions.append(f"c._ts >= {int(cutoff.timestamp())}")
+    if since_ts:
+        conditions.append(f"c._ts >= {int(since_ts)}")
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def fetch_all_queries_for_adoption(container, days=None, since_ts=None):
+    """Fetch queries from production for adoption metrics (only _ts >= since_ts if given)."""
+    
+    query = f"""
+    SELECT 
+        c.id,
+        c.user_id,
+        c.user_name,
+        c.timestamp,
+        c._ts,
+        c.conversation_id,
+        c.conversation,
+        c.llm_telemetry
+    FROM c 
+    {_ts_filter(days, since_ts)}
+    ORDER BY c._ts DESC
+    """
     
     results = list(container.query_items(query, enable_cross_partition_query=True))
     print(f"Fetched {len(results)} total queries for adoption")
     return results
 
 
-def fetch_feedback(container, days=None):
-    """Fetch feedback from production feedback container."""
+def fetch_feedback(container, days=None, since_ts=None):
+    """Fetch feedback from production feedback container (only _ts >= since_ts if given)."""
     
-    if days:
-        cutoff = datetime.now() - timedelta(days=days)
-        cutoff_ts = int(cutoff.timestamp())
-        query = f"""
-        SELECT * FROM c 
-        WHERE c._ts >= {cutoff_ts}
-        ORDER BY c._ts DESC
-        """
-    else:
-        query = """
-        SELECT * FROM c 
-        ORDER BY c._ts DESC
-        """
+    query = f"""
+    SELECT * FROM c 
+    {_ts_filter(days, since_ts)}
+    ORDER BY c._ts DESC
+    """
     
     results = list(container.query_items(query, enable_cross_partition_query=True))
     print(f"Fetched {len(results)} feedback items")
@@ -273,92 +267,14 @@ def score_unscored_queries(raw_data, container):
 # ADOPTION METRICS CALCULATION
 # =============================================================================
 
-def calculate_adoption_metrics(raw_data):
-    """Calculate WAU, MAU, retention, and usage trends."""
-    now = datetime.now()
-    
-    # Extract user IDs and timestamps
-    user_queries = []
-    for doc in raw_data:
-        user_id = doc.get('user_id') or doc.get('user_name') or 'anonymous'
-        ts = doc.get('_ts', 0)
-        query_time = datetime.fromtimestamp(ts) if ts else None
-        
-        if query_time:
-            user_queries.append({
-                'user_id': user_id,
-                'timestamp': query_time,
-                'response_time': (doc.get('llm_telemetry') or {}).get('response_time_ms', 0)
-            })
-    
-    if not user_queries:
-        return {
-            "wau": 0, "mau": 0, "stickiness": 0, "totalQueries": 0,
-            "queriesPerUser": 0, "avgResponseTimeMs": 0,
-            "peakHour": 0, "queryTrend": [], "topUsers": [], "totalUsers": 0
-        }
-    
-    # --- WAU / MAU ---
-    week_ago = now - timedelta(days=7)
-    month_ago = now - timedelta(days=30)
-    
-    wau_users = set(q['user_id'] for q in user_queries if q['timestamp'] >= week_ago)
-    mau_users = set(q['user_id'] for q in user_queries if q['timestamp'] >= month_ago)
-    
-    wau = len(wau_users)
-    mau = len(mau_users)
-    stickiness = round((wau / mau * 100), 1) if mau > 0 else 0
-    
-    # --- Daily Query Volume (last 30 days) ---
-    daily_counts = defaultdict(int)
-    for q in user_queries:
-        if q['timestamp'] >= month_ago:
-            day_key = q['timestamp'].strftime('%Y-%m-%d')
-            daily_counts[day_key] += 1
-    
-    sorted_days = sorted(daily_counts.items())
-    query_trend = [{"date": d, "count": c} for d, c in sorted_days]
-    
-    # --- Queries per User ---
-    user_query_counts = defaultdict(int)
-    for q in user_queries:
-        user_query_counts[q['user_id']] += 1
-    
-    total_users = len(set(q['user_id'] for q in user_queries))
-    queries_per_user = round(len(user_queries) / total_users, 1) if total_users > 0 else 0
-    
-    # --- Response Time Stats ---
-    response_times = [q['response_time'] for q in user_queries if q['response_time'] and q['response_time'] > 0]
-    avg_response_time = round(sum(response_times) / len(response_times), 0) if response_times else 0
-    
-    # --- Peak Hours ---
-    hour_counts = defaultdict(int)
-    for q in user_queries:
-        hour_counts[q['timestamp'].hour] += 1
-    peak_hour = max(hour_counts, key=hour_counts.get) if hour_counts else 0
-    
-    # --- Top Users (anonymized) ---
-    top_users = []
-    for user_id, count in sorted(user_query_counts.items(), key=lambda x: -x[1])[:10]:
-        display_name = user_id[:8] + "..." if len(str(user_id)) > 8 else str(user_id)
-        top_users.append({"user": display_name, "queries": count})
-    
-    return {
-        "wau": wau,
-        "mau": mau,
-        "stickiness": stickiness,
-        "totalQueries": len(user_queries),
-        "totalUsers": total_users,
-        "queriesPerUser": queries_per_user,
-        "avgResponseTimeMs": avg_response_time,
-        "peakHour": peak_hour,
-        "queryTrend": query_trend,
-        "topUsers": top_users,
-        "metadata": {
-            "generatedAt": datetime.now().isoformat(),
-            "dataSource": "production"
-        }
+def calculate_adoption_metrics(rollups):
+    """Calculate WAU, MAU, retention, and usage trends from the daily rollups."""
+    metrics = rollups.adoption_metrics()
+    metrics["metadata"] = {
+        "generatedAt": datetime.now().isoformat(),
+        "dataSource": "production"
     }
+    return metrics
 
 
 # =============================================================================
@@ -411,12 +327,11 @@ def calculate_rewriter_metrics(raw_data):
     avg_expansion = round(sum(expansion_counts) / len(expansion_counts), 1) if expansion_counts else 0
     
     # Entity match frequency
-    entity_counts = defaultdict(int)
+    entity_counts = SpaceSaving(capacity=1000)
     for d in rewritten:
-        for entity in d.get('query_rewrite_telemetry', {}).get('matched_entities', []):
-            entity_counts[entity] += 1
+        entity_counts.update(d.get('query_rewrite_telemetry', {}).get('matched_entities', []))
     
-    top_entities = [{"entity": k, "count": v} for k, v in sorted(entity_counts.items(), key=lambda x: -x[1])[:10]]
+    top_entities = [{"entity": k, "count": v} for k, v in entity_counts.top(10)]
     
     # Build rewritten queries list
     rewritten_queries = []
@@ -501,84 +416,30 @@ def calculate_rewriter_metrics(raw_data):
 # FEEDBACK METRICS
 # =============================================================================
 
-def calculate_feedback_metrics(feedback_data, categorize=True):
-    """Calculate feedback metrics and optionally categorize with AI."""
-    
-    if not feedback_data:
-        return {"error": "No feedback data"}
-    
-    total = len(feedback_data)
-    
-    # Count by type
-    thumbs_up = [f for f in feedback_data if f.get('feedbackType') == 'thumbsUp']
-    thumbs_down = [f for f in feedback_data if f.get('feedbackType') == 'thumbsDown']
-    
-    # Feedback over time (last 30 days)
-    now = datetime.now()
-    month_ago = now - timedelta(days=30)
-    
-    daily_feedback = defaultdict(lambda: {"positive": 0, "negative": 0})
-    for f in feedback_data:
-        ts = f.get('_ts', 0)
-        if ts:
-            feedback_time = datetime.fromtimestamp(ts)
-            if feedback_time >= month_ago:
-                day_key = feedback_time.strftime('%Y-%m-%d')
-                if f.get('feedbackType') == 'thumbsUp':
-                    daily_feedback[day_key]['positive'] += 1
-                else:
-                    daily_feedback[day_key]['negative'] += 1
-    
-    feedback_trend = [
-        {"date": d, "positive": v['positive'], "negative": v['negative']} 
-        for d, v in sorted(daily_feedback.items())
-    ]
+def ingest_feedback(rollups, feedback_data, categorize=True):
+    """Add new feedback to the rollups, categorizing only documents not seen before."""
+    new_feedback = rollups.new_documents('feedback', feedback_data)
     
     # Categorize feedback with AI (optional - can be slow)
-    if categorize:
-        print("Categorizing feedback with AI (this may take a moment)...")
-        feedback_data = categorize_feedback_with_ai(feedback_data)
-    
-    # Category breakdown
-    category_counts = defaultdict(int)
-    for f in feedback_data:
-        cat = f.get('category', 'Uncategorized')
-        category_counts[cat] += 1
-    
-    category_breakdown = [{"category": k, "count": v} for k, v in sorted(category_counts.items(), key=lambda x: -x[1])]
-    
-    # Build feedback items list
-    feedback_items = []
-    for f in feedback_data:
-        feedback_items.append({
-            "id": f.get('id', '')[:12],
-            "timestamp": f.get('timestamp', ''),
-            "userName": f.get('userName', 'Anonymous'),
-            "feedbackType": f.get('feedbackType', 'unknown'),
-            "comment": f.get('comment', ''),
-            "category": f.get('category', 'Uncategorized'),
-            "conversationId": f.get('conversationId', '')[:12]
-        })
+    if categorize and new_feedback:
+        print(f"Categorizing {len(new_feedback)} new feedback items with AI...")
+        new_feedback = categorize_feedback_with_ai(new_feedback)
     
-    # Sort by timestamp descending
-    feedback_items.sort(key=lambda x: x['timestamp'], reverse=True)
+    return rollups.ingest_feedback(new_feedback)
+
+
+def calculate_feedback_metrics(rollups, categorize=True):
+    """Calculate feedback metrics from the daily rollups."""
+    metrics = rollups.feedback_metrics()
+    if not metrics["summary"]["total"]:
+        return {"error": "No feedback data"}
     
-    return {
-        "summary": {
-            "total": total,
-            "thumbsUp": len(thumbs_up),
-            "thumbsDown": len(thumbs_down),
-            "positiveRate": round(len(thumbs_up) / total * 100, 1) if total > 0 else 0
-        },
-        "trend": feedback_trend,
-        "categoryBreakdown": category_breakdown,
-        "feedbackItems": feedback_items[:100],  # Limit to 100 for UI
-        "metadata": {
-            "generatedAt": datetime.now().isoformat(),
-            "dataSource": "production",
-            "aiCategorized": categorize
-        }
+    metrics["metadata"] = {
+        "generatedAt": datetime.now().isoformat(),
+        "dataSource": "production",
+        "aiCategorized": categorize
     }
+    return metrics
 
 
 # =============================================================================
@@ -598,6 +459,9 @@ def main():
     if not os.path.exists(src_dir):
         os.makedirs(src_dir)
     
+    # Daily rollups: adoption/feedback are fetched incrementally from the last watermark
+    rollups = RollupStore(os.getenv('NEXUS_ROLLUP_PATH') or os.path.join(src_dir, 'rollups.json'))
+    
     # -------------------------------------------------------------------------
     # 1. QUERY REWRITER METRICS (from Staging)
     # -------------------------------------------------------------------------
@@ -637,10 +501,14 @@ def main():
     
     try:
         container_prod = connect_to_cosmos_prod()
-        raw_adoption_data = fetch_all_queries_for_adoption(container_prod)
+        raw_adoption_data = fetch_all_queries_for_adoption(
+            container_prod, since_ts=rollups.watermark('adoption'))
         
-        # Calculate metrics
-        adoption_metrics = calculate_adoption_metrics(raw_adoption_data)
+        # Update rollups, then calculate metrics from them
+        added = rollups.ingest_adoption(raw_adoption_data)
+        rollups.save()
+        print(f"Added {added} new queries to daily rollups")
+        adoption_metrics = calculate_adoption_metrics(rollups)
         
         # Save to src/adoption.json
         output_path = os.path.join(src_dir, 'adoption.json')
@@ -661,10 +529,13 @@ def main():
     
     try:
         container_feedback = connect_to_cosmos_prod_feedback()
-        raw_feedback_data = fetch_feedback(container_feedback)
+        raw_feedback_data = fetch_feedback(container_feedback, since_ts=rollups.watermark('feedback'))
         
-        # Calculate metrics (set categorize=False for faster runs)
-        feedback_metrics = calculate_feedback_metrics(raw_feedback_data, categorize=True)
+        # Update rollups (set categorize=False for faster runs), then calculate metrics
+        added = ingest_feedback(rollups, raw_feedback_data, categorize=True)
+        rollups.save()
+        print(f"Added {added} new feedback items to daily rollups")
+        feedback_metrics = calculate_feedback_metrics(rollups, categorize=True)
         
         # Save to src/feedback.json
         output_path = os.path.join(src_dir, 'feedback.json')
@@ -25,16 +25,13 @@ class PerformanceMonitor:
         Returns:
             Result of function execution
         """
-        start = time.time()
+        start = time.perf_counter_ns()
         result = func(*args, **kwargs)
-        end = time.time()
+        latency_ms = (time.perf_counter_ns() - start) / 1e6
         
-        latency_ms = (end - start) * 1000
+        self.measurements.setdefault(operation, []).append(latency_ms)
         
-        if operation in self.measurements:
-            self.measurements[operation].append(latency_ms)
-        
-        return result, latency_ms
+        return result
     
     def get_statistics(self, operation: str = None) -> Dict:
         """
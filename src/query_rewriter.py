@@ -1,21 +1,48 @@
 import yaml
 import re
-from disambiguation_rules import Disambiguator
+import time
 
-# Create a global disambiguator instance
-_disambiguator = Disambiguator()
 
-def get_disambiguation_context(query):
-    return _disambiguator.get_disambiguation_context(query)
-from performance_monitor import PerformanceMonitor
-from telemetry_logger import TelemetryLogger
-import time
+class RewriterContext:
+    """
+    Disambiguator, performance monitor and telemetry logger, created on first use
+    
+    Importing this module does no file IO; pass a context to rewrite_query
+    to inject your own components.
+    """
+    
+    def __init__(self, disambiguator=None, monitor=None, telemetry=None):
+        self._disambiguator = disambiguator
+        self._monitor = monitor
+        self._telemetry = telemetry
+    
+    @property
+    def disambiguator(self):
+        if self._disambiguator is None:
+            from disambiguation_rules import Disambiguator
+            self._disambiguator = Disambiguator()
+        return self._disambiguator
+    
+    @property
+    def monitor(self):
+        if self._monitor is None:
+            from performance_monitor import PerformanceMonitor
+            self._monitor = PerformanceMonitor()
+        return self._monitor
+    
+    @property
+    def telemetry(self):
+        if self._telemetry is None:
+            from telemetry_logger import TelemetryLogger
+            self._telemetry = TelemetryLogger()
+        return self._telemetry
 
 
+# Default context used when callers don't pass one
+_context = RewriterContext()
 
-# Global performance monitor and telemetry logger
-_monitor = PerformanceMonitor()
-_telemetry = TelemetryLogger()
+def get_disambiguation_context(query, context=None):
+    return (context or _context).disambiguator.get_disambiguation_context(query)
 
 def load_lexicon(lexicon_path='data/ontology_runtime.json'):
     """Load the lexicon YAML file"""
@@ -26,11 +53,12 @@ def load_lexicon(lexicon_path='data/ontology_runtime.json'):
         print(f"Error: Lexicon file not found at {lexicon_path}")
         return {}
 
-def rewrite_query(user_input: str, lexicon_path='data/lexicon_v01_final.yaml', use_disambiguation=True, track_performance=False, log_telemetry=False, user_id='anonymous') -> dict:
+def rewrite_query(user_input: str, lexicon_path='data/lexicon_v01_final.yaml', use_disambiguation=True, track_performance=False, log_telemetry=False, user_id='anonymous', context=None) -> dict:
     """
     Expands user query with synonyms from lexicon
     """
-    start_time = time.time()
+    ctx = context or _context
+    start_ns = time.perf_counter_ns()
     
     lexicon = load_lexicon(lexicon_path)
     
@@ -49,7 +77,7 @@ def rewrite_query(user_input: str, lexicon_path='data/lexicon_v01_final.yaml', u
     # Get disambiguation context
     disambiguation_context = {}
     if use_disambiguation:
-        disambiguation_context = get_disambiguation_context(user_input)
+        disambiguation_context = get_disambiguation_context(user_input, ctx)
     
     # Check products section
     if 'products' in lexicon:
@@ -152,12 +180,11 @@ def rewrite_query(user_input: str, lexicon_path='data/lexicon_v01_final.yaml', u
                         })
     
     # Calculate total time
-    end_time = time.time()
-    total_time_ms = (end_time - start_time) * 1000
+    total_time_ms = (time.perf_counter_ns() - start_ns) / 1e6
     
     # Track performance if enabled
     if track_performance:
-        _monitor.measurements['query_rewrite'].append(total_time_ms)
+        ctx.monitor.measurements['query_rewrite'].append(total_time_ms)
     
   # Enforce maximum 8 expansions (Phase 2 requirement)
     if len(expanded_terms) > 8:
@@ -178,8 +205,8 @@ def rewrite_query(user_input: str, lexicon_path='data/lexicon_v01_final.yaml', u
     
     # Log telemetry if enabled
     if log_telemetry:
-        query_id = _telemetry.generate_query_id()
-        _telemetry.log_query(
+        query_id = ctx.telemetry.generate_query_id()
+        ctx.telemetry.log_query(
             query_id=query_id,
             user_id=user_id,
             original_query=user_input,
@@ -193,17 +220,17 @@ def rewrite_query(user_input: str, lexicon_path='data/lexicon_v01_final.yaml', u
 
 def get_performance_report():
     """Get performance statistics from monitor"""
-    return _monitor.get_statistics()
+    return _context.monitor.get_statistics()
 
 
 def print_performance_report():
     """Print formatted performance report"""
-    _monitor.print_report()
+    _context.monitor.print_report()
 
 
 def get_telemetry_statistics():
     """Get telemetry statistics"""
-    return _telemetry.get_statistics()
+    return _context.telemetry.get_statistics()
 
 
 if __name__ == "__main__":
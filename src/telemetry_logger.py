@@ -18,12 +18,13 @@ class TelemetryLogger:
     
     def __init__(self, storage_path='outputs/telemetry_logs.jsonl'):
         self.storage_path = storage_path
-        self._ensure_storage_exists()
     
     def _ensure_storage_exists(self):
-        """Create storage file if it doesn't exist"""
+        """Create the storage directory (called on first write, not at construction)"""
         import os
-        os.makedirs('outputs', exist_ok=True)
+        directory = os.path.dirname(self.storage_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
         
     def _hash_user_id(self, user_id: str) -> str:
         """Hash user ID for privacy (PII masking)"""
@@ -80,6 +81,7 @@ class TelemetryLogger:
         }
         
         # Write to JSONL file (one JSON object per line)
+        self._ensure_storage_exists()
         with open(self.storage_path, 'a') as f:
             f.write(json.dumps(log_entry) + '\n')
     